@@ -1,4 +1,5 @@
 import motor.motor_asyncio
+from pymongo import UpdateOne
 from config import BLACKBOX_MONGO_URI, BLACKBOX_DB
 from bson import ObjectId
 import logging
@@ -60,4 +61,23 @@ async def mark_channel_assigned(source_id, session_id):
             }
         }
     )
-    return result.modified_count > 0 
\ No newline at end of file
+    return result.modified_count > 0 
+
+async def mark_channels_assigned(assignments: dict):
+    """
+    Отметить несколько каналов как назначенные к сессиям одной пакетной записью
+    
+    Args:
+        assignments: session_id по ID источника
+    """
+    operations = [
+        UpdateOne(
+            {"_id": ObjectId(source_id) if isinstance(source_id, str) else source_id},
+            {"$set": {"session_id": session_id, "status": "assigned"}}
+        )
+        for source_id, session_id in assignments.items()
+    ]
+    if not operations:
+        return 0
+    result = await blackbox_db["sources"].bulk_write(operations, ordered=False)
+    return result.modified_count
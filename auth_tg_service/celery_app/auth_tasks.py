@@ -331,10 +331,17 @@ def confirm_password_task(phone_number: str, password: str, api_id: int, api_has
 @celery_app.task
 @monitor_performance
 def distribute_channels_task(channels: list):
-    """Распределяет каналы по аккаунтам с учётом лимитов. Если channels пустой — берёт их из sources (blackbox)."""
+    """
+    Распределяет каналы по аккаунтам с учётом лимитов и нагрузки. Если channels пустой — берёт их из sources (blackbox).
+    
+    Нагрузка сессии оценивается по задержке парсинга, FloodWait и объему постов ее каналов;
+    распределение считается в памяти и записывается пакетно.
+    """
     import asyncio
-    from storage import get_sessions, update_session, create_channel_binding
-    from blackbox_storage import get_all_channels, mark_channel_assigned
+    from storage import get_sessions, get_channel_post_rates, assign_channels_to_sessions, create_channel_bindings
+    from blackbox_storage import get_all_channels, mark_channels_assigned
+    from channel_balancer import balance_channels, channel_cost
+    from parsers.tg_parser import extract_channel_username
     
     # Проверяем, не выполняется ли уже задача
     task_key = "distribute_channels_running"
@@ -346,9 +353,6 @@ def distribute_channels_task(channels: list):
     redis_client.setex(task_key, 300, "1")  # 5 минут TTL
     
     async def inner():
-        # Импортируем get_session_by_id здесь, чтобы избежать UnboundLocalError
-        from storage import get_session_by_id
-        
         # Если channels пустой — берём из sources
         channels_to_distribute = channels
         sources_map = {}  # source_id -> channel (если из БД)
@@ -382,7 +386,7 @@ def distribute_channels_task(channels: list):
             distributed_channels.update(session.get('channels', []))
         
         # Фильтруем только нераспределенные каналы
-        new_channels = [ch for ch in channels_to_distribute if ch not in distributed_channels]
+        new_channels = list(dict.fromkeys(ch for ch in channels_to_distribute if ch not in distributed_channels))
         
         log.info(f"Всего каналов для распределения: {len(channels_to_distribute)}")
         log.info(f"Уже распределено: {len(distributed_channels)}")
@@ -396,67 +400,42 @@ def distribute_channels_task(channels: list):
                 'total_slots': sum(MAX_CHANNELS_PER_ACCOUNT - len(s.get('channels', [])) for s in sessions),
             }
         
-        session_slots = {
-            s['session_id']: MAX_CHANNELS_PER_ACCOUNT - len(s.get('channels', []))
-            for s in sessions
+        # Стоимость каналов по объему новых постов (для уже распределенных - тоже, для нагрузки)
+        known_channels = list(distributed_channels) + new_channels
+        post_rates = await get_channel_post_rates(
+            list({extract_channel_username(ch) for ch in known_channels})
+        )
+        channel_costs = {
+            ch: channel_cost(post_rates.get(extract_channel_username(ch), 0.0))
+            for ch in known_channels
         }
-        distributed = {s['session_id']: [] for s in sessions}
-        not_loaded = []
-        session_id_list = list(session_slots.keys())
-        idx = 0
         
-        for channel in new_channels:
-            placed = False
-            for _ in range(len(session_id_list)):
-                sid = session_id_list[idx % len(session_id_list)]
-                if session_slots[sid] > 0:
-                    await create_channel_binding({"session_id": sid, "chat_id": channel})
-                    
-                    # Получаем актуальные каналы из базы данных для этой сессии
-                    from storage import get_session_by_id
-                    try:
-                        # Пытаемся получить сессию по ID
-                        target_session = await get_session_by_id(sid)
-                        if target_session:
-                            current_channels = target_session.get('channels', [])
-                        else:
-                            # Если не удалось получить, начинаем с пустого списка
-                            current_channels = []
-                            log.warning(f"⚠️ Не удалось получить сессию {sid} из базы данных")
-                    except Exception as e:
-                        log.warning(f"⚠️ Ошибка при получении сессии {sid}: {e}")
-                        current_channels = []
-                    
-                    # Проверяем, нет ли уже такого канала
-                    if channel in current_channels:
-                        log.warning(f"⚠️ Канал {channel} уже существует в сессии {sid}, пропускаем")
-                        continue
-                    
-                    # Добавляем новый канал
-                    current_channels.append(channel)
-                    
-                    # Обновляем сессию в базе данных
-                    result = await update_session(sid, {"channels": current_channels})
-                    
-                    # Проверяем, что обновление прошло успешно
-                    if result.modified_count > 0:
-                        log.info(f"✅ Канал {channel} успешно добавлен в сессию {sid}")
-                    else:
-                        log.warning(f"⚠️ Канал {channel} не был добавлен в сессию {sid}")
-                    
-                    session_slots[sid] -= 1
-                    distributed[sid].append(channel)
-                    
-                    # Если канал из sources — обновляем статус
-                    if channel in sources_map:
-                        await mark_channel_assigned(sources_map[channel], sid)
-                    placed = True
-                    idx += 1
-                    break
-                idx += 1
-            if not placed:
-                not_loaded.append(channel)
+        distributed, not_loaded = balance_channels(sessions, new_channels, channel_costs)
         
+        # Применяем распределение пакетными записями
+        await assign_channels_to_sessions(distributed)
+        await create_channel_bindings([
+            {"session_id": sid, "chat_id": channel}
+            for sid, session_channels in distributed.items()
+            for channel in session_channels
+        ])
+        await mark_channels_assigned({
+            sources_map[channel]: sid
+            for sid, session_channels in distributed.items()
+            for channel in session_channels
+            if channel in sources_map
+        })
+        
+        for sid, session_channels in distributed.items():
+            if session_channels:
+                log.info(f"✅ Сессии {sid} назначено каналов: {len(session_channels)}")
+        if not_loaded:
+            log.warning(f"⚠️ Не хватило слотов для {len(not_loaded)} каналов")
+        
+        session_slots = {
+            s['session_id']: MAX_CHANNELS_PER_ACCOUNT - len(s.get('channels', [])) - len(distributed[s['session_id']])
+            for s in sessions
+        }
         total_slots = sum(session_slots.values())
         return {
             'distributed': distributed,
@@ -464,9 +443,73 @@ def distribute_channels_task(channels: list):
             'total_slots': total_slots,
         }
     
-    # Очищаем флаг выполнения
-    redis_client.delete(task_key)
-    return run_async(inner)
+    try:
+        return run_async(inner)
+    finally:
+        # Очищаем флаг выполнения
+        redis_client.delete(task_key)
+
+@celery_app.task
+@monitor_performance
+def rebalance_channels_task():
+    """
+    Перебалансирует уже распределенные каналы по сессиям (периодически, из beat)
+    
+    distribute_channels_task раскладывает только новые каналы, а задержка и FloodWait
+    сессий со временем меняются. Задача переносит ограниченное число каналов с
+    перегруженных сессий на менее нагруженные (см. rebalance_channels).
+    """
+    from storage import get_sessions, get_channel_post_rates, assign_channels_to_sessions, move_channel_bindings
+    from blackbox_storage import get_all_channels, mark_channels_assigned
+    from channel_balancer import rebalance_channels, channel_cost
+    from parsers.tg_parser import extract_channel_username
+    
+    # Распределение и перебалансировка меняют одни и те же списки каналов
+    task_key = "distribute_channels_running"
+    if redis_client.get(task_key):
+        log.warning("⚠️ Распределение каналов уже выполняется, перебалансировку пропускаем")
+        return {"status": "already_running", "message": "Задача уже выполняется"}
+    
+    redis_client.setex(task_key, 300, "1")  # 5 минут TTL
+    
+    async def inner():
+        sessions = [s for s in await get_sessions() if s.get('session_id')]
+        assigned_channels = [ch for s in sessions for ch in s.get('channels', [])]
+        if len(sessions) < 2 or not assigned_channels:
+            return {'status': 'success', 'moves': []}
+        
+        post_rates = await get_channel_post_rates(
+            list({extract_channel_username(ch) for ch in assigned_channels})
+        )
+        channel_costs = {
+            ch: channel_cost(post_rates.get(extract_channel_username(ch), 0.0))
+            for ch in assigned_channels
+        }
+        
+        changed, moves = rebalance_channels(sessions, channel_costs)
+        if not moves:
+            log.info("Нагрузка сессий сбалансирована, каналы не переносятся")
+            return {'status': 'success', 'moves': []}
+        
+        # Применяем перенос пакетными записями: списки каналов, привязки и источники blackbox
+        await assign_channels_to_sessions(changed, replace=True)
+        await move_channel_bindings(moves)
+        moved = {channel: target for channel, _, target in moves}
+        sources = await get_all_channels()
+        await mark_channels_assigned({
+            str(source["_id"]): moved[source["url"]]
+            for source in sources
+            if source.get("url") in moved
+        })
+        
+        for channel, source, target in moves:
+            log.info(f"🔀 Канал {channel} перенесен с сессии {source} на {target}")
+        return {'status': 'success', 'moves': [list(move) for move in moves]}
+    
+    try:
+        return run_async(inner)
+    finally:
+        redis_client.delete(task_key)
 
 @celery_app.task
 @monitor_performance
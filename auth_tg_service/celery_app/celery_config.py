@@ -55,6 +55,11 @@ worker_task_log_format = '[%(asctime)s: %(levelname)s/%(processName)s][%(task_na
 
 # Настройки расписания (опционально, для будущих периодических задач)
 beat_schedule = {
+    # Перенос каналов с перегруженных сессий (задержка и FloodWait меняются со временем)
+    'rebalance-channels': {
+        'task': 'celery_app.auth_tasks.rebalance_channels_task',
+        'schedule': crontab(minute=30, hour='*/6'),  # Каждые 6 часов
+    },
     # Пример: периодическая проверка статуса сессий
     # 'check-sessions-status': {
     #     'task': 'celery_app.tasks.check_sessions_status',
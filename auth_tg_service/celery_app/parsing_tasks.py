@@ -247,23 +247,27 @@ def parse_sources_task(limit: int = None, chat_id: str = None):
             total_tg = 0
             total_telegram_channels = 0  # Считаем реально парсящиеся каналы
             
+            assignments = {}
             for session in sessions:
                 session_phone = session.get("phone_number", "Unknown")
                 session_channels = session.get("channels", [])
                 if session_channels:
                     total_telegram_channels += len(session_channels)
                     log.info(f"🚀 Парсим для сессии {session_phone} с {len(session_channels)} каналами")
-                    cleaned_session_sources = clean_mongodb_data(session_channels)
-                    result = await parser.parse_telegram_sources_with_session(cleaned_session_sources, session_phone)
-                    session_total = sum(result.values()) if result else 0
-                    total_tg += session_total
-                    tg_results.append({
-                        "session_phone": session_phone,
-                        "sources": cleaned_session_sources,
-                        "parsed": session_total,
-                        "results": result
-                    })
-                    log.info(f"✅ Сессия {session_phone} завершена. Спаршено: {session_total}")
+                    assignments[session_phone] = clean_mongodb_data(session_channels)
+
+            # Все сессии парсят свои каналы параллельно
+            session_results = await parser.parse_telegram_sessions(assignments)
+            for session_phone, cleaned_session_sources in assignments.items():
+                result = session_results.get(session_phone, {})
+                session_total = sum(result.values()) if result else 0
+                total_tg += session_total
+                tg_results.append({
+                    "session_phone": session_phone,
+                    "sources": cleaned_session_sources,
+                    "parsed": session_total,
+                    "results": result
+                })
 
             execution_time = time.time() - start_time
 
@@ -368,23 +372,27 @@ def parse_telegram_sources_task(limit: int = 50, chat_id: str = None):
             total_tg = 0
             total_telegram_channels = 0  # Считаем реально парсящиеся каналы
             
+            assignments = {}
             for session in sessions:
                 session_phone = session.get("phone_number", "Unknown")
                 session_channels = session.get("channels", [])
                 if session_channels:
                     total_telegram_channels += len(session_channels)
                     log.info(f"🚀 Парсим для сессии {session_phone} с {len(session_channels)} каналами")
-                    cleaned_session_sources = clean_mongodb_data(session_channels)
-                    result = await parser.parse_telegram_sources_with_session(cleaned_session_sources, session_phone)
-                    session_total = sum(result.values()) if result else 0
-                    total_tg += session_total
-                    tg_results.append({
-                        "session_phone": session_phone,
-                        "sources": cleaned_session_sources,
-                        "parsed": session_total,
-                        "results": result
-                    })
-                    log.info(f"✅ Сессия {session_phone} завершена. Спаршено: {session_total}")
+                    assignments[session_phone] = clean_mongodb_data(session_channels)
+
+            # Все сессии парсят свои каналы параллельно
+            session_results = await parser.parse_telegram_sessions(assignments)
+            for session_phone, cleaned_session_sources in assignments.items():
+                result = session_results.get(session_phone, {})
+                session_total = sum(result.values()) if result else 0
+                total_tg += session_total
+                tg_results.append({
+                    "session_phone": session_phone,
+                    "sources": cleaned_session_sources,
+                    "parsed": session_total,
+                    "results": result
+                })
 
             execution_time = time.time() - start_time
 
@@ -1,9 +1,19 @@
 import asyncio
 import time
 import logging
+from parsers.tg_client_pool import close_client_pool
 
 log = logging.getLogger(__name__)
 
+def _close_loop(loop):
+    """Закрывает event loop, предварительно отключив привязанных к нему клиентов Telegram"""
+    try:
+        loop.run_until_complete(close_client_pool())
+    except Exception as e:
+        log.warning(f"Ошибка при отключении клиентов Telegram: {e}")
+    finally:
+        loop.close()
+
 def run_async(coro_func):
     """
     Универсальная функция для запуска async кода в Celery задачах.
@@ -19,7 +29,7 @@ def run_async(coro_func):
             try:
                 return loop.run_until_complete(coro_func())
             finally:
-                loop.close()
+                _close_loop(loop)
         else:
             # Если loop не запущен, используем его
             return loop.run_until_complete(coro_func())
@@ -30,7 +40,7 @@ def run_async(coro_func):
         try:
             return loop.run_until_complete(coro_func())
         finally:
-            loop.close()
+            _close_loop(loop)
 
 def monitor_performance(func):
     """
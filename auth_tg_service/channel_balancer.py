@@ -0,0 +1,152 @@
+import os
+import statistics
+from typing import Dict, List, Tuple
+from config import MAX_CHANNELS_PER_ACCOUNT
+
+# Насколько один новый пост за запуск увеличивает стоимость канала (базовая стоимость - 1)
+CHANNEL_POST_WEIGHT = float(os.getenv("CHANNEL_POST_WEIGHT", "0.05"))
+# Столько секунд FloodWait за запуск удваивают нагрузку, приходящуюся на сессию
+FLOOD_WAIT_PENALTY_SECONDS = float(os.getenv("FLOOD_WAIT_PENALTY_SECONDS", "300"))
+# Максимум каналов, переносимых между сессиями за одну перебалансировку
+REBALANCE_MAX_MOVES = int(os.getenv("REBALANCE_MAX_MOVES", "20"))
+# Во сколько раз нагрузка сессии может превышать минимальную без перебалансировки (0.25 - на 25%)
+REBALANCE_TOLERANCE = float(os.getenv("REBALANCE_TOLERANCE", "0.25"))
+
+def channel_cost(post_rate: float) -> float:
+    """Стоимость парсинга канала по среднему количеству новых постов за запуск"""
+    return 1.0 + CHANNEL_POST_WEIGHT * post_rate
+
+def session_factors(sessions: List[dict]) -> Dict[str, float]:
+    """
+    Коэффициенты нагрузки сессий: во сколько раз канал на этой сессии "дороже" среднего
+
+    Учитываются средняя задержка парсинга канала (относительно медианы по сессиям)
+    и FloodWait. Сессии без статистики считаются средними.
+
+    Args:
+        sessions: Сессии с необязательным полем parse_stats
+
+    Returns:
+        Dict[str, float]: Коэффициент по session_id
+    """
+    latencies = [
+        s['parse_stats']['avg_latency'] for s in sessions
+        if s.get('parse_stats', {}).get('avg_latency')
+    ]
+    median_latency = statistics.median(latencies) if latencies else None
+
+    factors = {}
+    for session in sessions:
+        stats = session.get('parse_stats', {})
+        latency = stats.get('avg_latency')
+        speed_factor = latency / median_latency if latency and median_latency else 1.0
+        flood_factor = 1.0 + stats.get('flood_wait_seconds', 0) / FLOOD_WAIT_PENALTY_SECONDS
+        factors[session['session_id']] = speed_factor * flood_factor
+    return factors
+
+def balance_channels(
+    sessions: List[dict],
+    channels: List[str],
+    channel_costs: Dict[str, float],
+    max_channels: int = MAX_CHANNELS_PER_ACCOUNT
+) -> Tuple[Dict[str, List[str]], List[str]]:
+    """
+    Распределяет каналы по сессиям с учетом нагрузки
+
+    Каналы раскладываются от самых дорогих к дешевым; каждый достается сессии,
+    у которой взвешенная нагрузка после добавления будет минимальной. Уже
+    назначенные сессиям каналы учитываются в нагрузке и лимите.
+
+    Args:
+        sessions: Сессии (session_id, channels, parse_stats)
+        channels: Каналы для распределения
+        channel_costs: Стоимость по каналам (по умолчанию 1)
+        max_channels: Максимум каналов на сессию
+
+    Returns:
+        Tuple[Dict[str, List[str]], List[str]]: Новые каналы по session_id и каналы без места
+    """
+    factors = session_factors(sessions)
+    loads = {
+        s['session_id']: sum(channel_costs.get(ch, 1.0) for ch in s.get('channels', []))
+        for s in sessions
+    }
+    slots = {s['session_id']: max_channels - len(s.get('channels', [])) for s in sessions}
+    assignment = {s['session_id']: [] for s in sessions}
+    not_loaded = []
+
+    for channel in sorted(channels, key=lambda ch: channel_costs.get(ch, 1.0), reverse=True):
+        cost = channel_costs.get(channel, 1.0)
+        candidates = [sid for sid, free in slots.items() if free > 0]
+        if not candidates:
+            not_loaded.append(channel)
+            continue
+
+        target = min(candidates, key=lambda sid: (loads[sid] + cost) * factors[sid])
+        assignment[target].append(channel)
+        loads[target] += cost
+        slots[target] -= 1
+
+    return assignment, not_loaded
+
+def rebalance_channels(
+    sessions: List[dict],
+    channel_costs: Dict[str, float],
+    max_moves: int = REBALANCE_MAX_MOVES,
+    tolerance: float = REBALANCE_TOLERANCE,
+    max_channels: int = MAX_CHANNELS_PER_ACCOUNT
+) -> Tuple[Dict[str, List[str]], List[Tuple[str, str, str]]]:
+    """
+    Переносит уже назначенные каналы с перегруженных сессий на менее нагруженные
+
+    Нагрузка сессии - сумма стоимостей ее каналов, умноженная на коэффициент
+    сессии (задержка и FloodWait, см. session_factors). За шаг один канал
+    переносится с самой нагруженной сессии на наименее нагруженную со
+    свободным слотом, если перенос уменьшает максимум их нагрузок. Перенос
+    сбрасывает отметку парсинга канала на новой сессии, поэтому переносов за
+    запуск не больше max_moves, а разница в пределах tolerance не исправляется.
+
+    Args:
+        sessions: Сессии (session_id, channels, parse_stats)
+        channel_costs: Стоимость по каналам (по умолчанию 1)
+        max_moves: Максимум переносов за запуск
+        tolerance: Допустимое превышение нагрузки над минимальной (0.25 - на 25%)
+        max_channels: Максимум каналов на сессию
+
+    Returns:
+        Tuple[Dict[str, List[str]], List[Tuple[str, str, str]]]: Новые списки каналов
+            измененных сессий по session_id и переносы (канал, откуда, куда)
+    """
+    factors = session_factors(sessions)
+    channels = {s['session_id']: list(s.get('channels', [])) for s in sessions}
+    loads = {sid: sum(channel_costs.get(ch, 1.0) for ch in chs) for sid, chs in channels.items()}
+    moves = []
+
+    while len(moves) < max_moves and len(channels) > 1:
+        weighted = {sid: loads[sid] * factors[sid] for sid in channels}
+        source = max(weighted, key=weighted.get)
+        targets = [sid for sid in channels if sid != source and len(channels[sid]) < max_channels]
+        if not targets:
+            break
+        target = min(targets, key=weighted.get)
+        if weighted[source] <= weighted[target] * (1 + tolerance):
+            break
+
+        # Канал, после переноса которого большая из двух нагрузок минимальна
+        def peak_after(channel: str) -> float:
+            cost = channel_costs.get(channel, 1.0)
+            return max((loads[source] - cost) * factors[source], (loads[target] + cost) * factors[target])
+
+        channel = min(channels[source], key=peak_after, default=None)
+        if channel is None or peak_after(channel) >= weighted[source]:
+            break
+
+        cost = channel_costs.get(channel, 1.0)
+        channels[source].remove(channel)
+        channels[target].append(channel)
+        loads[source] -= cost
+        loads[target] += cost
+        moves.append((channel, source, target))
+
+    changed = {sid for _, source, target in moves for sid in (source, target)}
+    return {sid: channels[sid] for sid in changed}, moves
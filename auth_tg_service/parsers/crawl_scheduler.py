@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import os
+import time
+from collections import defaultdict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Tuple
+from urllib.parse import urlparse
+
+log = logging.getLogger(__name__)
+
+# Общее количество лент, загружаемых одновременно
+RSS_CRAWL_CONCURRENCY = int(os.getenv("RSS_CRAWL_CONCURRENCY", "20"))
+# Количество одновременных запросов к одному домену
+RSS_PER_DOMAIN_CONCURRENCY = int(os.getenv("RSS_PER_DOMAIN_CONCURRENCY", "2"))
+# Минимальная пауза между началом запросов к одному домену (секунды)
+RSS_PER_DOMAIN_DELAY = float(os.getenv("RSS_PER_DOMAIN_DELAY", "1.0"))
+
+def get_domain(url: str) -> str:
+    """Домен ленты, по которому ограничивается нагрузка"""
+    return (urlparse(url).hostname or url).lower()
+
+class RssCrawlScheduler:
+    """
+    Планировщик обхода RSS-лент с ограничением конкурентности
+
+    Одновременно загружается не больше max_concurrency лент, к одному домену -
+    не больше per_domain_concurrency запросов с паузой per_domain_delay между ними.
+    Ленты берутся по приоритету (чаще обновляющиеся - раньше); если домен ленты
+    занят, слот получает следующая лента другого домена, поэтому медленный хост
+    не задерживает остальные.
+    """
+
+    def __init__(self, crawl: Callable[[Dict[str, Any]], Awaitable[Any]],
+                 max_concurrency: int = RSS_CRAWL_CONCURRENCY,
+                 per_domain_concurrency: int = RSS_PER_DOMAIN_CONCURRENCY,
+                 per_domain_delay: float = RSS_PER_DOMAIN_DELAY):
+        """
+        Args:
+            crawl: Корутина обработки одной ленты (получает словарь ленты с ключом url)
+            max_concurrency: Общий лимит одновременных загрузок
+            per_domain_concurrency: Лимит одновременных загрузок с одного домена
+            per_domain_delay: Пауза между началом загрузок с одного домена
+        """
+        self.crawl = crawl
+        self.max_concurrency = max_concurrency
+        self.per_domain_concurrency = per_domain_concurrency
+        self.per_domain_delay = per_domain_delay
+
+    async def run(self, feeds: List[Dict[str, Any]]) -> AsyncIterator[Tuple[Dict[str, Any], Any]]:
+        """
+        Обходит ленты и отдает результаты по мере завершения
+
+        Args:
+            feeds: Ленты (словари с ключами url и priority; больший priority - раньше)
+
+        Yields:
+            Tuple[Dict, Any]: Лента и результат crawl (или исключение)
+        """
+        pending = sorted(feeds, key=lambda feed: feed.get('priority', 0), reverse=True)
+        active = defaultdict(int)
+        next_start = defaultdict(float)
+        running = {}
+
+        try:
+            while pending or running:
+                now = time.monotonic()
+
+                # Запускаем самые приоритетные ленты, чьи домены сейчас свободны
+                index = 0
+                while len(running) < self.max_concurrency and index < len(pending):
+                    domain = get_domain(pending[index]['url'])
+                    if active[domain] < self.per_domain_concurrency and next_start[domain] <= now:
+                        feed = pending.pop(index)
+                        active[domain] += 1
+                        next_start[domain] = now + self.per_domain_delay
+                        running[asyncio.create_task(self.crawl(feed))] = (feed, domain)
+                    else:
+                        index += 1
+
+                # Ближайший момент, когда освободится пауза домена одной из ожидающих лент
+                delays = [
+                    next_start[get_domain(feed['url'])] - now
+                    for feed in pending
+                    if active[get_domain(feed['url'])] < self.per_domain_concurrency
+                ]
+                timeout = max(min(delays), 0.01) if delays else None
+
+                if not running:
+                    await asyncio.sleep(timeout or 0.01)
+                    continue
+
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    feed, domain = running.pop(task)
+                    active[domain] -= 1
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        result = e
+                    yield feed, result
+        finally:
+            # Если обход прерван, незавершенные загрузки отменяются
+            for task in running:
+                task.cancel()
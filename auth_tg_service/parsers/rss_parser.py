@@ -2,29 +2,177 @@ import aiohttp
 import asyncio
 import feedparser
 import logging
-from .utils import retry_on_failure, decode_if_bytes, save_parsed_data
+import os
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import NamedTuple, Optional
+from .utils import retry_on_failure, decode_if_bytes, generate_hash, ParsedDataWriter
+from storage import get_feed_state, save_feed_state
 
 log = logging.getLogger(__name__)
 
-async def fetch_rss_content(url, headers):
-    """Получает содержимое RSS-ленты с таймаутами"""
+# Ограничения пула соединений краулера: всего и на один хост
+RSS_MAX_CONNECTIONS = int(os.getenv("RSS_MAX_CONNECTIONS", "100"))
+RSS_MAX_CONNECTIONS_PER_HOST = int(os.getenv("RSS_MAX_CONNECTIONS_PER_HOST", "4"))
+# Время жизни DNS-кэша в секундах
+RSS_DNS_CACHE_TTL = int(os.getenv("RSS_DNS_CACHE_TTL", "600"))
+# Вес последней проверки в скользящей оценке частоты обновления ленты
+RSS_UPDATE_RATE_ALPHA = 0.3
+# Количество потоков для разбора лент в одном процессе воркера и максимум лент, ожидающих разбора.
+# Задачи выполняются в prefork-пуле Celery: его дочерние процессы демонические и не могут
+# запускать свои процессы, поэтому разбор идет в потоках, а параллельность по CPU дают
+# сами процессы воркера (worker_concurrency). Пул потоков только освобождает event loop
+RSS_PARSE_WORKERS = int(os.getenv("RSS_PARSE_WORKERS", "2"))
+RSS_PARSE_QUEUE_SIZE = int(os.getenv("RSS_PARSE_QUEUE_SIZE", str(RSS_PARSE_WORKERS * 2)))
+
+# Пул потоков создается лениво, один на процесс воркера
+_parse_pool: Optional[ThreadPoolExecutor] = None
+# Очередь разбора ограничивается семафором; семафор свой у каждого event loop
+_parse_slots = weakref.WeakKeyDictionary()
+
+class RssResponse(NamedTuple):
+    """Ответ сервера RSS-ленты"""
+    status: int
+    content: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+
+def create_rss_session() -> aiohttp.ClientSession:
+    """
+    Создает общую для краулера HTTP-сессию
+    
+    Соединения переиспользуются между лентами (keep-alive), количество соединений
+    на один хост ограничено, DNS-ответы кэшируются.
+    """
+    connector = aiohttp.TCPConnector(
+        limit=RSS_MAX_CONNECTIONS,
+        limit_per_host=RSS_MAX_CONNECTIONS_PER_HOST,
+        ttl_dns_cache=RSS_DNS_CACHE_TTL,
+        use_dns_cache=True
+    )
     timeout = aiohttp.ClientTimeout(total=30, connect=10, sock_read=20)
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        async with session.get(url, headers=headers) as response:
-            return await response.text()
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+def estimate_update_rate(state: dict, changed: bool) -> float:
+    """
+    Скользящая оценка доли проверок, на которых лента оказалась обновленной
+    
+    Args:
+        state: Сохраненное состояние ленты (у новой ленты оценка считается равной 1)
+        changed: Изменилась ли лента при текущей проверке
+    
+    Returns:
+        float: Оценка от 0 до 1
+    """
+    previous = state.get('update_rate', 1.0)
+    return previous * (1 - RSS_UPDATE_RATE_ALPHA) + (RSS_UPDATE_RATE_ALPHA if changed else 0.0)
+
+def parse_feed_content(content: str) -> dict:
+    """
+    Разбирает RSS-ленту и возвращает только нормализованные поля записей
+    
+    Выполняется в пуле потоков; результат - простые словари без объектов
+    feedparser, чтобы не держать в памяти разобранное дерево ленты.
+    
+    Args:
+        content: Текст ленты
+    
+    Returns:
+        dict: Записи (url, title, description, content, date) и сведения о ленте
+    """
+    feed = feedparser.parse(content)
+    entries = []
+    for entry in feed.entries:
+        link = entry.get('link')
+        if not link:
+            continue
+        entries.append({
+            "url": decode_if_bytes(link),
+            "title": decode_if_bytes(entry.get('title', '')),
+            "description": decode_if_bytes(entry.get('description', '')),
+            "content": decode_if_bytes(entry.get('content', [{}])[0].get('value', '')) if 'content' in entry else '',
+            "date": entry.get('published', '')
+        })
+    
+    bozo_exception = feed.get('bozo_exception')
+    return {
+        "entries": entries,
+        "non_xml": bool(feed.bozo) and isinstance(bozo_exception, feedparser.NonXMLContentType),
+        "bozo_exception": f"{type(bozo_exception).__name__}: {bozo_exception}" if bozo_exception else None,
+        "version": feed.get('version'),
+        "encoding": feed.get('encoding'),
+        "title": feed.feed.get('title'),
+        "description": feed.feed.get('description')
+    }
+
+def _get_parse_pool() -> ThreadPoolExecutor:
+    """Пул потоков для разбора лент (отдельный от пула event loop по умолчанию)"""
+    global _parse_pool
+    if _parse_pool is None:
+        _parse_pool = ThreadPoolExecutor(max_workers=RSS_PARSE_WORKERS, thread_name_prefix="rss-parse")
+    return _parse_pool
 
-async def parse_rss(url: str, category: str, parsed_data_collection, verbose=False):
+async def parse_feed_async(content: str) -> dict:
+    """
+    Разбор ленты в пуле потоков с ограниченной очередью, чтобы не блокировать event loop
+    """
+    loop = asyncio.get_running_loop()
+    slots = _parse_slots.get(loop)
+    if slots is None:
+        slots = _parse_slots[loop] = asyncio.Semaphore(RSS_PARSE_QUEUE_SIZE)
+    
+    async with slots:
+        return await loop.run_in_executor(_get_parse_pool(), parse_feed_content, content)
+
+async def fetch_rss_content(url, headers, session: aiohttp.ClientSession = None) -> RssResponse:
+    """
+    Получает содержимое RSS-ленты с таймаутами
+    
+    Args:
+        url: URL RSS ленты
+        headers: Заголовки запроса (в том числе условные If-None-Match / If-Modified-Since)
+        session: Общая HTTP-сессия краулера; если не передана, создается временная
+    
+    Returns:
+        RssResponse: Статус, текст (пустой при 304) и валидаторы кэша ответа
+    """
+    if session is None:
+        async with create_rss_session() as own_session:
+            return await fetch_rss_content(url, headers, own_session)
+    
+    async with session.get(url, headers=headers) as response:
+        content = "" if response.status == 304 else await response.text()
+        return RssResponse(
+            status=response.status,
+            content=content,
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified")
+        )
+
+async def parse_rss(url: str, category: str, parsed_data_collection, verbose=False, writer: ParsedDataWriter = None,
+                    session: aiohttp.ClientSession = None, feed_states: dict = None):
     """
     Парсит RSS ленту и сохраняет данные в MongoDB
     
+    Валидаторы ленты (etag, last_modified, хэш содержимого) сохраняются только
+    после записи ее записей: иначе после неудачной записи следующий запуск
+    получит 304 и потеряет записи. С общим писателем запись происходит позже,
+    поэтому состояние ленты передается вызывающему коду через feed_states.
+    
     Args:
         url: URL RSS ленты
         category: Категория для спарсенных данных
         parsed_data_collection: MongoDB коллекция для сохранения данных
         verbose: Подробный вывод для отладки
+        writer: Общий буферизованный писатель; если не передан, создается свой
+        session: Общая HTTP-сессия краулера; если не передана, создается временная
+        feed_states: Для общего писателя - словарь, куда кладется состояние ленты (по url),
+            которое нужно сохранить после writer.flush()
     
     Returns:
-        int: Количество спарсенных записей или None при ошибке
+        int: Количество сохраненных записей (с общим писателем - переданных на запись),
+            0 если лента не изменилась, или None при ошибке
     """
     log.info(f"Начало парсинга RSS: {url}")
     try:
@@ -33,61 +181,110 @@ async def parse_rss(url: str, category: str, parsed_data_collection, verbose=Fal
             'Accept': 'application/rss+xml, text/xml;q=0.9, */*;q=0.8'
         }
         
+        # Условный запрос: неизменившаяся лента вернет 304 без тела
+        state = await get_feed_state(url) or {}
+        if state.get('etag'):
+            headers['If-None-Match'] = state['etag']
+        if state.get('last_modified'):
+            headers['If-Modified-Since'] = state['last_modified']
+        
         # Используем механизм повторных запросов с уменьшенными таймаутами
-        content = await retry_on_failure(fetch_rss_content, url, headers, max_retries=2, delay=2)
-        feed = feedparser.parse(content)
+        response = await retry_on_failure(fetch_rss_content, url, headers, session, max_retries=2, delay=2)
+        checked_at = datetime.utcnow()
+        
+        if response.status == 304:
+            log.info(f"RSS-лента не изменилась (304): {url}")
+            await save_feed_state(url, {
+                "checked_at": checked_at,
+                "update_rate": estimate_update_rate(state, changed=False)
+            })
+            return 0
+        
+        # Сервер без поддержки валидаторов: сравниваем хэш содержимого
+        content = response.content
+        content_hash = generate_hash(content)
+        if content_hash == state.get('content_hash'):
+            log.info(f"RSS-лента не изменилась (совпал хэш содержимого): {url}")
+            await save_feed_state(url, {
+                "checked_at": checked_at,
+                "update_rate": estimate_update_rate(state, changed=False)
+            })
+            return 0
+        
+        # Разбор ленты выполняется в пуле процессов, event loop не блокируется
+        feed = await parse_feed_async(content)
         
         if verbose:
             print("\n=== Отладочная информация ===")
-            print(f"Фактический URL: {getattr(feed, 'href', url)}")
-            print(f"Статус: {getattr(feed, 'status', 'N/A')}")
-            if hasattr(feed, 'bozo_exception') and feed.bozo_exception:
-                print(f"Ошибка парсера: {type(feed.bozo_exception).__name__}: {feed.bozo_exception}")
-            print(f"Content-Type: {feed.headers.get('content-type', 'N/A')}")
-            print(f"Версия: {getattr(feed, 'version', 'N/A')}")
-            print(f"Кодировка: {getattr(feed, 'encoding', 'N/A')}")
-            print(f"Заголовок канала: {feed.feed.get('title', 'N/A')}")
-            print(f"Описание канала: {feed.feed.get('description', 'N/A')}")
-            print(f"Всего записей: {len(feed.entries)}")
-            if len(feed.entries) > 0:
+            print(f"Фактический URL: {url}")
+            print(f"Статус: {response.status}")
+            if feed['bozo_exception']:
+                print(f"Ошибка парсера: {feed['bozo_exception']}")
+            print(f"Версия: {feed['version'] or 'N/A'}")
+            print(f"Кодировка: {feed['encoding'] or 'N/A'}")
+            print(f"Заголовок канала: {feed['title'] or 'N/A'}")
+            print(f"Описание канала: {feed['description'] or 'N/A'}")
+            print(f"Всего записей: {len(feed['entries'])}")
+            if feed['entries']:
                 print("\nПример первой записи:")
-                first_entry = feed.entries[0]
-                print(f"Заголовок: {first_entry.get('title', 'N/A')}")
-                print(f"Ссылка: {first_entry.get('link', 'N/A')}")
-                print(f"Дата публикации: {first_entry.get('published', 'N/A')}")
-                print(f"Доступные поля: {list(first_entry.keys())}")
+                first_entry = feed['entries'][0]
+                print(f"Заголовок: {first_entry['title'] or 'N/A'}")
+                print(f"Ссылка: {first_entry['url']}")
+                print(f"Дата публикации: {first_entry['date'] or 'N/A'}")
             print("===========================\n")
             
-        if feed.bozo and isinstance(feed.bozo_exception, feedparser.NonXMLContentType):
-            log.error(f"Сервер вернул не XML (RSS) контент: {feed.headers.get('content-type', 'N/A')}")
+        if feed['non_xml']:
+            log.error(f"Сервер вернул не XML (RSS) контент: {url}")
             if verbose:
                 print("Сырой ответ сервера:")
                 print(f"Первые 200 символов:\n{content[:200]}")
             return None
             
-        if not feed.entries:
+        if not feed['entries']:
             log.warning("RSS-лента не содержит записей")
             return None
         
-        saved_count = 0
-        for entry in feed.entries:
+        # Валидаторы сохраняются только для успешно разобранной и записанной ленты
+        feed_state = None
+        if response.status == 200:
+            feed_state = {
+                "etag": response.etag,
+                "last_modified": response.last_modified,
+                "content_hash": content_hash,
+                "checked_at": checked_at,
+                "changed_at": checked_at,
+                "update_rate": estimate_update_rate(state, changed=True)
+            }
+        
+        own_writer = writer is None
+        if own_writer:
+            writer = ParsedDataWriter(parsed_data_collection)
+        
+        queued_count = 0
+        for entry in feed['entries']:
             data = {
-                "url": decode_if_bytes(entry.link),
-                "title": decode_if_bytes(entry.get('title', '')),
-                "description": decode_if_bytes(entry.get('description', '')),
-                "content": decode_if_bytes(entry.get('content', [{}])[0].get('value', '')) if hasattr(entry, 'content') else '',
-                "date": entry.get('published', ''),
+                **entry,
                 "category": category,
                 "source_type": "rss",
                 "source_url": url
             }
             
-            if await save_parsed_data(data, parsed_data_collection):
-                saved_count += 1
-                print(f"📄 RSS: {data['title'][:100]}... | {data['url']}")
-            
-        log.info(f"✅ Успешно спаршено {saved_count} записей из {url}")
-        return saved_count
+            await writer.add(data)
+            queued_count += 1
+        
+        if not own_writer:
+            if feed_state is not None and feed_states is not None:
+                feed_states[url] = feed_state
+            log.info(f"✅ Из {url} передано на запись {queued_count} записей")
+            return queued_count
+        
+        await writer.flush()
+        if writer.failed:
+            log.warning(f"⚠️ Не все записи {url} сохранены, состояние ленты не обновляется")
+        elif feed_state is not None:
+            await save_feed_state(url, feed_state)
+        log.info(f"✅ Успешно спаршено {writer.inserted} записей из {url} (дубликатов: {writer.duplicates})")
+        return writer.inserted
     except Exception as e:
         log.error(f"❌ Ошибка при парсинге RSS ({url}): {str(e)}")
         return None
@@ -1,12 +1,15 @@
 import asyncio
 import logging
 from typing import List, Dict, Any
-from .rss_parser import parse_rss
+from .rss_parser import parse_rss, create_rss_session
 from .tg_parser import parse_tg_channel_distributed
-from storage import get_sessions
+from storage import get_sessions, get_feed_states, save_feed_state, get_channel_sessions, record_session_parse_stats
 from blackbox_storage import get_new_channels
 import os
-from .tg_parser import parse_tg_channel_with_session
+from .tg_parser import parse_tg_channel_with_session, extract_channel_username
+from .utils import ParsedDataWriter
+from .crawl_scheduler import RssCrawlScheduler
+from .tg_scheduler import TelegramParseScheduler
 
 log = logging.getLogger(__name__)
 
@@ -103,7 +106,10 @@ class SourceParser:
     
     async def parse_rss_sources(self, rss_sources: List[Dict[str, Any]]) -> Dict[str, int]:
         """
-        Парсит RSS источники параллельно
+        Парсит RSS источники с ограничением конкурентности (общим и на домен)
+        
+        Ленты обходятся в порядке наблюдаемой частоты обновления, записи каждой
+        ленты передаются в общий пакетный писатель сразу после ее загрузки.
         
         Args:
             rss_sources: Список RSS источников
@@ -114,7 +120,11 @@ class SourceParser:
         log.info(f"Начинаем парсинг {len(rss_sources)} RSS источников")
         
         results = {}
-        tasks = []
+        feeds = []
+        # Записи всех лент сохраняются общими пакетами
+        writer = ParsedDataWriter(self.parsed_data_collection)
+        # Состояния изменившихся лент сохраняются только после записи их записей
+        feed_states = {}
         
         for source in rss_sources:
             url = source.get('url')
@@ -122,52 +132,181 @@ class SourceParser:
             
             if not url:
                 continue
-                
-            task = parse_rss(
-                url=url,
-                category=category,
-                parsed_data_collection=self.parsed_data_collection,
-                verbose=False
-            )
-            tasks.append((url, task))
+            
+            feeds.append({"url": url, "category": category})
         
-        # Выполняем задачи параллельно
-        if tasks:
-            urls, coroutines = zip(*tasks)
-            results_list = await asyncio.gather(*coroutines, return_exceptions=True)
+        if feeds:
+            # Приоритет - оценка частоты обновления; новые ленты обходятся первыми
+            try:
+                states = await get_feed_states([feed["url"] for feed in feeds])
+            except Exception as e:
+                log.warning(f"Не удалось получить состояния RSS-лент: {e}")
+                states = {}
+            for feed in feeds:
+                feed["priority"] = states.get(feed["url"], {}).get("update_rate", 1.0)
             
-            for url, result in zip(urls, results_list):
-                if isinstance(result, Exception):
-                    log.error(f"❌ Ошибка при парсинге RSS {url}: {result}")
-                    results[url] = None
-                else:
-                    results[url] = result
+            async with create_rss_session() as session:
+                scheduler = RssCrawlScheduler(
+                    lambda feed: parse_rss(
+                        url=feed["url"],
+                        category=feed["category"],
+                        parsed_data_collection=self.parsed_data_collection,
+                        verbose=False,
+                        writer=writer,
+                        session=session,
+                        feed_states=feed_states
+                    )
+                )
+                
+                async for feed, result in scheduler.run(feeds):
+                    url = feed["url"]
+                    if isinstance(result, Exception):
+                        log.error(f"❌ Ошибка при парсинге RSS {url}: {result}")
+                        results[url] = None
+                    else:
+                        results[url] = result
+                    log.info(f"RSS: обработано {len(results)}/{len(feeds)} лент")
+        
+        # Дописываем остаток буфера и заменяем количество переданных записей на вставленные
+        write_stats = await writer.flush()
+        for url, result in results.items():
+            if result is not None:
+                results[url] = writer.inserted_for(url)
+        
+        for url, state in feed_states.items():
+            if writer.failed_for(url):
+                # Лента будет загружена и разобрана заново при следующем запуске
+                log.warning(f"⚠️ Не все записи {url} сохранены, состояние ленты не обновляется")
+                continue
+            try:
+                await save_feed_state(url, state)
+            except Exception as e:
+                log.warning(f"Не удалось сохранить состояние RSS-ленты {url}: {e}")
         
         total_saved = sum(r for r in results.values() if r is not None)
-        log.info(f"✅ RSS парсинг завершен. Всего спаршено: {total_saved}")
+        log.info(f"✅ RSS парсинг завершен. Всего спаршено: {total_saved} (дубликатов: {write_stats['duplicates']})")
+        
+        return results
+
+    @staticmethod
+    def normalize_telegram_source(source) -> Dict[str, Any]:
+        """
+        Приводит Telegram источник к виду {url, category}
+        
+        Args:
+            source: Строка (URL канала) или словарь источника
+            
+        Returns:
+            Dict: Источник или None, если URL не удалось получить
+        """
+        if isinstance(source, str):
+            source_url, category = source, 'general'
+        elif isinstance(source, dict):
+            source_url, category = source.get('url', ''), source.get('category', 'general')
+        else:
+            log.warning(f"⚠️ Неизвестный тип источника: {type(source)}")
+            return None
+        
+        if not source_url:
+            log.warning(f"⚠️ Пустой URL источника: {source}")
+            return None
+        return {"url": source_url, "category": category}
+
+    async def parse_telegram_sessions(self, assignments: Dict[str, list]) -> Dict[str, Dict[str, int]]:
+        """
+        Парсит каналы всех сессий параллельно
+        
+        Каждая сессия разбирает свою очередь каналов; FloodWait приостанавливает
+        только ее, а оставшиеся каналы забирают освободившиеся сессии, которым эти
+        каналы доступны.
+        
+        Args:
+            assignments: Каналы (строки или словари) по номерам телефонов сессий
+            
+        Returns:
+            Dict: Результаты по сессиям и URL каналов
+        """
+        # Получаем API credentials
+        api_id = int(os.getenv("API_ID", "0"))
+        api_hash = os.getenv("API_HASH", "")
+        
+        if not api_id or not api_hash:
+            log.error("❌ Не настроены API_ID или API_HASH")
+            return {}
         
+        queues = {}
+        for session_phone, sources in assignments.items():
+            normalized = [self.normalize_telegram_source(source) for source in sources]
+            queues[session_phone] = [source for source in normalized if source]
+            log.info(f"📱 Сессия {session_phone}: {len(queues[session_phone])} каналов")
+        
+        # Посты всех каналов сохраняются общими пакетами
+        writer = ParsedDataWriter(self.parsed_data_collection)
+        
+        async def parse_channel(session_phone: str, source: Dict[str, Any]):
+            return await parse_tg_channel_with_session(
+                source['url'],
+                source['category'],
+                session_phone,
+                api_id,
+                api_hash,
+                self.parsed_data_collection,
+                writer=writer
+            )
+        
+        # Освободившейся сессии передаются только каналы, которые она уже парсила:
+        # у нее есть своя отметка последнего сообщения и доступ к каналу
+        urls = {source['url'] for sources in queues.values() for source in sources}
+        try:
+            channel_sessions = await get_channel_sessions([extract_channel_username(url) for url in urls])
+        except Exception as e:
+            log.warning(f"⚠️ Не удалось получить отметки каналов, каналы между сессиями не передаются: {e}")
+            channel_sessions = {}
+        stealable = {url: channel_sessions.get(extract_channel_username(url), set()) for url in urls}
+        
+        scheduler = TelegramParseScheduler(parse_channel)
+        results = await scheduler.run(queues, stealable)
+        
+        # Задержка и FloodWait сессий учитываются при распределении каналов
+        for session_phone, metrics in scheduler.metrics.items():
+            if not metrics['channels'] and not metrics['flood_wait_seconds']:
+                continue
+            avg_latency = metrics['latency'] / metrics['channels'] if metrics['channels'] else None
+            try:
+                await record_session_parse_stats(session_phone, avg_latency, metrics['flood_wait_seconds'])
+            except Exception as e:
+                log.warning(f"⚠️ Не удалось сохранить статистику сессии {session_phone}: {e}")
+        
+        # Дописываем остаток буфера и заменяем количество переданных постов на вставленные
+        write_stats = await writer.flush()
+        for session_results in results.values():
+            for source_url in session_results:
+                session_results[source_url] = writer.inserted_for(source_url)
+        log.info(f"Дубликатов при записи: {write_stats['duplicates']}")
+        
+        for session_phone, session_results in results.items():
+            log.info(f"✅ Сессия {session_phone} завершена. Спаршено: {sum(session_results.values())}")
         return results
 
     async def parse_telegram_sources(self, tg_sources: List[Dict[str, Any]],
-                                     sessions: List[Dict[str, Any]]) -> Dict[str, Dict[str, int]]:
+                                     sessions: List[Dict[str, Any]]) -> Dict[str, int]:
         """
-        Парсит Telegram источники по каналам, указанным в сессиях.
+        Парсит Telegram источники по каналам, указанным в сессиях (все сессии параллельно).
 
         Args:
             tg_sources: Список Telegram источников (может быть пустым, только для совместимости)
             sessions: Список активных сессий
 
         Returns:
-            Dict: Результаты парсинга по источникам и сессиям
+            Dict: Результаты парсинга по источникам
         """
         log.info(f"Начинаем парсинг Telegram источников по каналам из сессий ({len(sessions)} сессий)")
 
-        results = {}
-
         if not sessions:
             log.warning("Нет активных сессий для парсинга Telegram")
-            return results
+            return {}
 
+        assignments = {}
         for session in sessions:
             session_phone = session.get("phone_number", "Unknown")
             session_channels = session.get("channels", [])
@@ -176,16 +315,15 @@ class SourceParser:
                 log.warning(f"Сессия {session_phone} не имеет каналов для парсинга")
                 continue
 
-            log.info(f"🚀 Парсим для сессии {session_phone} с {len(session_channels)} каналами")
+            assignments[session_phone] = session_channels
 
-            cleaned_sources = clean_mongodb_data(session_channels)
-            session_result = await self.parse_telegram_sources_with_session(cleaned_sources, session_phone)
+        session_results = await self.parse_telegram_sessions(assignments)
 
-            # Результат сохраняем по URL канала
+        # Результат сохраняем по URL канала
+        results = {}
+        for session_result in session_results.values():
             results.update(session_result)
 
-            log.info(f"✅ Сессия {session_phone} завершена. Спаршено: {sum(session_result.values())}")
-
         total_saved = sum(results.values())
         log.info(f"✅ Telegram парсинг завершен. Всего спаршено: {total_saved}")
 
@@ -209,67 +347,13 @@ class SourceParser:
             log.warning("Нет Telegram источников для парсинга")
             return {}
         
-        # Получаем API credentials
-        api_id = int(os.getenv("API_ID", "0"))
-        api_hash = os.getenv("API_HASH", "")
-        
-        if not api_id or not api_hash:
-            log.error("❌ Не настроены API_ID или API_HASH")
-            return {}
-        
-        log.info(f"✅ API credentials получены: api_id={api_id}, api_hash={'*' * len(api_hash) if api_hash else 'None'}")
-        
-        results = {}
+        results = await self.parse_telegram_sessions({session_phone: sources})
+        session_results = results.get(session_phone, {})
         
-        for i, source in enumerate(sources):
-            try:
-                # Обрабатываем как строки, так и словари
-                if isinstance(source, str):
-                    # Если source - это строка (URL канала)
-                    source_url = source
-                    category = 'general'
-                elif isinstance(source, dict):
-                    # Если source - это словарь
-                    source_url = source.get('url', '')
-                    category = source.get('category', 'general')
-                else:
-                    log.warning(f"⚠️ Неизвестный тип источника: {type(source)}")
-                    continue
-                
-                if not source_url:
-                    log.warning(f"⚠️ Пустой URL источника: {source}")
-                    continue
-                
-                log.info(f"📱 Парсим источник {i+1}/{len(sources)}: {source_url}")
-                
-                # Парсим канал с конкретной сессией
-                result = await parse_tg_channel_with_session(
-                    source_url, 
-                    category, 
-                    session_phone,  # Передаем session_phone как phone_number
-                    api_id, 
-                    api_hash, 
-                    self.parsed_data_collection
-                )
-                
-                if result is not None:
-                    results[source_url] = result
-                    log.info(f"✅ Успешно спаршено {result} записей из {source_url}")
-                else:
-                    results[source_url] = 0
-                    log.warning(f"⚠️ Не удалось спарсить {source_url}")
-                    
-            except Exception as e:
-                # Безопасное получение URL для логирования
-                source_url_for_log = source if isinstance(source, str) else source.get('url', '') if isinstance(source, dict) else str(source)
-                log.error(f"❌ Ошибка при парсинге {source_url_for_log}: {e}")
-                log.error(f"❌ Тип ошибки: {type(e).__name__}")
-                results[source_url_for_log] = 0
-        
-        total_parsed = sum(results.values())
+        total_parsed = sum(session_results.values())
         log.info(f"🎉 Парсинг с сессией {session_phone} завершен. Всего спаршено: {total_parsed}")
         
-        return results
+        return session_results
     
     async def parse_all_sources(self, limit: int = 100) -> Dict[str, Any]:
         """
@@ -306,10 +390,7 @@ class SourceParser:
         
         # Подсчитываем общую статистику
         total_rss = sum(r for r in rss_results.values() if r is not None)
-        total_tg = sum(
-            sum(r.values()) if r and isinstance(r, dict) else 0 
-            for r in tg_results.values() if r is not None
-        )
+        total_tg = sum(r for r in tg_results.values() if r is not None)
         
         result = {
             "total_sources": len(sources),
@@ -0,0 +1,210 @@
+import asyncio
+import logging
+import os
+import time
+import weakref
+from typing import Dict, Optional
+from telethon import TelegramClient
+from telethon.sessions import SQLiteSession, StringSession
+from session_manager import get_session_file_path
+
+log = logging.getLogger(__name__)
+
+# Как часто проверять, что соединение клиента живое (секунды)
+TG_CLIENT_HEALTH_CHECK_INTERVAL = float(os.getenv("TG_CLIENT_HEALTH_CHECK_INTERVAL", "60"))
+# Через сколько секунд простоя клиент отключается
+TG_CLIENT_MAX_IDLE = float(os.getenv("TG_CLIENT_MAX_IDLE", "1800"))
+
+# Пулы привязаны к процессу воркера и к event loop: клиент Telethon нельзя
+# использовать из другого loop, а соединения родителя - в процессе после fork
+_pools = weakref.WeakKeyDictionary()
+_pools_pid = os.getpid()
+
+def load_session_copy(phone_number: str) -> Optional[StringSession]:
+    """
+    Копия файловой сессии в памяти для клиента пула
+
+    Клиент пула живет между задачами и держал бы SQLite-файл сессии открытым,
+    а задачи авторизации открывают тот же файл ("database is locked"). Поэтому
+    из файла читаются только ключ авторизации и адрес DC, файл сразу закрывается,
+    и клиент пула в него не пишет.
+
+    Args:
+        phone_number: Номер телефона сессии
+
+    Returns:
+        Optional[StringSession]: Копия сессии или None, если файла сессии нет
+    """
+    path = get_session_file_path(phone_number)
+    if not os.path.exists(path + ".session"):
+        return None
+    file_session = SQLiteSession(path)
+    try:
+        return StringSession(StringSession.save(file_session))
+    finally:
+        file_session.close()
+
+class PooledClient:
+    """Подключенный и авторизованный клиент сессии"""
+
+    def __init__(self, client: TelegramClient):
+        self.client = client
+        self.checked_at = time.monotonic()
+        self.used_at = time.monotonic()
+
+class TelegramClientPool:
+    """
+    Пул постоянных подключений Telethon: один клиент на номер сессии
+
+    Подключение и проверки авторизации выполняются один раз, дальше клиент
+    переиспользуется для всех каналов сессии (и между запусками парсинга в
+    долгоживущем воркере). Перед выдачей клиент проверяется и при обрыве
+    соединения переподключается. Клиенты работают с копией сессии в памяти
+    (load_session_copy) и не держат открытыми файлы сессий.
+    """
+
+    def __init__(self, health_check_interval: float = TG_CLIENT_HEALTH_CHECK_INTERVAL,
+                 max_idle: float = TG_CLIENT_MAX_IDLE):
+        """
+        Args:
+            health_check_interval: Интервал проверки соединения запросом к Telegram
+            max_idle: Время простоя, после которого клиент отключается
+        """
+        self.health_check_interval = health_check_interval
+        self.max_idle = max_idle
+        self._clients: Dict[str, PooledClient] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        # Сессии, которые не могут парсить (не авторизованы или боты), и время проверки
+        self._rejected: Dict[str, float] = {}
+
+    async def _connect(self, phone_number: str, api_id: int, api_hash: str) -> Optional[TelegramClient]:
+        """Подключает клиента сессии и проверяет, что он может парсить каналы"""
+        session = load_session_copy(phone_number)
+        if session is None:
+            log.error(f"❌ Файл сессии {phone_number} не найден. Пропускаем.")
+            return None
+        client = TelegramClient(session, api_id, api_hash)
+        try:
+            await client.connect()
+
+            if not await client.is_user_authorized():
+                log.error(f"❌ Сессия {phone_number} не авторизована. Пропускаем.")
+                await client.disconnect()
+                return None
+
+            if await client.is_bot():
+                log.error(f"❌ Сессия {phone_number} - бот. Боты не могут парсить каналы.")
+                await client.disconnect()
+                return None
+        except Exception:
+            await client.disconnect()
+            raise
+
+        log.info(f"🔌 Подключен клиент Telegram для {phone_number}")
+        return client
+
+    async def _is_healthy(self, pooled: PooledClient) -> bool:
+        """Проверяет соединение; запрос к Telegram - не чаще health_check_interval"""
+        if not pooled.client.is_connected():
+            return False
+        if time.monotonic() - pooled.checked_at < self.health_check_interval:
+            return True
+        try:
+            await pooled.client.get_me()
+            pooled.checked_at = time.monotonic()
+            return True
+        except Exception as e:
+            log.warning(f"⚠️ Проверка соединения Telegram не прошла: {e}")
+            return False
+
+    async def acquire(self, phone_number: str, api_id: int, api_hash: str) -> Optional[TelegramClient]:
+        """
+        Возвращает подключенный клиент сессии
+
+        Args:
+            phone_number: Номер телефона сессии
+            api_id: API ID для Telegram
+            api_hash: API Hash для Telegram
+
+        Returns:
+            Optional[TelegramClient]: Клиент или None, если сессия не может парсить
+        """
+        await self._close_idle(exclude=phone_number)
+
+        # Непригодную сессию не переподключаем для каждого канала
+        rejected_at = self._rejected.get(phone_number)
+        if rejected_at is not None and time.monotonic() - rejected_at < self.max_idle:
+            return None
+
+        lock = self._locks.setdefault(phone_number, asyncio.Lock())
+        async with lock:
+            pooled = self._clients.get(phone_number)
+            if pooled is not None:
+                if await self._is_healthy(pooled):
+                    pooled.used_at = time.monotonic()
+                    return pooled.client
+                log.info(f"🔄 Переподключение клиента Telegram для {phone_number}")
+                await self._disconnect(phone_number)
+
+            client = await self._connect(phone_number, api_id, api_hash)
+            if client is None:
+                self._rejected[phone_number] = time.monotonic()
+            else:
+                self._rejected.pop(phone_number, None)
+                self._clients[phone_number] = PooledClient(client)
+            return client
+
+    async def invalidate(self, phone_number: str):
+        """Отключает клиента сессии; следующий acquire подключится заново"""
+        lock = self._locks.setdefault(phone_number, asyncio.Lock())
+        async with lock:
+            await self._disconnect(phone_number)
+
+    async def _disconnect(self, phone_number: str):
+        """Отключает клиента сессии и убирает его из пула"""
+        pooled = self._clients.pop(phone_number, None)
+        if pooled is None:
+            return
+        try:
+            await pooled.client.disconnect()
+            log.info(f"🔌 Отключение от Telegram для {phone_number}")
+        except Exception as disconnect_error:
+            log.warning(f"⚠️ Ошибка при disconnect: {disconnect_error}")
+
+    async def _close_idle(self, exclude: str = None):
+        """Отключает клиентов, которые не использовались дольше max_idle"""
+        now = time.monotonic()
+        idle = [
+            phone for phone, pooled in self._clients.items()
+            if phone != exclude and now - pooled.used_at > self.max_idle
+        ]
+        for phone in idle:
+            await self.invalidate(phone)
+
+    async def close(self):
+        """Отключает все клиенты пула"""
+        for phone in list(self._clients):
+            await self.invalidate(phone)
+
+def _process_pools() -> weakref.WeakKeyDictionary:
+    """Пулы текущего процесса; унаследованные от родителя после fork отбрасываются"""
+    global _pools, _pools_pid
+    if _pools_pid != os.getpid():
+        _pools = weakref.WeakKeyDictionary()
+        _pools_pid = os.getpid()
+    return _pools
+
+def get_client_pool() -> TelegramClientPool:
+    """Пул клиентов текущего процесса и event loop"""
+    pools = _process_pools()
+    loop = asyncio.get_running_loop()
+    pool = pools.get(loop)
+    if pool is None:
+        pool = pools[loop] = TelegramClientPool()
+    return pool
+
+async def close_client_pool():
+    """Отключает клиентов пула текущего event loop (перед закрытием loop)"""
+    pool = _process_pools().pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        await pool.close()
@@ -1,13 +1,21 @@
-from telethon import TelegramClient
 import logging
 import re
+from telethon.errors import FloodWaitError
 import asyncio
-from .utils import decode_if_bytes, save_parsed_data
+import os
+from datetime import datetime
+from .utils import decode_if_bytes, ParsedDataWriter
 from config import API_ID, API_HASH
-from session_manager import get_session_file_path
+from .tg_client_pool import get_client_pool
+from storage import get_channel_state, save_channel_state, record_channel_posts
 
 log = logging.getLogger(__name__)
 
+# Сколько последних постов брать при первом парсинге канала
+TG_INITIAL_FETCH_LIMIT = int(os.getenv("TG_INITIAL_FETCH_LIMIT", "50"))
+# Размер страницы догрузки: после каждой страницы посты записываются и сохраняется отметка
+TG_BACKFILL_PAGE_SIZE = int(os.getenv("TG_BACKFILL_PAGE_SIZE", "100"))
+
 def extract_channel_username(url):
     """Извлекает username канала из URL"""
     # Убираем https://t.me/ или @ если они есть
@@ -17,10 +25,16 @@ def extract_channel_username(url):
 
 async def parse_tg_channel_with_session(channel: str, category: str, phone_number: str, 
                                       api_id: int, api_hash: str, parsed_data_collection, 
-                                      limit: int = 50):
+                                      limit: int = TG_INITIAL_FETCH_LIMIT, writer: ParsedDataWriter = None):
     """
     Парсит Telegram канал используя конкретную сессию
     
+    Для каждой пары (канал, сессия) хранится ID последнего обработанного сообщения,
+    поэтому запрашиваются только новые посты (min_id) - без ограничения количества.
+    Новые посты читаются от старых к новым страницами по TG_BACKFILL_PAGE_SIZE;
+    после каждой страницы посты записываются и отметка сдвигается, так что
+    прерванная догрузка продолжится с того же места.
+    
     Args:
         channel: URL или username канала
         category: Категория для спарсенных данных
@@ -28,10 +42,15 @@ async def parse_tg_channel_with_session(channel: str, category: str, phone_numbe
         api_id: API ID для Telegram
         api_hash: API Hash для Telegram
         parsed_data_collection: MongoDB коллекция для сохранения данных
-        limit: Лимит сообщений для парсинга
+        limit: Лимит сообщений при первом парсинге канала (пока нет отметки)
+        writer: Общий буферизованный писатель; если не передан, создается свой
     
     Returns:
-        int: Количество спарсенных записей или None при ошибке
+        int: Количество сохраненных записей (с общим писателем - переданных на запись)
+            или None при ошибке
+    
+    Raises:
+        FloodWaitError: Если Telegram ограничил запросы сессии
     """
     log.info(f"Начало парсинга Telegram-канала {channel} с сессией {phone_number}")
     
@@ -44,25 +63,46 @@ async def parse_tg_channel_with_session(channel: str, category: str, phone_numbe
         
         log.info(f"Извлечен username канала: {channel_username}")
         
-        # Используем существующий файл сессии
-        session_file = get_session_file_path(phone_number)
-        client = TelegramClient(session_file, api_id, api_hash)
+        own_writer = writer is None
+        if own_writer:
+            writer = ParsedDataWriter(parsed_data_collection)
+        
+        # Постоянное подключение сессии из пула (авторизация проверяется при подключении)
+        client_pool = get_client_pool()
+        client = await client_pool.acquire(phone_number, api_id, api_hash)
+        if client is None:
+            return None
         
         try:
-            await client.connect()
+            state = await get_channel_state(channel_username, phone_number) or {}
+            last_message_id = state.get("last_message_id", 0)
             
-            # Проверяем авторизацию
-            is_authorized = await client.is_user_authorized()
-            if not is_authorized:
-                log.error(f"❌ Сессия {phone_number} не авторизована. Пропускаем.")
-                return None
-
-            if await client.is_bot():
-                log.error(f"❌ Сессия {phone_number} - бот. Боты не могут парсить каналы.")
-                return None
-
-            saved_count = 0
-            async for message in client.iter_messages(channel_username, limit=limit):
+            if last_message_id:
+                # Только новые посты, от старых к новым
+                messages = client.iter_messages(channel_username, min_id=last_message_id, reverse=True)
+            else:
+                # Первый парсинг: последние limit постов
+                messages = client.iter_messages(channel_username, limit=limit)
+            
+            async def commit_progress(message_id: int):
+                """Записывает посты из буфера и только после этого сдвигает отметку"""
+                failed_before = writer.failed
+                await writer.flush()
+                if writer.failed > failed_before:
+                    raise RuntimeError("не удалось записать посты, отметка канала не сдвигается")
+                await save_channel_state(channel_username, phone_number, {
+                    "last_message_id": message_id,
+                    "updated_at": datetime.utcnow()
+                })
+            
+            queued_count = 0
+            fetched_count = 0
+            page_count = 0
+            max_message_id = last_message_id
+            async for message in messages:
+                max_message_id = max(max_message_id, message.id)
+                fetched_count += 1
+                page_count += 1
                 if message.text:
                     text = decode_if_bytes(message.text)
                     data = {
@@ -77,23 +117,47 @@ async def parse_tg_channel_with_session(channel: str, category: str, phone_numbe
                         "session_phone": phone_number
                     }
                     
-                    if await save_parsed_data(data, parsed_data_collection):
-                        saved_count += 1
-                        print(f"📱 TG ({phone_number}): {text[:100]}... | https://t.me/{channel_username}/{message.id}")
+                    await writer.add(data)
+                    queued_count += 1
+                
+                # Отметка сдвигается только после записи страницы (при догрузке - по порядку)
+                if last_message_id and page_count >= TG_BACKFILL_PAGE_SIZE:
+                    await commit_progress(max_message_id)
+                    page_count = 0
             
-            log.info(f"✅ Успешно спаршено {saved_count} постов из {channel_username} с сессией {phone_number}")
-            return saved_count
+            if max_message_id > last_message_id:
+                await commit_progress(max_message_id)
+            
+            # Объем новых постов канала учитывается при распределении каналов по сессиям
+            if last_message_id:
+                try:
+                    await record_channel_posts(channel_username, phone_number, fetched_count)
+                except Exception as stats_error:
+                    log.warning(f"⚠️ Не удалось сохранить статистику канала {channel_username}: {stats_error}")
+            
+            if not own_writer:
+                log.info(f"✅ Из {channel_username} передано на запись {queued_count} постов (сессия {phone_number})")
+                return queued_count
+
+            await writer.flush()
+            log.info(f"✅ Успешно спаршено {writer.inserted} постов из {channel_username} с сессией {phone_number}")
+            return writer.inserted
             
         except Exception as e:
             log.error(f"❌ Ошибка при парсинге канала {channel} с сессией {phone_number}: {str(e)}")
+            if own_writer:
+                # Сохраняем посты, полученные до ошибки
+                await writer.flush()
+            if isinstance(e, FloodWaitError):
+                # Решение о паузе сессии принимает вызывающий код
+                raise
+            if isinstance(e, ConnectionError):
+                # Соединение потеряно - клиент будет переподключен при следующем обращении
+                await client_pool.invalidate(phone_number)
             return None
-        finally:
-            try:
-                await client.disconnect()
-                log.info(f"🔌 Отключение от Telegram для {phone_number}")
-            except Exception as disconnect_error:
-                log.warning(f"⚠️ Ошибка при disconnect: {disconnect_error}")
             
+    except FloodWaitError:
+        raise
     except Exception as e:
         log.error(f"❌ Ошибка при парсинге Telegram ({channel}): {str(e)}")
         return None
@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import os
+import time
+from collections import defaultdict, deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+from telethon.errors import FloodWaitError
+
+log = logging.getLogger(__name__)
+
+# Количество каналов, которые одна сессия парсит одновременно
+TG_SESSION_CONCURRENCY = int(os.getenv("TG_SESSION_CONCURRENCY", "2"))
+# FloodWait дольше этого (секунды) выводит сессию из текущего запуска
+TG_MAX_FLOOD_WAIT = int(os.getenv("TG_MAX_FLOOD_WAIT", "600"))
+# Как часто свободный воркер проверяет, не вернулись ли каналы в очереди
+TG_IDLE_POLL_INTERVAL = 0.5
+
+class TelegramParseScheduler:
+    """
+    Параллельный парсинг Telegram каналов всеми сессиями
+
+    У каждой сессии своя очередь каналов, которую разбирают session_concurrency
+    воркеров. FloodWait приостанавливает только затронутую сессию, канал
+    возвращается в ее очередь. Сессия, у которой закончились каналы, забирает
+    оставшиеся каналы у других сессий (в первую очередь - у приостановленных),
+    но только те, что ей доступны: отметка последнего сообщения хранится для
+    пары (канал, сессия), а закрытый канал может читать не каждая сессия.
+    """
+
+    def __init__(self, parse_channel: Callable[[str, Dict[str, Any]], Awaitable[Optional[int]]],
+                 session_concurrency: int = TG_SESSION_CONCURRENCY,
+                 max_flood_wait: int = TG_MAX_FLOOD_WAIT):
+        """
+        Args:
+            parse_channel: Корутина парсинга канала (номер сессии, источник с ключами url и category)
+            session_concurrency: Количество одновременно парсящихся каналов на сессию
+            max_flood_wait: Максимальный FloodWait, который сессия пережидает в этом запуске
+        """
+        self.parse_channel = parse_channel
+        self.session_concurrency = session_concurrency
+        self.max_flood_wait = max_flood_wait
+
+    def _next_source(self, phone: str) -> Optional[Dict[str, Any]]:
+        """Следующий канал для сессии: из своей очереди или доступный ей канал из самой загруженной чужой"""
+        if self.queues[phone]:
+            return self.queues[phone].popleft()
+
+        now = time.monotonic()
+        donors = [other for other, queue in self.queues.items() if other != phone and queue]
+
+        # Сначала помогаем выбывшим и приостановленным сессиям, затем - с самой длинной очередью
+        donors.sort(key=lambda other: (
+            other in self.retired or self.paused_until[other] > now,
+            len(self.queues[other])
+        ), reverse=True)
+        for donor in donors:
+            queue = self.queues[donor]
+            # Забираем с конца очереди: начало донор разберет сам, когда освободится
+            for index in range(len(queue) - 1, -1, -1):
+                if phone in self.stealable.get(queue[index]['url'], ()):
+                    source = queue[index]
+                    del queue[index]
+                    log.info(f"🔀 Канал {source['url']} передан от сессии {donor} сессии {phone}")
+                    return source
+        return None
+
+    async def _worker(self, phone: str):
+        """Воркер сессии: разбирает очередь, пока есть каналы у нее или у других сессий"""
+        while phone not in self.retired:
+            wait = self.paused_until[phone] - time.monotonic()
+            if wait > 0:
+                # Пока сессия на паузе, ее каналы могут разобрать другие сессии
+                if self.in_flight == 0 and not any(self.queues.values()):
+                    return
+                await asyncio.sleep(min(wait, TG_IDLE_POLL_INTERVAL))
+                continue
+
+            source = self._next_source(phone)
+            if source is None:
+                # Каналы могут вернуться в очереди после FloodWait у других сессий
+                if self.in_flight == 0:
+                    return
+                await asyncio.sleep(TG_IDLE_POLL_INTERVAL)
+                continue
+
+            self.in_flight += 1
+            started_at = time.monotonic()
+            try:
+                result = await self.parse_channel(phone, source)
+                self.results[phone][source['url']] = result or 0
+                self.metrics[phone]['channels'] += 1
+                self.metrics[phone]['latency'] += time.monotonic() - started_at
+            except FloodWaitError as e:
+                self.metrics[phone]['flood_wait_seconds'] += e.seconds
+                self.queues[phone].appendleft(source)
+                if e.seconds > self.max_flood_wait:
+                    log.warning(f"⏳ FloodWait {e.seconds} сек у сессии {phone}: сессия выбывает из запуска")
+                    self.retired.add(phone)
+                else:
+                    log.warning(f"⏳ FloodWait {e.seconds} сек у сессии {phone}: сессия приостановлена")
+                    self.paused_until[phone] = max(self.paused_until[phone], time.monotonic() + e.seconds)
+            except Exception as e:
+                log.error(f"❌ Ошибка при парсинге {source['url']} сессией {phone}: {e}")
+                self.results[phone][source['url']] = 0
+            finally:
+                self.in_flight -= 1
+
+    async def run(self, assignments: Dict[str, List[Dict[str, Any]]],
+                  stealable: Optional[Dict[str, Set[str]]] = None) -> Dict[str, Dict[str, int]]:
+        """
+        Парсит каналы всех сессий параллельно
+
+        Args:
+            assignments: Каналы по номерам сессий
+            stealable: Сессии, которым можно передать канал (по URL канала): у них есть
+                отметка парсинга этого канала. Если не переданы, каналы не передаются
+
+        Returns:
+            Dict[str, Dict[str, int]]: Результаты по сессиям (фактически парсившим канал) и URL каналов
+        """
+        self.queues = {phone: deque(sources) for phone, sources in assignments.items()}
+        self.stealable = stealable or {}
+        self.paused_until = defaultdict(float)
+        self.retired = set()
+        self.in_flight = 0
+        self.results = {phone: {} for phone in assignments}
+        # Статистика сессий за запуск: спаршено каналов, суммарное время, секунды FloodWait
+        self.metrics = {
+            phone: {'channels': 0, 'latency': 0.0, 'flood_wait_seconds': 0}
+            for phone in assignments
+        }
+
+        await asyncio.gather(*[
+            self._worker(phone)
+            for phone in self.queues
+            for _ in range(self.session_concurrency)
+        ])
+
+        # Каналы, которые не успели спарсить (все сессии выбыли по FloodWait)
+        for phone, queue in self.queues.items():
+            for source in queue:
+                log.warning(f"⚠️ Канал {source['url']} не спаршен: нет доступных сессий")
+                self.results[phone][source['url']] = 0
+
+        return self.results
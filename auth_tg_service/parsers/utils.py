@@ -1,10 +1,19 @@
 import asyncio
 import logging
+import os
+from collections import defaultdict
 from hashlib import md5
 from datetime import datetime
+from pymongo.errors import BulkWriteError, OperationFailure
 
 log = logging.getLogger(__name__)
 
+# Количество записей, накапливаемых перед одной пакетной вставкой
+BULK_WRITE_BATCH_SIZE = int(os.getenv("BULK_WRITE_BATCH_SIZE", "500"))
+
+# Код ошибки MongoDB при нарушении уникального индекса
+DUPLICATE_KEY_ERROR = 11000
+
 def generate_hash(text: str) -> str:
     """Генерирует MD5 хеш для текста"""
     return md5(text.encode('utf-8')).hexdigest()
@@ -62,22 +71,150 @@ def decode_if_bytes(value):
             return value.decode('cp1251')
     return value
 
-async def save_parsed_data(data: dict, parsed_data_collection):
-    """Сохраняет спарсенные данные в MongoDB"""
-    try:
-        # Проверяем дубликат
-        if await is_duplicate(data['url'], parsed_data_collection):
-            return False
+def prepare_parsed_data(data: dict) -> dict:
+    """Добавляет к спарсенным данным служебные поля перед сохранением"""
+    data['created_at'] = datetime.utcnow()
+    data['vectorized'] = False
+    data['hash'] = generate_hash(data['url'] + data.get('title', ''))
+    return data
+
+class ParsedDataWriter:
+    """
+    Буферизованная запись спарсенных данных в MongoDB
+    
+    Записи накапливаются и вставляются пакетами через неупорядоченный insert_many.
+    Дубликаты отсекает уникальный индекс по url на стороне сервера, поэтому
+    отдельная проверка перед вставкой не нужна. Если индекс создать не удалось,
+    уже сохраненные url отсеиваются запросом перед вставкой.
+    """
+    
+    # Коллекции, для которых индекс уже проверен в этом процессе: есть ли уникальный индекс по url
+    _indexed_collections = {}
+    
+    def __init__(self, parsed_data_collection, batch_size: int = BULK_WRITE_BATCH_SIZE):
+        """
+        Args:
+            parsed_data_collection: MongoDB коллекция для сохранения данных
+            batch_size: Количество записей в одной пакетной вставке
+        """
+        self.collection = parsed_data_collection
+        self.batch_size = batch_size
+        self.buffer = []
+        self.inserted = 0
+        self.duplicates = 0
+        self.failed = 0
+        # Статистика по источникам (source_url): inserted, duplicates, failed
+        self.source_stats = defaultdict(lambda: {"inserted": 0, "duplicates": 0, "failed": 0})
+    
+    async def ensure_index(self) -> bool:
+        """
+        Создает уникальный индекс по url, на котором держится дедупликация
         
-        # Добавляем метаданные
-        data['created_at'] = datetime.utcnow()
-        data['vectorized'] = False
-        data['hash'] = generate_hash(data['url'] + data.get('title', ''))
+        Если индекс создать не удалось (например, в коллекции уже есть записи с
+        одинаковым url), запись не прерывается: flush переходит на проверку url
+        перед вставкой. Записи writer не удаляет - повторы убирает разовая
+        миграция scripts/dedupe_parsed_data.py.
         
-        # Сохраняем в БД
-        await parsed_data_collection.insert_one(data)
-        log.info(f"Данные сохранены: {data.get('title', '')[:50]}...")
+        Returns:
+            bool: True, если уникальный индекс есть
+        """
+        key = (self.collection.database.name, self.collection.name)
+        if key in self._indexed_collections:
+            return self._indexed_collections[key]
+        try:
+            await self.collection.create_index("url", unique=True)
+        except OperationFailure as e:
+            if e.code != DUPLICATE_KEY_ERROR:
+                log.error(f"Ошибка при создании уникального индекса по url: {str(e)}")
+                return False
+            # Повторять создание при каждой записи не нужно: до перезапуска работаем без индекса
+            log.error(f"В {self.collection.name} есть записи с одинаковым url, уникальный индекс не создан, "
+                      f"дубликаты отсеиваются запросом. Удалите повторы: python scripts/dedupe_parsed_data.py --apply")
+            self._indexed_collections[key] = False
+            return False
+        except Exception as e:
+            log.error(f"Ошибка при создании уникального индекса по url: {str(e)}")
+            return False
+        self._indexed_collections[key] = True
         return True
-    except Exception as e:
-        log.error(f"Ошибка при сохранении данных: {str(e)}")
-        return False
\ No newline at end of file
+    
+    async def _find_duplicates(self, batch: list) -> dict:
+        """Индексы записей пакета, чей url уже сохранен или повторяется в пакете (без уникального индекса)"""
+        urls = list({data["url"] for data in batch})
+        cursor = self.collection.find({"url": {"$in": urls}}, {"_id": 0, "url": 1})
+        seen = {doc["url"] async for doc in cursor}
+        duplicates = {}
+        for index, data in enumerate(batch):
+            if data["url"] in seen:
+                duplicates[index] = DUPLICATE_KEY_ERROR
+            seen.add(data["url"])
+        return duplicates
+    
+    async def add(self, data: dict):
+        """Добавляет запись в буфер; при заполнении буфера выполняет вставку"""
+        self.buffer.append(prepare_parsed_data(data))
+        if len(self.buffer) >= self.batch_size:
+            await self.flush()
+    
+    async def flush(self) -> dict:
+        """
+        Вставляет накопленные записи одним запросом
+        
+        Returns:
+            dict: Общая статистика записи (inserted, duplicates, failed)
+        """
+        if not self.buffer:
+            return self.stats()
+        
+        # Забираем буфер до await, чтобы параллельные add не попали в текущую вставку
+        batch, self.buffer = self.buffer, []
+        failed_indexes = {}
+        try:
+            if not await self.ensure_index():
+                failed_indexes = await self._find_duplicates(batch)
+            # Позиции вставляемых записей в пакете (ошибки insert_many нумеруют только их)
+            positions = [index for index in range(len(batch)) if index not in failed_indexes]
+            if positions:
+                await self.collection.insert_many([batch[index] for index in positions], ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                failed_indexes[positions[error["index"]]] = error.get("code")
+        except Exception as e:
+            log.error(f"Ошибка при пакетном сохранении данных: {str(e)}")
+            failed_indexes = {index: None for index in range(len(batch))}
+        
+        for index, data in enumerate(batch):
+            source_stats = self.source_stats[data.get("source_url", "")]
+            if index not in failed_indexes:
+                self.inserted += 1
+                source_stats["inserted"] += 1
+            elif failed_indexes[index] == DUPLICATE_KEY_ERROR:
+                self.duplicates += 1
+                source_stats["duplicates"] += 1
+            else:
+                self.failed += 1
+                source_stats["failed"] += 1
+        
+        log.info(f"Пакетная запись: {len(batch)} записей, вставлено {len(batch) - len(failed_indexes)}, "
+                 f"дубликатов {sum(1 for code in failed_indexes.values() if code == DUPLICATE_KEY_ERROR)}")
+        return self.stats()
+    
+    def inserted_for(self, source_url: str) -> int:
+        """Количество вставленных записей источника"""
+        return self.source_stats[source_url]["inserted"] if source_url in self.source_stats else 0
+    
+    def failed_for(self, source_url: str) -> int:
+        """Количество записей источника, которые не удалось сохранить"""
+        return self.source_stats[source_url]["failed"] if source_url in self.source_stats else 0
+    
+    def stats(self) -> dict:
+        """Общая статистика записи"""
+        return {"inserted": self.inserted, "duplicates": self.duplicates, "failed": self.failed}
+
+async def save_parsed_data(data: dict, parsed_data_collection):
+    """Сохраняет одну запись в MongoDB (для массовой записи используйте ParsedDataWriter)"""
+    writer = ParsedDataWriter(parsed_data_collection, batch_size=1)
+    await writer.add(data)
+    if writer.duplicates:
+        log.warning(f"Дубликат обнаружен по url: {data['url']}")
+    return writer.inserted == 1
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Разовая миграция: удаляет повторные записи parsed_data с одинаковым url и создает уникальный индекс
+
+ParsedDataWriter опирается на уникальный индекс по url, но в коллекции,
+заполненной до его появления, могут быть повторы, и индекс не создается.
+Скрипт по умолчанию только показывает, сколько записей будет удалено;
+удаление выполняется с флагом --apply. Из каждой группы остается самая
+ранняя запись.
+
+    python scripts/dedupe_parsed_data.py           # отчет без изменений
+    python scripts/dedupe_parsed_data.py --apply   # удалить повторы и создать индекс
+"""
+
+import asyncio
+import sys
+import os
+import argparse
+
+# Добавляем путь к корневой директории сервиса
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+async def find_duplicate_urls(collection):
+    """
+    Группы записей с одинаковым url
+    
+    Args:
+        collection: MongoDB коллекция parsed_data
+        
+    Yields:
+        dict: url группы и _id ее записей в порядке добавления
+    """
+    pipeline = [
+        {"$sort": {"_id": 1}},
+        {"$group": {"_id": "$url", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ]
+    async for group in collection.aggregate(pipeline, allowDiskUse=True):
+        yield {"url": group["_id"], "ids": group["ids"]}
+
+
+async def remove_duplicate_urls(collection, apply: bool = False) -> int:
+    """
+    Удаляет повторные записи с одинаковым url, оставляя самую раннюю
+    
+    Args:
+        collection: MongoDB коллекция parsed_data
+        apply: False - только посчитать повторы, ничего не удаляя
+        
+    Returns:
+        int: Количество удаленных (или подлежащих удалению) записей
+    """
+    removed = 0
+    async for group in find_duplicate_urls(collection):
+        extra_ids = group["ids"][1:]
+        if apply:
+            result = await collection.delete_many({"_id": {"$in": extra_ids}})
+            removed += result.deleted_count
+        else:
+            removed += len(extra_ids)
+    return removed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Удаление повторов parsed_data по url")
+    parser.add_argument("--apply", action="store_true", help="удалить повторы и создать уникальный индекс")
+    args = parser.parse_args()
+    
+    from storage import db
+    collection = db["parsed_data"]
+    
+    removed = await remove_duplicate_urls(collection, apply=args.apply)
+    if not args.apply:
+        print(f"Повторных записей по url: {removed}. Для удаления запустите с --apply")
+        return
+    
+    print(f"Удалено повторных записей по url: {removed}")
+    await collection.create_index("url", unique=True)
+    print("Уникальный индекс по url создан")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
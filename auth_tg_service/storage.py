@@ -1,6 +1,8 @@
 import motor.motor_asyncio
+from pymongo import UpdateOne
 from config import MONGO_URI, MONGO_DB
 import logging
+from typing import Optional
 
 log = logging.getLogger(__name__)
 
@@ -10,6 +12,18 @@ db = client[MONGO_DB]
 
 sessions_collection = db["sessions"]
 channel_bindings_collection = db["channel_bindings"]
+rss_feed_states_collection = db["rss_feed_states"]
+tg_channel_states_collection = db["tg_channel_states"]
+
+# Вес последнего запуска в скользящих средних статистики парсинга
+PARSE_STATS_ALPHA = 0.3
+
+def _ewma_update(field: str, value: float) -> dict:
+    """Выражение обновления скользящего среднего поля (для update с pipeline)"""
+    return {"$add": [
+        {"$multiply": [{"$ifNull": [f"${field}", value]}, 1 - PARSE_STATS_ALPHA]},
+        value * PARSE_STATS_ALPHA
+    ]}
 
 async def create_session(session_data: dict):
     return await sessions_collection.insert_one(session_data)
@@ -40,4 +54,117 @@ async def create_channel_binding(binding_data: dict):
     return await channel_bindings_collection.insert_one(binding_data)
 
 async def get_channel_bindings(session_id: str):
-    return await channel_bindings_collection.find({"session_id": session_id}).to_list(length=1000) 
\ No newline at end of file
+    return await channel_bindings_collection.find({"session_id": session_id}).to_list(length=1000) 
+
+async def get_feed_state(url: str):
+    """Получить состояние RSS-ленты (ETag, Last-Modified, хэш содержимого)"""
+    return await rss_feed_states_collection.find_one({"url": url})
+
+async def get_feed_states(urls: list) -> dict:
+    """Получить состояния нескольких RSS-лент одним запросом (по URL)"""
+    states = await rss_feed_states_collection.find({"url": {"$in": urls}}).to_list(length=None)
+    return {state["url"]: state for state in states}
+
+async def save_feed_state(url: str, update_data: dict):
+    """Обновить состояние RSS-ленты"""
+    return await rss_feed_states_collection.update_one(
+        {"url": url},
+        {"$set": {"url": url, **update_data}},
+        upsert=True
+    )
+
+
+async def get_channel_state(channel: str, session_phone: str):
+    """Получить состояние парсинга канала для сессии (последний обработанный ID сообщения)"""
+    return await tg_channel_states_collection.find_one({"channel": channel, "session_phone": session_phone})
+
+async def save_channel_state(channel: str, session_phone: str, update_data: dict):
+    """Обновить состояние парсинга канала для сессии"""
+    return await tg_channel_states_collection.update_one(
+        {"channel": channel, "session_phone": session_phone},
+        {"$set": {"channel": channel, "session_phone": session_phone, **update_data}},
+        upsert=True
+    )
+
+
+async def record_channel_posts(channel: str, session_phone: str, posts_count: int):
+    """Обновить среднее количество новых постов канала за запуск парсинга"""
+    return await tg_channel_states_collection.update_one(
+        {"channel": channel, "session_phone": session_phone},
+        [{"$set": {
+            "channel": channel,
+            "session_phone": session_phone,
+            "post_rate": _ewma_update("post_rate", float(posts_count))
+        }}],
+        upsert=True
+    )
+
+async def get_channel_post_rates(channels: list) -> dict:
+    """Получить среднее количество новых постов за запуск по каналам (максимум по сессиям)"""
+    states = await tg_channel_states_collection.find(
+        {"channel": {"$in": channels}, "post_rate": {"$exists": True}},
+        {"_id": 0, "channel": 1, "post_rate": 1}
+    ).to_list(length=None)
+    rates = {}
+    for state in states:
+        rates[state["channel"]] = max(rates.get(state["channel"], 0.0), state["post_rate"])
+    return rates
+
+async def get_channel_sessions(channels: list) -> dict:
+    """Получить сессии, у которых есть отметка парсинга канала (значит, канал им доступен), по каналам"""
+    states = await tg_channel_states_collection.find(
+        {"channel": {"$in": channels}, "last_message_id": {"$gt": 0}},
+        {"_id": 0, "channel": 1, "session_phone": 1}
+    ).to_list(length=None)
+    sessions = {}
+    for state in states:
+        sessions.setdefault(state["channel"], set()).add(state["session_phone"])
+    return sessions
+
+async def record_session_parse_stats(phone_number: str, avg_latency: Optional[float], flood_wait_seconds: float):
+    """Обновить скользящую статистику парсинга сессии (задержка на канал, если были каналы, и FloodWait)"""
+    update = {"parse_stats.flood_wait_seconds": _ewma_update("parse_stats.flood_wait_seconds", flood_wait_seconds)}
+    if avg_latency is not None:
+        update["parse_stats.avg_latency"] = _ewma_update("parse_stats.avg_latency", avg_latency)
+    return await sessions_collection.update_one({"phone_number": phone_number}, [{"$set": update}])
+
+async def assign_channels_to_sessions(assignment: dict, replace: bool = False):
+    """
+    Применить распределение каналов по сессиям одной пакетной записью
+    
+    Args:
+        assignment: Каналы по session_id
+        replace: Заменить списки каналов сессий (иначе каналы добавляются)
+    """
+    operations = [
+        UpdateOne(
+            {"session_id": session_id},
+            {"$set": {"channels": channels}} if replace else {"$addToSet": {"channels": {"$each": channels}}}
+        )
+        for session_id, channels in assignment.items()
+        if channels or replace
+    ]
+    if not operations:
+        return None
+    return await sessions_collection.bulk_write(operations, ordered=False)
+
+async def move_channel_bindings(moves: list):
+    """
+    Перенести привязки каналов на другие сессии одной пакетной записью
+    
+    Args:
+        moves: Переносы (канал, session_id откуда, session_id куда)
+    """
+    operations = [
+        UpdateOne({"chat_id": channel, "session_id": source}, {"$set": {"session_id": target}})
+        for channel, source, target in moves
+    ]
+    if not operations:
+        return None
+    return await channel_bindings_collection.bulk_write(operations, ordered=False)
+
+async def create_channel_bindings(bindings: list):
+    """Создать привязки каналов к сессиям одним запросом"""
+    if not bindings:
+        return None
+    return await channel_bindings_collection.insert_many(bindings, ordered=False)
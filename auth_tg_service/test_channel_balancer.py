@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Тесты перебалансировки каналов между сессиями
+"""
+
+import sys
+import os
+
+# Добавляем текущую директорию в путь
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from channel_balancer import rebalance_channels
+
+
+def session(session_id, channels, latency=None, flood_wait=0):
+    stats = {"flood_wait_seconds": flood_wait}
+    if latency is not None:
+        stats["avg_latency"] = latency
+    return {"session_id": session_id, "channels": list(channels), "parse_stats": stats}
+
+
+def channels(prefix, count):
+    return [f"https://t.me/{prefix}{index}" for index in range(count)]
+
+
+def test_flood_waited_session_gives_channels_away():
+    """Каналы уходят с сессии, которая стала получать FloodWait"""
+    sessions = [session("a", channels("a", 10), flood_wait=600), session("b", channels("b", 10))]
+
+    changed, moves = rebalance_channels(sessions, {}, max_moves=20)
+
+    assert moves and all(source == "a" and target == "b" for _, source, target in moves)
+    assert len(changed["a"]) + len(changed["b"]) == 20
+    # Нагрузка a (коэффициент 3) и b выравнивается: 5 * 3 против 15
+    assert len(changed["a"]) == 5
+
+
+def test_balanced_sessions_are_not_touched():
+    """Разница нагрузок в пределах допуска не приводит к переносам"""
+    sessions = [session("a", channels("a", 10), latency=1.1), session("b", channels("b", 10), latency=1.0)]
+
+    assert rebalance_channels(sessions, {}) == ({}, [])
+
+
+def test_moves_are_limited():
+    """За один запуск переносится не больше max_moves каналов"""
+    sessions = [session("a", channels("a", 30)), session("b", [])]
+
+    changed, moves = rebalance_channels(sessions, {}, max_moves=4)
+
+    assert len(moves) == 4
+    assert len(changed["a"]) == 26 and len(changed["b"]) == 4
+
+
+def test_expensive_channel_moves_first():
+    """Переносится канал, который лучше всего выравнивает нагрузку"""
+    heavy = "https://t.me/heavy"
+    sessions = [session("a", [heavy, "https://t.me/light"]), session("b", [])]
+
+    changed, moves = rebalance_channels(sessions, {heavy: 3.0, "https://t.me/light": 1.0})
+
+    assert moves == [(heavy, "a", "b")]
+
+
+def test_full_session_does_not_receive_channels():
+    """Сессия без свободных слотов не получает каналы"""
+    sessions = [session("a", channels("a", 6)), session("b", channels("b", 2))]
+
+    assert rebalance_channels(sessions, {}, max_channels=2) == ({}, [])
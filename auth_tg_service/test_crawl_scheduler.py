@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Тесты ограничений планировщика обхода RSS-лент
+"""
+
+import asyncio
+import sys
+import os
+import time
+from collections import defaultdict
+
+# Добавляем текущую директорию в путь
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from parsers.crawl_scheduler import RssCrawlScheduler, get_domain
+
+
+class CrawlRecorder:
+    """Загрузка ленты с записью одновременных запросов (всего и по доменам)"""
+
+    def __init__(self, duration: float = 0.05):
+        self.duration = duration
+        self.active = 0
+        self.max_active = 0
+        self.domain_active = defaultdict(int)
+        self.max_domain_active = defaultdict(int)
+        self.started = defaultdict(list)
+        self.order = []
+
+    async def crawl(self, feed):
+        domain = get_domain(feed["url"])
+        self.active += 1
+        self.domain_active[domain] += 1
+        self.max_active = max(self.max_active, self.active)
+        self.max_domain_active[domain] = max(self.max_domain_active[domain], self.domain_active[domain])
+        self.started[domain].append(time.monotonic())
+        self.order.append(feed["url"])
+        try:
+            await asyncio.sleep(self.duration)
+            if feed.get("fail"):
+                raise RuntimeError("лента недоступна")
+            return feed["url"]
+        finally:
+            self.active -= 1
+            self.domain_active[domain] -= 1
+
+
+def crawl_all(feeds, **kwargs):
+    recorder = CrawlRecorder()
+    scheduler = RssCrawlScheduler(recorder.crawl, **kwargs)
+
+    async def run():
+        return [item async for item in scheduler.run(feeds)]
+
+    return recorder, asyncio.run(run())
+
+
+def test_global_and_per_domain_limits():
+    """Одновременных загрузок не больше общего лимита и лимита на домен"""
+    feeds = [{"url": f"https://site{index % 4}.com/feed{index}.xml"} for index in range(24)]
+
+    recorder, results = crawl_all(feeds, max_concurrency=6, per_domain_concurrency=2, per_domain_delay=0)
+
+    assert len(results) == 24
+    assert recorder.max_active == 6
+    assert max(recorder.max_domain_active.values()) == 2
+
+
+def test_per_domain_delay():
+    """Запросы к одному домену начинаются не чаще, чем раз в per_domain_delay"""
+    feeds = [{"url": f"https://slow.com/feed{index}.xml"} for index in range(3)]
+
+    recorder, _ = crawl_all(feeds, max_concurrency=10, per_domain_concurrency=3, per_domain_delay=0.1)
+
+    starts = recorder.started["slow.com"]
+    assert all(later - earlier >= 0.09 for earlier, later in zip(starts, starts[1:]))
+
+
+def test_busy_domain_does_not_block_others():
+    """Пока домен на паузе, слоты получают ленты других доменов"""
+    feeds = [{"url": f"https://busy.com/feed{index}.xml", "priority": 1.0} for index in range(3)]
+    feeds.append({"url": "https://other.com/feed.xml", "priority": 0.1})
+
+    recorder, _ = crawl_all(feeds, max_concurrency=10, per_domain_concurrency=1, per_domain_delay=0.2)
+
+    assert recorder.order.index("https://other.com/feed.xml") == 1
+
+
+def test_priority_order_and_errors():
+    """Ленты с большим приоритетом обходятся раньше, ошибка ленты отдается как результат"""
+    feeds = [
+        {"url": "https://a.com/feed.xml", "priority": 0.1},
+        {"url": "https://b.com/feed.xml", "priority": 0.9, "fail": True},
+        {"url": "https://c.com/feed.xml", "priority": 0.5},
+    ]
+
+    recorder, results = crawl_all(feeds, max_concurrency=1, per_domain_concurrency=1, per_domain_delay=0)
+
+    assert recorder.order == ["https://b.com/feed.xml", "https://c.com/feed.xml", "https://a.com/feed.xml"]
+    outcomes = {feed["url"]: result for feed, result in results}
+    assert isinstance(outcomes["https://b.com/feed.xml"], RuntimeError)
+    assert outcomes["https://a.com/feed.xml"] == "https://a.com/feed.xml"
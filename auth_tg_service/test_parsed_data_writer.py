@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Тесты пакетной записи спарсенных данных (ParsedDataWriter)
+"""
+
+import asyncio
+import sys
+import os
+from types import SimpleNamespace
+
+from pymongo.errors import BulkWriteError, OperationFailure
+
+# Добавляем текущую директорию в путь
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from parsers.utils import ParsedDataWriter, DUPLICATE_KEY_ERROR
+from scripts.dedupe_parsed_data import remove_duplicate_urls
+
+
+class FakeCursor:
+    """Асинхронный курсор по списку документов"""
+
+    def __init__(self, docs):
+        self.docs = list(docs)
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self.docs:
+            yield doc
+
+
+class FakeCollection:
+    """Коллекция в памяти с поведением уникального индекса по url"""
+
+    def __init__(self, name, docs=None, index_fails=False):
+        self.name = name
+        self.database = SimpleNamespace(name="test")
+        self.docs = list(docs or [])
+        self.unique_url = False
+        self.index_fails = index_fails
+        self.inserted_batches = []
+
+    async def create_index(self, field, unique=False):
+        urls = [doc["url"] for doc in self.docs]
+        if self.index_fails or len(urls) != len(set(urls)):
+            raise OperationFailure("E11000 duplicate key error", code=DUPLICATE_KEY_ERROR)
+        self.unique_url = True
+
+    def aggregate(self, pipeline, allowDiskUse=False):
+        groups = {}
+        for doc in sorted(self.docs, key=lambda doc: doc["_id"]):
+            groups.setdefault(doc["url"], []).append(doc["_id"])
+        return FakeCursor(
+            {"_id": url, "ids": ids, "count": len(ids)}
+            for url, ids in groups.items() if len(ids) > 1
+        )
+
+    async def delete_many(self, query):
+        ids = set(query["_id"]["$in"])
+        before = len(self.docs)
+        self.docs = [doc for doc in self.docs if doc["_id"] not in ids]
+        return SimpleNamespace(deleted_count=before - len(self.docs))
+
+    def find(self, query, projection=None):
+        urls = set(query["url"]["$in"])
+        return FakeCursor({"url": doc["url"]} for doc in self.docs if doc["url"] in urls)
+
+    async def insert_many(self, docs, ordered=True):
+        self.inserted_batches.append(len(docs))
+        errors = []
+        for index, doc in enumerate(docs):
+            if self.unique_url and any(existing["url"] == doc["url"] for existing in self.docs):
+                errors.append({"index": index, "code": DUPLICATE_KEY_ERROR})
+                continue
+            self.docs.append({"_id": len(self.docs) + 1000, **doc})
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+
+
+def make_doc(url, source="https://example.com/feed"):
+    return {"url": url, "title": url, "source_url": source}
+
+
+def setup_function():
+    ParsedDataWriter._indexed_collections.clear()
+
+
+def test_duplicates_counted_by_unique_index():
+    """Повторы url отсекаются индексом и учитываются как дубликаты, а не ошибки"""
+    collection = FakeCollection("indexed", docs=[{"_id": 1, "url": "https://a"}])
+    writer = ParsedDataWriter(collection, batch_size=10)
+
+    async def run():
+        for url in ["https://a", "https://b", "https://b", "https://c"]:
+            await writer.add(make_doc(url))
+        return await writer.flush()
+
+    stats = asyncio.run(run())
+
+    assert stats == {"inserted": 2, "duplicates": 2, "failed": 0}
+    assert writer.inserted_for("https://example.com/feed") == 2
+    assert collection.inserted_batches == [4]
+
+
+def test_existing_duplicates_are_kept():
+    """Если в коллекции уже есть дубликаты, writer их не удаляет и работает без индекса"""
+    collection = FakeCollection("legacy", docs=[
+        {"_id": 1, "url": "https://a"},
+        {"_id": 2, "url": "https://a"},
+        {"_id": 3, "url": "https://b"},
+    ])
+    writer = ParsedDataWriter(collection, batch_size=10)
+
+    async def run():
+        indexed = await writer.ensure_index()
+        await writer.add(make_doc("https://a"))
+        await writer.add(make_doc("https://c"))
+        return indexed, await writer.flush()
+
+    indexed, stats = asyncio.run(run())
+
+    assert indexed is False
+    assert collection.unique_url is False
+    assert [doc["_id"] for doc in collection.docs[:3]] == [1, 2, 3]
+    assert stats == {"inserted": 1, "duplicates": 1, "failed": 0}
+
+
+def test_migration_reports_then_removes_duplicates():
+    """Миграция без --apply только считает повторы, с --apply оставляет самую раннюю запись"""
+    collection = FakeCollection("legacy", docs=[
+        {"_id": 1, "url": "https://a"},
+        {"_id": 2, "url": "https://a"},
+        {"_id": 3, "url": "https://b"},
+        {"_id": 4, "url": "https://a"},
+    ])
+
+    assert asyncio.run(remove_duplicate_urls(collection)) == 2
+    assert len(collection.docs) == 4
+
+    assert asyncio.run(remove_duplicate_urls(collection, apply=True)) == 2
+    assert sorted(doc["_id"] for doc in collection.docs) == [1, 3]
+
+
+def test_writes_continue_without_index():
+    """Без уникального индекса запись не падает, а дубликаты отсеиваются запросом"""
+    collection = FakeCollection("broken", docs=[{"_id": 1, "url": "https://a"}], index_fails=True)
+    writer = ParsedDataWriter(collection, batch_size=10)
+
+    async def run():
+        for url in ["https://a", "https://b", "https://b"]:
+            await writer.add(make_doc(url))
+        await writer.flush()
+        await writer.add(make_doc("https://b"))
+        return await writer.flush()
+
+    stats = asyncio.run(run())
+
+    assert stats == {"inserted": 1, "duplicates": 3, "failed": 0}
+    assert [doc["url"] for doc in collection.docs] == ["https://a", "https://b"]
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Тесты сохранения состояния RSS-лент
+"""
+
+import asyncio
+import threading
+import sys
+import os
+from types import SimpleNamespace
+
+# Добавляем текущую директорию в путь
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from parsers import rss_parser
+from parsers.utils import ParsedDataWriter
+
+FEED_URL = "https://example.com/feed.xml"
+FEED = """<?xml version="1.0"?>
+<rss version="2.0"><channel><title>Example</title>
+<item><title>Первая</title><link>https://example.com/1</link></item>
+<item><title>Вторая</title><link>https://example.com/2</link></item>
+</channel></rss>"""
+
+
+class FakeCollection:
+    """Коллекция, вставка в которую успешна или всегда падает"""
+
+    def __init__(self, fail=False):
+        self.name = "parsed_data"
+        self.database = SimpleNamespace(name="test")
+        self.fail = fail
+        self.docs = []
+
+    async def create_index(self, field, unique=False):
+        pass
+
+    async def insert_many(self, docs, ordered=True):
+        if self.fail:
+            raise ConnectionError("MongoDB недоступна")
+        self.docs.extend(docs)
+
+
+def patch_feed(monkeypatch):
+    """Лента отдается без сети, разбор - в текущем потоке; возвращает сохраненные состояния"""
+    saved = {}
+
+    async def get_feed_state(url):
+        return None
+
+    async def save_feed_state(url, data):
+        saved[url] = data
+
+    async def fetch_rss_content(url, headers, session=None):
+        return rss_parser.RssResponse(status=200, content=FEED, etag='"v1"', last_modified=None)
+
+    async def parse_feed_async(content):
+        return rss_parser.parse_feed_content(content)
+
+    monkeypatch.setattr(rss_parser, "get_feed_state", get_feed_state)
+    monkeypatch.setattr(rss_parser, "save_feed_state", save_feed_state)
+    monkeypatch.setattr(rss_parser, "fetch_rss_content", fetch_rss_content)
+    monkeypatch.setattr(rss_parser, "parse_feed_async", parse_feed_async)
+    ParsedDataWriter._indexed_collections.clear()
+    return saved
+
+
+def test_validators_saved_after_write(monkeypatch):
+    """Etag сохраняется, когда записи ленты записаны"""
+    saved = patch_feed(monkeypatch)
+    collection = FakeCollection()
+
+    result = asyncio.run(rss_parser.parse_rss(FEED_URL, "tech", collection))
+
+    assert result == 2
+    assert saved[FEED_URL]["etag"] == '"v1"'
+
+
+def test_validators_not_saved_when_write_fails(monkeypatch):
+    """Если записи не сохранились, etag не запоминается и лента будет загружена снова"""
+    saved = patch_feed(monkeypatch)
+    collection = FakeCollection(fail=True)
+
+    asyncio.run(rss_parser.parse_rss(FEED_URL, "tech", collection))
+
+    assert FEED_URL not in saved
+
+
+def test_shared_writer_defers_state(monkeypatch):
+    """С общим писателем состояние ленты отдается вызывающему коду, а не сохраняется сразу"""
+    saved = patch_feed(monkeypatch)
+    collection = FakeCollection()
+    writer = ParsedDataWriter(collection)
+    feed_states = {}
+
+    queued = asyncio.run(rss_parser.parse_rss(FEED_URL, "tech", collection, writer=writer, feed_states=feed_states))
+
+    assert queued == 2
+    assert saved == {}
+    assert collection.docs == []
+    assert feed_states[FEED_URL]["etag"] == '"v1"'
+
+
+def test_feed_is_parsed_off_the_event_loop(monkeypatch):
+    """Лента разбирается в потоке пула разбора, а не в потоке event loop"""
+    threads = []
+    parse_feed_content = rss_parser.parse_feed_content
+
+    def recording_parse(content):
+        threads.append(threading.current_thread().name)
+        return parse_feed_content(content)
+
+    monkeypatch.setattr(rss_parser, "parse_feed_content", recording_parse)
+
+    parsed = asyncio.run(rss_parser.parse_feed_async(FEED))
+
+    assert [entry["url"] for entry in parsed["entries"]] == ["https://example.com/1", "https://example.com/2"]
+    assert threads[0].startswith("rss-parse")
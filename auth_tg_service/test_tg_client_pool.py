@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Тесты пула клиентов Telethon для парсинга
+"""
+
+import asyncio
+import sqlite3
+import sys
+import os
+
+from telethon.crypto import AuthKey
+from telethon.sessions import SQLiteSession
+
+# Добавляем текущую директорию в путь
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from parsers import tg_client_pool
+from parsers.tg_client_pool import load_session_copy, get_client_pool
+
+
+def make_session_file(path):
+    session = SQLiteSession(path)
+    session.set_dc(2, "149.154.167.51", 443)
+    session.auth_key = AuthKey(data=bytes(range(256)))
+    session.save()
+    session.close()
+
+
+def test_session_copy_does_not_keep_file_open(tmp_path, monkeypatch):
+    """Клиент пула получает ключ сессии в памяти, файл сессии остается свободным для авторизации"""
+    path = str(tmp_path / "+100")
+    make_session_file(path)
+    monkeypatch.setattr(tg_client_pool, "get_session_file_path", lambda phone: path)
+
+    copy = load_session_copy("+100")
+
+    assert copy.auth_key.key == bytes(range(256))
+    assert (copy.dc_id, copy.server_address, copy.port) == (2, "149.154.167.51", 443)
+    # Файл можно сразу открыть на запись, как это делают задачи авторизации
+    connection = sqlite3.connect(path + ".session", timeout=0)
+    connection.execute("begin exclusive")
+    connection.rollback()
+    connection.close()
+
+
+def test_missing_session_file_is_not_created(tmp_path, monkeypatch):
+    """Для номера без файла сессии копия не создается, и пустой файл не появляется"""
+    path = str(tmp_path / "+200")
+    monkeypatch.setattr(tg_client_pool, "get_session_file_path", lambda phone: path)
+
+    assert load_session_copy("+200") is None
+    assert not os.path.exists(path + ".session")
+
+
+def test_pools_are_not_shared_after_fork(monkeypatch):
+    """Процесс после fork не получает пул родителя для того же event loop"""
+    async def run():
+        parent_pool = get_client_pool()
+        monkeypatch.setattr(tg_client_pool.os, "getpid", lambda: -1)
+        child_pool = get_client_pool()
+        return parent_pool, child_pool, get_client_pool()
+
+    parent_pool, child_pool, child_pool_again = asyncio.run(run())
+
+    assert child_pool is not parent_pool
+    assert child_pool_again is child_pool
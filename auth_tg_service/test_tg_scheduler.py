@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Тесты планировщика параллельного парсинга Telegram каналов
+"""
+
+import asyncio
+import sys
+import os
+
+import pytest
+from telethon.errors import FloodWaitError
+
+# Добавляем текущую директорию в путь
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from parsers import tg_scheduler
+from parsers.tg_scheduler import TelegramParseScheduler
+
+
+def channel(name):
+    return {"url": f"https://t.me/{name}", "category": "tech"}
+
+
+def run_scheduler(parse_channel, assignments, stealable=None, **kwargs):
+    scheduler = TelegramParseScheduler(parse_channel, session_concurrency=1, **kwargs)
+    results = asyncio.run(scheduler.run(assignments, stealable))
+    return scheduler, results
+
+
+@pytest.fixture(autouse=True)
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(tg_scheduler, "TG_IDLE_POLL_INTERVAL", 0.01)
+
+
+def test_flood_wait_pauses_session_and_retries_channel():
+    """FloodWait приостанавливает сессию, а канал после паузы парсит та же сессия"""
+    calls = []
+
+    async def parse_channel(phone, source):
+        calls.append((phone, source["url"]))
+        if len(calls) == 1:
+            raise FloodWaitError(request=None, capture=1)
+        return 5
+
+    scheduler, results = run_scheduler(parse_channel, {"+1": [channel("a")], "+2": []})
+
+    assert calls == [("+1", "https://t.me/a"), ("+1", "https://t.me/a")]
+    assert results["+1"] == {"https://t.me/a": 5}
+    assert scheduler.metrics["+1"]["flood_wait_seconds"] == 1
+    assert "+1" not in scheduler.retired
+
+
+def test_long_flood_wait_retires_session():
+    """Слишком долгий FloodWait выводит сессию из запуска, недоступный другим канал не парсится"""
+    async def parse_channel(phone, source):
+        raise FloodWaitError(request=None, capture=3600)
+
+    scheduler, results = run_scheduler(parse_channel, {"+1": [channel("a")], "+2": []}, max_flood_wait=60)
+
+    assert "+1" in scheduler.retired
+    assert results["+1"] == {"https://t.me/a": 0}
+    assert results["+2"] == {}
+
+
+def test_paused_session_channels_stolen_by_member_session():
+    """Каналы приостановленной сессии забирает сессия, у которой есть отметка этих каналов"""
+    calls = []
+
+    async def parse_channel(phone, source):
+        calls.append((phone, source["url"]))
+        if phone == "+1":
+            raise FloodWaitError(request=None, capture=30)
+        await asyncio.sleep(0.01)
+        return 1
+
+    stealable = {"https://t.me/a": {"+1", "+2"}, "https://t.me/b": {"+1", "+2"}}
+    scheduler, results = run_scheduler(
+        parse_channel, {"+1": [channel("a"), channel("b")], "+2": []}, stealable
+    )
+
+    assert results["+2"] == {"https://t.me/a": 1, "https://t.me/b": 1}
+    assert ("+2", "https://t.me/a") in calls and ("+2", "https://t.me/b") in calls
+
+
+def test_channels_without_mark_are_not_stolen():
+    """Канал, который сессия не парсила (нет отметки или доступа), ей не передается"""
+    calls = []
+
+    async def parse_channel(phone, source):
+        calls.append((phone, source["url"]))
+        await asyncio.sleep(0.01)
+        return 1
+
+    stealable = {"https://t.me/public": {"+1", "+2"}, "https://t.me/private": {"+1"}}
+    scheduler, results = run_scheduler(
+        parse_channel,
+        {"+1": [channel("slow"), channel("private"), channel("public")], "+2": []},
+        stealable
+    )
+
+    assert ("+2", "https://t.me/private") not in calls
+    assert ("+1", "https://t.me/private") in calls
+    assert ("+2", "https://t.me/public") in calls
+    assert sorted(url for session in results.values() for url in session) == [
+        "https://t.me/private", "https://t.me/public", "https://t.me/slow"
+    ]
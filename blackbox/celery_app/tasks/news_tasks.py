@@ -1,14 +1,18 @@
 from celery_app import app
-from usecases.daily_news import analyze_trend
+from usecases.daily_news import analyze_trend, analyze_trend_incremental
 from aiogram import Bot
 import os
 from dotenv import load_dotenv
 import asyncio
 import time
-from celery import current_task
+from celery import current_task, chord, group
 from datetime import datetime
-from database import get_subscribed_users, save_daily_news_digest, get_daily_news_digest
+from database import (
+    get_subscribed_users, save_daily_news_digest, save_digest_batch,
+    get_daily_news_digests, get_delivery_progress, save_delivery_progress
+)
 from utils.message_utils import split_analysis_message, split_digest_message, format_message_part
+from utils.telegram_delivery import TelegramDelivery, ChatDelivery, DeliveryItem
 from logger_config import setup_logger
 
 # Загружаем переменные окружения
@@ -24,12 +28,49 @@ async def send_all_messages(bot, chat_id, message_parts):
             await asyncio.sleep(0.5)
     await bot.session.close()
 
-async def send_tg_message(token, chat_id, text):
-    bot = Bot(token=token)
-    try:
-        await bot.send_message(chat_id, text)
-    finally:
-        await bot.session.close()
+def deliver_digests(token: str, date: str, chats: list) -> dict:
+    """
+    Рассылает дайджесты в одном event loop и сохраняет прогресс по каждому подписчику
+    
+    Args:
+        token: Токен Telegram бота
+        date: Дата рассылки в формате YYYY-MM-DD
+        chats: Список ChatDelivery (ключ DeliveryItem - категория)
+    """
+    async def on_progress(chat_id, item, parts_sent, status):
+        # Запись в MongoDB синхронная, поэтому выполняется вне event loop
+        await asyncio.to_thread(
+            save_delivery_progress, date, chat_id, item.key, parts_sent, len(item.parts), status, item.content_hash
+        )
+
+    delivery = TelegramDelivery(token=token, on_progress=on_progress)
+    return asyncio.run(delivery.deliver(chats))
+
+def render_digests(categories: set, date: str) -> dict:
+    """
+    Загружает дайджесты категорий одним запросом и разбивает их на части сообщений
+    
+    Результат общий для всех подписчиков категории, поэтому каждый дайджест
+    запрашивается и разбивается один раз за рассылку.
+    
+    Args:
+        categories: Категории, на которые есть подписчики
+        date: Дата дайджестов в формате YYYY-MM-DD
+        
+    Returns:
+        dict: Готовые части сообщения по ключу (category, date); пустые дайджесты пропускаются
+    """
+    digests = get_daily_news_digests(list(categories), date)
+    rendered = {}
+    for category, digest_text in digests.items():
+        if not digest_text.strip():
+            continue
+        rendered[(category, date)] = split_digest_message(
+            digest_text=digest_text,
+            date=date,
+            total_materials=0
+        )
+    return rendered
 
 @app.task(bind=True, name='celery_app.tasks.news_tasks.analyze_news_task')
 def analyze_news_task(self, category: str, analysis_date: str, chat_id: int = None) -> dict:
@@ -109,10 +150,83 @@ def analyze_news_task(self, category: str, analysis_date: str, chat_id: int = No
             'message': error_message
         }
 
+@app.task(bind=True, name='celery_app.tasks.news_tasks.generate_category_digest', max_retries=3, default_retry_delay=120)
+def generate_category_digest(self, category: str, digest_date: str, incremental: bool = True) -> dict:
+    """
+    Генерирует и сохраняет дайджест одной категории (подзадача generate_daily_digests)
+    
+    При исключении или ошибке LLM задача повторяется; после исчерпания попыток сохраняется
+    дайджест с текстом ошибки, а задача завершается успешно, чтобы не блокировать callback
+    всей группы. Если материалов за период нет, дайджест сохраняется сразу, без повторов.
+    
+    Args:
+        category: Категория для анализа
+        digest_date: Дата дайджеста в формате YYYY-MM-DD
+        incremental: Анализировать только новые материалы (см. generate_daily_digests)
+    """
+    start_time = time.time()
+    logger.info(f"Анализ категории {category} (попытка {self.request.retries + 1})")
+    try:
+        # Для автоматических дайджестов используем данные за последние 24 часа
+        if incremental:
+            result = analyze_trend_incremental(category=category, digest_date=digest_date)
+        else:
+            result = analyze_trend(category=category)
+        if result['status'] != 'success' and result.get('no_materials'):
+            save_daily_news_digest(category, digest_date, f"📌 Категория: {category}\n❌ Ошибка: {result['message']}\n")
+            logger.info(f"Материалов категории {category} нет, дайджест сохранен без повторов")
+            return {'category': category, 'status': result['status'], 'message': result['message']}
+        # Анализ и LLM сообщают об ошибке статусом или текстом, а не исключением: без этого
+        # повторы не запускаются, а текст ошибки сохраняется как дайджест дня
+        if result['status'] != 'success':
+            raise RuntimeError(result['message'])
+        if result['analysis'].startswith("Ошибка при анализе"):
+            raise RuntimeError(result['analysis'])
+        digest_text = (
+            f"📌 Категория: {category}\n"
+            f"📊 Материалов: {result['materials_count']}\n"
+            f"📝 Анализ:\n{result['analysis']}\n"
+        )
+        save_daily_news_digest(category, digest_date, digest_text)
+        execution_time = time.time() - start_time
+        logger.info(f"Дайджест категории {category} сохранен за {execution_time:.2f} секунд")
+        return {'category': category, 'status': 'success', 'execution_time': execution_time}
+    except Exception as e:
+        logger.error(f"Ошибка при анализе категории {category}: {str(e)}")
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=e)
+        save_daily_news_digest(category, digest_date, f"📌 Категория: {category}\n❌ Ошибка: {str(e)}\n")
+        return {'category': category, 'status': 'error', 'message': str(e)}
+
+@app.task(bind=True, name='celery_app.tasks.news_tasks.record_digest_batch')
+def record_digest_batch(self, results: list, digest_date: str, started_at: float) -> dict:
+    """
+    Callback группы generate_category_digest: фиксирует итоги генерации дайджестов
+    
+    Args:
+        results: Результаты подзадач по категориям
+        digest_date: Дата дайджеста в формате YYYY-MM-DD
+        started_at: Время запуска generate_daily_digests (timestamp)
+    """
+    failed = [result['category'] for result in results if result.get('status') != 'success']
+    execution_time = time.time() - started_at
+    save_digest_batch(digest_date, results, execution_time)
+    logger.info(f"=== Генерация дайджестов завершена за {execution_time:.2f} секунд: категорий {len(results)}, с ошибками {len(failed)} ===")
+    if failed:
+        logger.warning(f"Категории с ошибками: {failed}")
+    return {'status': 'success', 'categories_count': len(results), 'failed_categories': failed}
+
 @app.task(bind=True, name='celery_app.tasks.news_tasks.generate_daily_digests')
-def generate_daily_digests(self):
+def generate_daily_digests(self, incremental: bool = True):
     """
     Генерирует и сохраняет дайджесты по всем уникальным категориям подписчиков (без рассылки)
+    
+    Каждая категория обрабатывается отдельной подзадачей generate_category_digest,
+    подзадачи выполняются параллельно на воркерах, итог фиксирует record_digest_batch.
+    
+    Args:
+        incremental: Анализировать только материалы, появившиеся после прошлого запуска за эту дату,
+            и заново выполнять только финальную свертку. False - полный пересчет
     """
     logger.info("=== Начало выполнения задачи generate_daily_digests ===")
     start_time = time.time()
@@ -125,27 +239,20 @@ def generate_daily_digests(self):
         all_categories = set()
         for sub in subscribers:
             all_categories.update(sub.get('categories', []))
+        if not all_categories:
+            logger.info("У подписчиков нет выбранных категорий")
+            return {'status': 'success', 'categories_count': 0}
         logger.info(f"Уникальных категорий для анализа: {len(all_categories)}: {all_categories}")
-        for category in all_categories:
-            logger.info(f"Анализ категории {category}")
-            try:
-                # Для автоматических дайджестов используем данные за последние 24 часа
-                result = analyze_trend(category=category)
-                if result['status'] == 'success':
-                    digest_text = (
-                        f"📌 Категория: {category}\n"
-                        f"📊 Материалов: {result['materials_count']}\n"
-                        f"📝 Анализ:\n{result['analysis']}\n"
-                    )
-                else:
-                    digest_text = f"📌 Категория: {category}\n❌ Ошибка: {result['message']}\n"
-                save_daily_news_digest(category, current_date, digest_text)
-            except Exception as e:
-                logger.error(f"Ошибка при анализе категории {category}: {str(e)}")
-                save_daily_news_digest(category, current_date, f"📌 Категория: {category}\n❌ Ошибка: {str(e)}\n")
-        execution_time = time.time() - start_time
-        logger.info(f"=== Генерация дайджестов завершена за {execution_time:.2f} секунд ===")
-        return {'status': 'success', 'categories_count': len(all_categories)}
+        
+        # Одна подзадача на категорию, callback выполнится после завершения всех подзадач
+        header = group(
+            generate_category_digest.s(category, current_date, incremental)
+            for category in sorted(all_categories)
+        )
+        chord_result = chord(header)(record_digest_batch.s(current_date, start_time))
+        
+        logger.info(f"Запущено {len(all_categories)} подзадач генерации дайджестов (callback: {chord_result.id})")
+        return {'status': 'started', 'categories_count': len(all_categories), 'callback_id': chord_result.id}
     except Exception as e:
         error_message = f"❌ Произошла ошибка при генерации дайджестов: {str(e)}"
         logger.error(error_message)
@@ -174,6 +281,14 @@ def send_daily_news(self):
         if not subscribers:
             logger.info("Нет подписчиков для отправки новостей")
             return {'status': 'success', 'message': 'No subscribers found'}
+        # Части, доставленные в прерванном запуске, повторно не отправляются
+        progress = get_delivery_progress(current_date)
+        rendered = render_digests(
+            {category for subscriber in subscribers for category in subscriber.get('categories', [])},
+            current_date
+        )
+        logger.info(f"Подготовлено дайджестов для рассылки: {len(rendered)}")
+        chats = []
         for subscriber in subscribers:
             subscription_id = subscriber['subscription_id']
             subscription_type = subscriber.get('subscription_type', 'user')
@@ -182,24 +297,22 @@ def send_daily_news(self):
                 logger.info(f"У подписчика {subscription_id} нет выбранных категорий")
                 continue
             logger.info(f"Рассылка подписчику {subscription_id} (тип: {subscription_type}) по категориям: {categories}")
+            chat = ChatDelivery(chat_id=subscription_id)
             for category in categories:
-                cat_digest = get_daily_news_digest(category, current_date)
-                if not cat_digest.strip():
+                message_parts = rendered.get((category, current_date))
+                if not message_parts:
                     continue
-                message_parts = split_digest_message(
-                    digest_text=cat_digest,
-                    date=current_date,
-                    total_materials=0
-                )
-                for part in message_parts:
-                    try:
-                        asyncio.run(send_tg_message(os.getenv("TELEGRAM_BOT_TOKEN"), subscription_id, part))
-                        logger.info(f"Дайджест по категории {category} успешно отправлен подписчику {subscription_id} (тип: {subscription_type}) ({len(message_parts)} частей)")
-                    except Exception as e:
-                        logger.error(f"Ошибка при отправке дайджеста подписчику {subscription_id} (тип: {subscription_type}): {e}")
+                item = DeliveryItem(key=category, parts=message_parts)
+                # Если дайджест изменился после прерванного запуска, он отправляется заново
+                item.resume_from(*progress.get((subscription_id, category), (0, None)))
+                chat.items.append(item)
+            if chat.items:
+                chats.append(chat)
+        stats = deliver_digests(os.getenv("TELEGRAM_BOT_TOKEN"), current_date, chats)
+        logger.info(f"Доставлено дайджестов: {stats['delivered']}, уже были доставлены: {stats['skipped']}, ошибок: {stats['failed']}")
         execution_time = time.time() - start_time
         logger.info(f"=== Воркер {worker_num} (PID: {process_id}) завершил рассылку ежедневных новостей за {execution_time:.2f} секунд ===")
-        return {'status': 'success', 'subscribers_count': len(subscribers)}
+        return {'status': 'success', 'subscribers_count': len(subscribers), **stats}
     except Exception as e:
         error_message = f"❌ Произошла ошибка при рассылке ежедневных новостей: {str(e)}"
         logger.error(error_message)
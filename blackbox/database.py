@@ -1,6 +1,7 @@
 from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure
 import os
+import hashlib
 from dotenv import load_dotenv
 from datetime import datetime
 from typing import Optional, List, Dict, Any
@@ -48,6 +49,14 @@ db.sources.create_index([("url", 1), ("type", 1)], unique=True)
 # Создаем индексы для таблицы daily_news
 db.daily_news.create_index([("category", 1), ("date", 1)], unique=True)
 
+# Создаем индексы для частичных анализов дайджестов (хранятся 3 дня)
+db.daily_digest_partials.create_index([("category", 1), ("date", 1), ("materials_key", 1)], unique=True)
+db.daily_digest_partials.create_index("created_at", expireAfterSeconds=3 * 24 * 3600)
+
+# Создаем индексы для состояния рассылки дайджестов (хранится 7 дней)
+db.daily_news_deliveries.create_index([("date", 1), ("subscription_id", 1), ("category", 1)], unique=True)
+db.daily_news_deliveries.create_index("updated_at", expireAfterSeconds=7 * 24 * 3600)
+
 def save_source(source: Dict[str, Any]) -> bool:
     """
     Сохраняет данные в базу данных
@@ -301,6 +310,29 @@ def save_daily_news_digest(category: str, date: str, digest_text: str) -> bool:
         logger.error(f"Ошибка при сохранении дайджеста: {str(e)}")
         return False
 
+def save_digest_batch(date: str, results: List[Dict[str, Any]], execution_time: float) -> bool:
+    """
+    Сохраняет итоги генерации дайджестов за дату в коллекцию digest_batches
+    """
+    try:
+        db.digest_batches.update_one(
+            {"date": date},
+            {"$set": {
+                "date": date,
+                "results": results,
+                "categories_count": len(results),
+                "failed_categories": [r.get("category") for r in results if r.get("status") != "success"],
+                "execution_time": execution_time,
+                "updated_at": datetime.utcnow()
+            }},
+            upsert=True
+        )
+        logger.info(f"Итоги генерации дайджестов сохранены: {date}")
+        return True
+    except Exception as e:
+        logger.error(f"Ошибка при сохранении итогов генерации дайджестов: {str(e)}")
+        return False
+
 def get_daily_news_digest(category: str, date: str) -> str:
     """
     Получает дайджест новостей по категории и дате из коллекции daily_news
@@ -312,4 +344,133 @@ def get_daily_news_digest(category: str, date: str) -> str:
         return ""
     except Exception as e:
         logger.error(f"Ошибка при получении дайджеста: {str(e)}")
-        return ""
\ No newline at end of file
+        return ""
+
+def get_daily_news_digests(categories: List[str], date: str) -> Dict[str, str]:
+    """
+    Получает дайджесты нескольких категорий за дату одним запросом
+    
+    Args:
+        categories: Список категорий
+        date: Дата дайджеста в формате YYYY-MM-DD
+        
+    Returns:
+        Dict[str, str]: Текст дайджеста по категории (только найденные)
+    """
+    try:
+        docs = db.daily_news.find(
+            {"category": {"$in": list(categories)}, "date": date},
+            {"_id": 0, "category": 1, "digest": 1}
+        )
+        return {doc["category"]: doc.get("digest", "") for doc in docs}
+    except Exception as e:
+        logger.error(f"Ошибка при получении дайджестов: {str(e)}")
+        return {}
+
+def get_delivery_progress(date: str) -> Dict[tuple, tuple]:
+    """
+    Получает количество уже доставленных частей дайджестов за дату
+    
+    Args:
+        date: Дата рассылки в формате YYYY-MM-DD
+        
+    Returns:
+        Dict[tuple, tuple]: (количество доставленных частей, хэш частей сообщения)
+            по (subscription_id, category)
+    """
+    try:
+        docs = db.daily_news_deliveries.find(
+            {"date": date},
+            {"_id": 0, "subscription_id": 1, "category": 1, "parts_sent": 1, "content_hash": 1}
+        )
+        return {
+            (doc["subscription_id"], doc["category"]): (doc.get("parts_sent", 0), doc.get("content_hash"))
+            for doc in docs
+        }
+    except Exception as e:
+        logger.error(f"Ошибка при получении состояния рассылки: {str(e)}")
+        return {}
+
+def save_delivery_progress(
+    date: str,
+    subscription_id: int,
+    category: str,
+    parts_sent: int,
+    total_parts: int,
+    status: str,
+    content_hash: Optional[str] = None
+) -> bool:
+    """
+    Сохраняет прогресс доставки дайджеста подписчику
+    
+    Args:
+        date: Дата рассылки в формате YYYY-MM-DD
+        subscription_id: ID подписчика (пользователя или группы)
+        category: Категория дайджеста
+        parts_sent: Количество доставленных частей
+        total_parts: Общее количество частей
+        status: Статус доставки (sending, delivered, failed)
+        content_hash: Хэш частей сообщения, к которым относится прогресс
+    """
+    try:
+        db.daily_news_deliveries.update_one(
+            {"date": date, "subscription_id": subscription_id, "category": category},
+            {"$set": {
+                "parts_sent": parts_sent,
+                "total_parts": total_parts,
+                "content_hash": content_hash,
+                "status": status,
+                "updated_at": datetime.utcnow()
+            }},
+            upsert=True
+        )
+        return True
+    except Exception as e:
+        logger.error(f"Ошибка при сохранении прогресса рассылки: {str(e)}")
+        return False
+
+def save_digest_partial(category: str, date: str, material_ids: List[str], analysis: str) -> bool:
+    """
+    Сохраняет анализ чанка материалов для инкрементального формирования дайджеста
+    
+    Args:
+        category: Категория
+        date: Дата дайджеста в формате YYYY-MM-DD
+        material_ids: ID материалов, которые покрывает анализ
+        analysis: Текст анализа чанка
+    """
+    try:
+        material_ids = sorted(material_ids)
+        materials_key = hashlib.sha256("\n".join(material_ids).encode("utf-8")).hexdigest()
+        db.daily_digest_partials.update_one(
+            {"category": category, "date": date, "materials_key": materials_key},
+            {"$set": {
+                "category": category,
+                "date": date,
+                "materials_key": materials_key,
+                "material_ids": material_ids,
+                "analysis": analysis,
+                "created_at": datetime.utcnow()
+            }},
+            upsert=True
+        )
+        return True
+    except Exception as e:
+        logger.error(f"Ошибка при сохранении частичного анализа дайджеста: {str(e)}")
+        return False
+
+def get_digest_partials(category: str, date: str) -> List[Dict[str, Any]]:
+    """
+    Получает сохраненные анализы чанков дайджеста по категории и дате
+    
+    Returns:
+        List[Dict[str, Any]]: Анализы в порядке сохранения (material_ids, analysis)
+    """
+    try:
+        return list(db.daily_digest_partials.find(
+            {"category": category, "date": date},
+            {"_id": 0, "material_ids": 1, "analysis": 1}
+        ).sort("created_at", 1))
+    except Exception as e:
+        logger.error(f"Ошибка при получении частичных анализов дайджеста: {str(e)}")
+        return []
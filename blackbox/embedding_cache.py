@@ -0,0 +1,166 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+import numpy as np
+from dotenv import load_dotenv
+from logger_config import setup_logger
+
+# Загружаем переменные окружения
+load_dotenv()
+
+# Настраиваем логгер
+logger = setup_logger("embedding_cache")
+
+# Путь к файлу кэша (по умолчанию рядом с модулем, а не в текущей директории)
+# и максимальное количество хранимых эмбеддингов
+EMBEDDING_CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "embeddings.sqlite3")
+)
+EMBEDDING_CACHE_MAX_ITEMS = int(os.getenv("EMBEDDING_CACHE_MAX_ITEMS", "200000"))
+
+# SQLite ограничивает количество параметров в одном запросе
+SQLITE_MAX_VARIABLES = 900
+
+
+def content_hash(text: str) -> str:
+    """
+    Хэш содержимого текста для ключа кэша
+
+    Args:
+        text: Текст
+
+    Returns:
+        str: SHA-256 в hex
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Постоянный кэш эмбеддингов по ключу (модель, хэш текста) на SQLite"""
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_items: int = EMBEDDING_CACHE_MAX_ITEMS):
+        """
+        Инициализация кэша эмбеддингов
+
+        Args:
+            path: Путь к файлу SQLite
+            max_items: Максимальное количество эмбеддингов, после которого
+                вытесняются давно не использованные записи
+        """
+        self.path = path
+        self.max_items = max_items
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        """Ленивое подключение к SQLite (после fork у каждого процесса свое)"""
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory, exist_ok=True)
+
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            # WAL позволяет нескольким воркерам читать кэш параллельно с записью
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    model TEXT NOT NULL,
+                    hash TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (model, hash)
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+            self._conn.commit()
+        return self._conn
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Пакетный поиск эмбеддингов в кэше
+
+        Args:
+            model: Название модели эмбеддингов
+            hashes: Хэши текстов
+
+        Returns:
+            Dict[str, np.ndarray]: Найденные эмбеддинги по хэшу
+        """
+        found = {}
+        unique_hashes = list(dict.fromkeys(hashes))
+        if not unique_hashes:
+            return found
+
+        try:
+            with self._lock:
+                conn = self._connect()
+                for start in range(0, len(unique_hashes), SQLITE_MAX_VARIABLES):
+                    part = unique_hashes[start:start + SQLITE_MAX_VARIABLES]
+                    placeholders = ",".join("?" * len(part))
+                    rows = conn.execute(
+                        f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({placeholders})",
+                        [model, *part]
+                    ).fetchall()
+                    for key, blob in rows:
+                        found[key] = np.frombuffer(blob, dtype=np.float32)
+
+                # Обновляем время использования для вытеснения по LRU
+                if found:
+                    now = time.time()
+                    conn.executemany(
+                        "UPDATE embeddings SET last_used = ? WHERE model = ? AND hash = ?",
+                        [(now, model, key) for key in found]
+                    )
+                    conn.commit()
+        except Exception as e:
+            logger.warning(f"Ошибка чтения кэша эмбеддингов: {str(e)}")
+
+        return found
+
+    def put_many(self, model: str, items: Dict[str, np.ndarray]) -> None:
+        """
+        Пакетное сохранение эмбеддингов в кэш
+
+        Args:
+            model: Название модели эмбеддингов
+            items: Эмбеддинги по хэшу текста
+        """
+        if not items:
+            return
+
+        try:
+            with self._lock:
+                conn = self._connect()
+                now = time.time()
+                conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (model, hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                    [
+                        (model, key, np.asarray(vector, dtype=np.float32).tobytes(), now)
+                        for key, vector in items.items()
+                    ]
+                )
+                conn.commit()
+                self._evict(conn)
+        except Exception as e:
+            logger.warning(f"Ошибка записи в кэш эмбеддингов: {str(e)}")
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        """Удаляет давно не использованные эмбеддинги сверх лимита"""
+        total = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = total - self.max_items
+        if excess <= 0:
+            return
+
+        conn.execute(
+            "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+            (excess,)
+        )
+        conn.commit()
+        logger.info(f"Из кэша эмбеддингов вытеснено {excess} записей")
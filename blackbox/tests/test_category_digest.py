@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Тесты повторов генерации дайджеста одной категории
+"""
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import importlib
+from types import ModuleType
+
+import pytest
+
+
+@pytest.fixture
+def task(monkeypatch):
+    """Задача generate_category_digest с дайджестами в памяти вместо MongoDB"""
+    if "celery_app.tasks.news_tasks" not in sys.modules:
+        database = ModuleType("database")
+        for name in (
+            "get_subscribed_users", "save_daily_news_digest", "save_digest_batch", "get_daily_news_digests",
+            "get_delivery_progress", "save_delivery_progress", "get_digest_partials", "save_digest_partial"
+        ):
+            setattr(database, name, lambda *args, **kwargs: None)
+        # Настоящий модуль database подключается к MongoDB при импорте
+        monkeypatch.setitem(sys.modules, "database", database)
+        monkeypatch.delitem(sys.modules, "usecases.daily_news", raising=False)
+    task = importlib.import_module("celery_app.tasks.news_tasks").generate_category_digest
+
+    # Celery регистрирует задачу один раз, поэтому подменяем глобальные имена ее модуля
+    task.digests = {}
+    monkeypatch.setitem(
+        task.run.__globals__, "save_daily_news_digest",
+        lambda category, date, text: task.digests.__setitem__(category, text)
+    )
+    return task
+
+
+def generate(task, monkeypatch, result):
+    monkeypatch.setitem(task.run.__globals__, "analyze_trend_incremental", lambda **kwargs: result)
+    return task.run("AI", "2026-10-17")
+
+
+def test_no_materials_is_saved_without_retry(task, monkeypatch):
+    """Категория без материалов не повторяется и сразу получает дайджест"""
+    result = generate(task, monkeypatch, {
+        'status': 'error', 'message': 'Не найдено материалов за последние 24 часа', 'no_materials': True
+    })
+
+    assert result['status'] == 'error'
+    assert "Не найдено материалов" in task.digests["AI"]
+
+
+def test_analysis_error_is_retried(task, monkeypatch):
+    """Ошибка анализа запускает повтор, дайджест с ошибкой пока не сохраняется"""
+    # Вне воркера self.retry пробрасывает исходное исключение
+    with pytest.raises(RuntimeError, match="Qdrant"):
+        generate(task, monkeypatch, {'status': 'error', 'message': 'Qdrant недоступен'})
+
+    assert task.digests == {}
+
+
+def test_llm_error_is_retried(task, monkeypatch):
+    """Текст ошибки LLM не сохраняется как дайджест, задача повторяется"""
+    with pytest.raises(RuntimeError, match="Ошибка при анализе"):
+        generate(task, monkeypatch, {
+            'status': 'success', 'analysis': 'Ошибка при анализе: таймаут', 'materials_count': 3
+        })
+
+    assert task.digests == {}
+
+
+def test_success_is_saved(task, monkeypatch):
+    """Успешный анализ сохраняется как дайджест категории"""
+    result = generate(task, monkeypatch, {'status': 'success', 'analysis': 'сводка', 'materials_count': 3})
+
+    assert result['status'] == 'success'
+    assert "сводка" in task.digests["AI"]
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Тесты схлопывания почти одинаковых материалов (MinHash + LSH)
+"""
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+from utils.dedup import (
+    minhash_signatures, cluster_near_duplicates, collapse_near_duplicates, material_prompt_text,
+    SOURCE_COUNT_NOTE
+)
+
+NEWS = (
+    "OpenAI представила новую модель для генерации видео по текстовому описанию. "
+    "Модель создает ролики длиной до минуты и доступна пока только исследователям, "
+    "а компания обещает открыть доступ разработчикам после проверки безопасности."
+)
+REPOST = "🔥 " + NEWS.upper() + " Подписывайтесь на канал!"
+OTHER = (
+    "Центральный банк сохранил ключевую ставку на прежнем уровне и заявил, что "
+    "инфляция замедляется быстрее прогноза, но риски для экономики остаются высокими."
+)
+
+
+def jaccard_estimate(first: str, second: str) -> float:
+    signatures = minhash_signatures([first, second])
+    return float(np.mean(signatures[0] == signatures[1]))
+
+
+def test_signature_similarity_tracks_text_overlap():
+    """Сигнатуры репоста совпадают почти полностью, у разных новостей - почти нет"""
+    assert jaccard_estimate(NEWS, NEWS) == 1.0
+    assert jaccard_estimate(NEWS, REPOST) > 0.8
+    assert jaccard_estimate(NEWS, OTHER) < 0.1
+
+
+def test_signatures_are_reproducible():
+    """Одинаковый текст дает одинаковую сигнатуру в разных вызовах"""
+    assert (minhash_signatures([NEWS]) == minhash_signatures([NEWS])).all()
+
+
+def test_empty_texts_are_not_grouped():
+    """Пустые тексты не считаются дубликатами друг друга"""
+    assert cluster_near_duplicates(["", "", NEWS]) == [0, 1, 2]
+
+
+def test_clusters_are_transitive():
+    """Группа объединяет цепочку похожих текстов и указывает на первый из них"""
+    words = NEWS.split()
+    edited = " ".join(words[:-2] + ["разработчикам", "позже."])
+    groups = cluster_near_duplicates([OTHER, NEWS, REPOST, edited])
+
+    assert groups == [0, 1, 1, 1]
+
+
+def test_collapse_keeps_first_and_counts_sources():
+    """Остается самый релевантный материал, количество источников сохраняется в source_count"""
+    materials = [
+        {"text": NEWS, "url": "https://t.me/a/1"},
+        {"text": OTHER, "url": "https://t.me/b/1"},
+        {"text": REPOST, "url": "https://t.me/c/1"},
+    ]
+
+    collapsed = collapse_near_duplicates(materials)
+
+    assert [material["url"] for material in collapsed] == ["https://t.me/a/1", "https://t.me/b/1"]
+    assert collapsed[0]["text"] == NEWS
+    assert collapsed[0]["source_count"] == 2
+    assert "source_count" not in collapsed[1]
+    # Исходные материалы не изменяются
+    assert "source_count" not in materials[0]
+
+
+def test_prompt_text_notes_source_count():
+    """В промпт количество источников попадает только для новостей из нескольких источников"""
+    assert material_prompt_text({"text": NEWS}) == NEWS
+    assert material_prompt_text({"text": NEWS, "source_count": 3}) == NEWS + "\n" + SOURCE_COUNT_NOTE.format(count=3)
+
+
+def test_batched_signatures_match_per_text():
+    """Сигнатуры, посчитанные пачкой, совпадают с посчитанными для каждого текста отдельно"""
+    texts = [NEWS, "", OTHER, REPOST, "одно"] * 50
+
+    batched = minhash_signatures(texts)
+
+    assert all((batched[row] == minhash_signatures([text])[0]).all() for row, text in enumerate(texts))
+
+
+def test_representative_does_not_depend_on_order():
+    """Представитель группы - самый ранний материал, в каком бы порядке ни пришла выдача"""
+    materials = [
+        {"id": "b", "date": "2026-10-17", "text": REPOST},
+        {"id": "c", "date": "2026-10-16", "text": NEWS},
+        {"id": "a", "date": "2026-10-17", "text": NEWS},
+    ]
+
+    for ordered in (materials, materials[::-1], materials[1:] + materials[:1]):
+        assert [material["id"] for material in collapse_near_duplicates(ordered)] == ["c"]
+
+
+def test_collapse_scales_to_large_batches():
+    """Тысячи материалов с повторами схлопываются без сравнения всех пар"""
+    rng = np.random.default_rng(0)
+    vocabulary = [f"слово{index}" for index in range(5000)]
+    base = [" ".join(rng.choice(vocabulary, size=60)) for _ in range(300)]
+    materials = [{"text": text, "url": str(index)} for index, text in enumerate(base * 4)]
+
+    collapsed = collapse_near_duplicates(materials)
+
+    assert len(collapsed) == 300
+    assert all(material["source_count"] == 4 for material in collapsed)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Тесты инкрементального формирования дайджеста: повторное использование анализов чанков
+"""
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import importlib
+from types import ModuleType
+
+import pytest
+
+CHUNK_SIZE = 2
+# Каждый материал - 10 токенов; в один промпт (80% контекста) помещается только один
+MATERIAL_TOKENS = 10
+MAX_CONTEXT_SIZE = 20
+
+
+class FakeLLM:
+    """LLM, запоминающий материалы, которые ему передавали на анализ чанков"""
+
+    def __init__(self):
+        self.analyzed = []
+        self.final_calls = 0
+
+    def get_max_context_size(self) -> int:
+        return MAX_CONTEXT_SIZE
+
+    def analyze_text(self, prompt: str, query: str) -> dict:
+        if "Analyze the following materials" in prompt:
+            self.analyzed.extend(query.split("\n"))
+            return {"analysis": "анализ: " + ", ".join(query.split("\n"))}
+        self.final_calls += 1
+        return {"analysis": "итоговая сводка"}
+
+
+@pytest.fixture
+def daily_news(monkeypatch):
+    """Модуль daily_news с частичными анализами в памяти вместо MongoDB"""
+    partials = []
+    database = ModuleType("database")
+
+    def get_digest_partials(category, date):
+        return [partial for partial in partials if partial["category"] == category and partial["date"] == date]
+
+    def save_digest_partial(category, date, material_ids, analysis):
+        partials.append({"category": category, "date": date, "material_ids": sorted(material_ids), "analysis": analysis})
+        return True
+
+    database.get_digest_partials = get_digest_partials
+    database.save_digest_partial = save_digest_partial
+    # Настоящий модуль database подключается к MongoDB при импорте
+    monkeypatch.setitem(sys.modules, "database", database)
+    monkeypatch.delitem(sys.modules, "usecases.daily_news", raising=False)
+    module = importlib.import_module("usecases.daily_news")
+
+    llm = FakeLLM()
+    materials = {}
+    monkeypatch.setattr(module, "get_llm_client", lambda: llm)
+    monkeypatch.setattr(module, "VectorStore", lambda **kwargs: None)
+    monkeypatch.setattr(module, "_fetch_recent_materials", lambda store, category, date: list(materials["current"]))
+    monkeypatch.setattr(
+        module, "_create_context_aware_chunks",
+        lambda items, size: [items[index:index + CHUNK_SIZE] for index in range(0, len(items), CHUNK_SIZE)]
+    )
+    monkeypatch.setattr(module, "count_tokens", lambda text: len(text.split()))
+    monkeypatch.setattr(module, "count_material_tokens", lambda items: [MATERIAL_TOKENS] * len(items))
+
+    module.fake = {"llm": llm, "materials": materials, "partials": partials}
+    yield module
+    sys.modules.pop("usecases.daily_news", None)
+
+
+def material(index):
+    return {"id": f"m{index}", "text": f"новость{index}", "url": f"https://example.com/{index}"}
+
+
+def run(daily_news, indexes):
+    daily_news.fake["materials"]["current"] = [material(index) for index in indexes]
+    daily_news.fake["llm"].analyzed.clear()
+    return daily_news.analyze_trend_incremental(category="AI", digest_date="2026-10-17")
+
+
+def test_second_run_analyzes_only_new_materials(daily_news):
+    """Повторный запуск анализирует только новые материалы, сохраненные анализы переиспользуются"""
+    first = run(daily_news, range(4))
+    assert first["status"] == "success"
+    assert daily_news.fake["llm"].analyzed == [f"новость{index}" for index in range(4)]
+
+    second = run(daily_news, range(5))
+
+    assert second["status"] == "success"
+    assert second["new_materials_count"] == 1
+    assert daily_news.fake["llm"].analyzed == ["новость4"]
+    assert second["chunks_count"] == 3
+
+
+def test_partial_with_dropped_material_is_recomputed(daily_news):
+    """Анализ чанка, материал которого выпал из выборки, не используется"""
+    run(daily_news, range(4))
+
+    result = run(daily_news, [0, 2, 3])
+
+    # Чанк (m2, m3) переиспользуется, из чанка (m0, m1) заново анализируется только m0
+    assert daily_news.fake["llm"].analyzed == ["новость0"]
+    assert result["new_materials_count"] == 1
+
+
+def test_failed_chunk_analysis_is_not_saved(daily_news):
+    """Ошибка LLM не сохраняется как анализ чанка"""
+    llm = daily_news.fake["llm"]
+    llm.analyze_text_original = llm.analyze_text
+    llm.analyze_text = lambda prompt, query: (
+        {"analysis": "Ошибка при анализе: таймаут"} if "Analyze the following materials" in prompt
+        else llm.analyze_text_original(prompt, query)
+    )
+
+    run(daily_news, range(2))
+
+    assert daily_news.fake["partials"] == []
+
+
+def test_materials_fitting_one_prompt_are_analyzed_in_one_pass(daily_news):
+    """Материалы, помещающиеся в один промпт, анализируются одним запросом без частичных анализов"""
+    result = run(daily_news, range(1))
+
+    assert result["status"] == "success"
+    assert result["chunks_count"] == 1
+    assert daily_news.fake["llm"].analyzed == ["новость0"]
+    assert daily_news.fake["partials"] == []
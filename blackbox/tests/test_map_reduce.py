@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Тесты параллельного map-reduce анализа чанков
+"""
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import threading
+import time
+
+from utils.map_reduce import parallel_map, analyze_chunks, collapse_summaries, REDUCE_CONTEXT_RATIO
+
+
+def count_words(text: str) -> int:
+    return len(text.split())
+
+
+class FakeLLM:
+    """LLM, который сворачивает анализы в первое слово каждого из них"""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.calls = 0
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def analyze_text(self, prompt: str, query: str) -> dict:
+        with self._lock:
+            self.calls += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        return {"analysis": " ".join(line.split()[0] for line in query.split("\n") if line.split())}
+
+
+def test_parallel_map_keeps_order_and_limits_workers():
+    """Результаты идут в порядке элементов, одновременно выполняется не больше max_workers вызовов"""
+    llm = FakeLLM(delay=0.05)
+
+    results = parallel_map(lambda item: (llm.analyze_text("", "x"), item)[1], list(range(8)), max_workers=3)
+
+    assert results == list(range(8))
+    assert llm.max_active == 3
+
+
+def test_analyze_chunks_runs_concurrently():
+    """Чанки анализируются параллельно, анализы возвращаются в порядке чанков"""
+    llm = FakeLLM(delay=0.1)
+    chunks = [[{"text": f"новость{index} подробности"}] for index in range(4)]
+
+    started = time.monotonic()
+    analyses = analyze_chunks(
+        llm, chunks,
+        build_prompt=lambda chunk: "prompt",
+        build_query=lambda chunk: "\n".join(material["text"] for material in chunk),
+        max_workers=4
+    )
+
+    assert analyses == ["новость0", "новость1", "новость2", "новость3"]
+    assert time.monotonic() - started < 0.3
+
+
+def test_collapse_skips_llm_when_summaries_fit():
+    """Анализы, помещающиеся в reduce-промпт, не сворачиваются"""
+    llm = FakeLLM()
+    summaries = ["короткий анализ"] * 5
+
+    assert collapse_summaries(llm, summaries, 1000, count_words, topic="AI") == summaries
+    assert llm.calls == 0
+
+
+def test_collapse_merges_until_budget():
+    """Свертка идет уровнями, пока общий объем не уложится в долю контекста"""
+    llm = FakeLLM()
+    summaries = [" ".join([f"событие{index}"] * 20) for index in range(30)]
+    max_context_size = 100
+
+    collapsed = collapse_summaries(llm, summaries, max_context_size, count_words, topic="AI", max_workers=4)
+
+    assert sum(count_words(summary) for summary in collapsed) <= max_context_size * REDUCE_CONTEXT_RATIO
+    assert 1 <= len(collapsed) < len(summaries)
+    assert llm.calls >= 2
+
+
+def test_collapse_stops_on_oversized_summaries():
+    """Если каждый анализ больше бюджета, свертка не зацикливается"""
+    llm = FakeLLM()
+    summaries = [" ".join(["слово"] * 100)] * 3
+
+    assert collapse_summaries(llm, summaries, 100, count_words, topic="AI") == summaries
+    assert llm.calls == 0
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Тест детерминированных ID точек в Qdrant
+"""
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+from vector_store import normalize_url, make_point_id
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("HTTPS://Example.com/news/1/", "https://example.com/news/1"),
+    ("https://example.com/news/1#comments", "https://example.com/news/1"),
+    ("https://example.com/news?id=5&utm_source=tg", "https://example.com/news?id=5"),
+    ("  ", ""),
+])
+def test_normalize_url(url, expected):
+    """Нормализация ссылок: регистр хоста, слэш в конце, фрагмент и utm-метки"""
+    assert normalize_url(url) == expected
+
+
+def test_same_material_gets_same_id():
+    """Одинаковый материал получает одинаковый ID независимо от записи ссылки"""
+    assert make_point_id("https://example.com/news/1", 0) == make_point_id("https://EXAMPLE.com/news/1/?utm_medium=rss", 0)
+
+
+def test_chunks_get_different_ids():
+    """Разные чанки одного материала получают разные ID"""
+    assert make_point_id("https://example.com/news/1", 0) != make_point_id("https://example.com/news/1", 1)
+
+
+def test_materials_without_url_differ_by_text():
+    """Материалы без ссылки различаются по тексту"""
+    assert make_point_id("", 0, "текст") == make_point_id("", 0, "текст")
+    assert make_point_id("", 0, "текст") != make_point_id("", 0, "другой текст")
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Тесты рассылки дайджестов в Telegram
+"""
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+import time
+
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError
+from aiogram.methods import SendMessage
+
+from utils import telegram_delivery
+from utils.telegram_delivery import AsyncRateLimiter, ChatDelivery, DeliveryItem, TelegramDelivery
+
+
+class FakeBot:
+    """Bot, записывающий отправленные сообщения; ошибки задаются по чату"""
+
+    sent = []
+    errors = {}
+
+    def __init__(self, token):
+        self.session = self
+
+    async def send_message(self, chat_id, text):
+        queued = FakeBot.errors.get(chat_id)
+        if queued:
+            raise queued.pop(0)
+        FakeBot.sent.append((chat_id, text, time.monotonic()))
+
+    async def close(self):
+        pass
+
+
+def deliver(monkeypatch, chats, errors=None, **kwargs):
+    """Рассылка через FakeBot без пауз между сообщениями в чат; возвращает статистику и прогресс"""
+    FakeBot.sent = []
+    FakeBot.errors = errors or {}
+    monkeypatch.setattr(telegram_delivery, "Bot", FakeBot)
+    monkeypatch.setattr(telegram_delivery, "DELIVERY_PRIVATE_INTERVAL", 0.0)
+    progress = []
+
+    async def on_progress(chat_id, item, parts_sent, status):
+        progress.append((chat_id, item.key, parts_sent, status))
+
+    delivery = TelegramDelivery(token="token", on_progress=on_progress, **kwargs)
+    return asyncio.run(delivery.deliver(chats)), progress
+
+
+def test_resume_with_same_parts():
+    """Прогресс прошлого запуска применяется к тому же сообщению"""
+    item = DeliveryItem(key="AI", parts=["часть 1", "часть 2", "часть 3"])
+    saved_hash = DeliveryItem(key="AI", parts=["часть 1", "часть 2", "часть 3"]).content_hash
+
+    item.resume_from(2, saved_hash)
+
+    assert item.parts_sent == 2
+
+
+def test_resume_restarts_changed_message():
+    """Если дайджест пересчитан после прерванного запуска, отправка начинается с первой части"""
+    old = DeliveryItem(key="AI", parts=["старая часть 1", "старая часть 2"])
+    item = DeliveryItem(key="AI", parts=["новая часть 1", "новая часть 2", "новая часть 3"])
+
+    item.resume_from(2, old.content_hash)
+
+    assert item.parts_sent == 0
+
+
+def test_resume_without_saved_hash():
+    """Прогресс без хэша (сохраненный до его появления) не применяется"""
+    item = DeliveryItem(key="AI", parts=["часть 1", "часть 2"])
+
+    item.resume_from(1, None)
+
+    assert item.parts_sent == 0
+
+
+def test_hash_depends_on_split():
+    """Тот же текст, разбитый на части иначе, считается другим сообщением"""
+    first = DeliveryItem(key="AI", parts=["ab", "c"])
+    second = DeliveryItem(key="AI", parts=["a", "bc"])
+
+    assert first.content_hash != second.content_hash
+
+
+def test_rate_limiter_spaces_requests():
+    """Лимитер пропускает не больше rate запросов в секунду"""
+    async def run():
+        limiter = AsyncRateLimiter(rate=50)
+        started = time.monotonic()
+        await asyncio.gather(*[limiter.acquire() for _ in range(11)])
+        return time.monotonic() - started
+
+    # Первый запрос проходит сразу, остальные 10 - с интервалом 1/50 сек
+    assert asyncio.run(run()) >= 0.19
+
+
+def test_rate_limiter_pause_delays_next_request():
+    """После RetryAfter следующий запрос ждет окончания паузы"""
+    async def run():
+        limiter = AsyncRateLimiter(rate=1000)
+        await limiter.acquire()
+        limiter.pause(0.2)
+        started = time.monotonic()
+        await limiter.acquire()
+        return time.monotonic() - started
+
+    assert asyncio.run(run()) >= 0.19
+
+
+def test_delivery_resumes_after_sent_parts(monkeypatch):
+    """Доставленные в прошлом запуске части не отправляются повторно"""
+    item = DeliveryItem(key="AI", parts=["1", "2", "3"], parts_sent=2)
+
+    stats, progress = deliver(monkeypatch, [ChatDelivery(chat_id=1, items=[item])])
+
+    assert [text for _, text, _ in FakeBot.sent] == ["3"]
+    assert progress == [(1, "AI", 3, "delivered")]
+    assert stats == {"delivered": 1, "skipped": 0, "failed": 0}
+
+
+def test_retry_after_pauses_and_resends(monkeypatch):
+    """RetryAfter приостанавливает рассылку, часть отправляется повторно"""
+    retry = TelegramRetryAfter(method=SendMessage(chat_id=1, text="1"), message="Flood control", retry_after=0)
+    item = DeliveryItem(key="AI", parts=["1", "2"])
+
+    stats, progress = deliver(monkeypatch, [ChatDelivery(chat_id=1, items=[item])], errors={1: [retry]})
+
+    assert [text for _, text, _ in FakeBot.sent] == ["1", "2"]
+    assert stats["delivered"] == 1
+
+
+def test_blocked_chat_does_not_stop_others(monkeypatch):
+    """Заблокировавший бота чат пропускается, остальные получают сообщения"""
+    forbidden = TelegramForbiddenError(method=SendMessage(chat_id=1, text="1"), message="bot was blocked")
+    chats = [
+        ChatDelivery(chat_id=1, items=[DeliveryItem(key="AI", parts=["1"]), DeliveryItem(key="IT", parts=["1"])]),
+        ChatDelivery(chat_id=2, items=[DeliveryItem(key="AI", parts=["1"])]),
+    ]
+
+    stats, progress = deliver(monkeypatch, chats, errors={1: [forbidden]})
+
+    assert [chat_id for chat_id, _, _ in FakeBot.sent] == [2]
+    assert (1, "AI", 0, "failed") in progress
+    assert stats == {"delivered": 1, "skipped": 0, "failed": 1}
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Тесты разбиения длинных материалов на чанки
+"""
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from text_processor import TextProcessor
+
+TEXT = "Привет мир 😀 日本語のテキスト " * 50
+
+
+def split_bytes(text: str, sizes=(1, 2, 3)) -> list:
+    """Имитация токенизатора, который режет многобайтовые символы между токенами"""
+    data = text.encode("utf-8")
+    tokens = []
+    position = 0
+    while position < len(data):
+        size = sizes[len(tokens) % len(sizes)]
+        tokens.append(data[position:position + size])
+        position += size
+    return tokens
+
+
+def test_chunks_keep_split_characters():
+    """Символы, разрезанные между токенами, не теряются на границах чанков"""
+    chunks = TextProcessor._chunk_tokens(split_bytes(TEXT), max_tokens=40, overlap=8)
+
+    assert len(chunks) > 1
+    assert all("�" not in chunk for chunk in chunks)
+    assert all(chunk in TEXT for chunk in chunks)
+    assert TEXT.startswith(chunks[0]) and TEXT.endswith(chunks[-1])
+
+
+def test_chunks_respect_token_limit_and_overlap():
+    """Чанк не длиннее max_tokens, соседние чанки перекрываются"""
+    chunks = TextProcessor._chunk_tokens(split_bytes(TEXT), max_tokens=40, overlap=8)
+
+    # Токен занимает не больше 3 байт
+    assert all(len(chunk.encode("utf-8")) <= 40 * 3 for chunk in chunks)
+    for previous, current in zip(chunks, chunks[1:]):
+        assert previous[-3:] in current
+
+
+def test_ascii_chunks_cover_text():
+    """Для однобайтового текста чанки без перекрытия складываются в исходный текст"""
+    text = "abcdefghij" * 30
+    tokens = [text[i:i + 3].encode() for i in range(0, len(text), 3)]
+
+    chunks = TextProcessor._chunk_tokens(tokens, max_tokens=10, overlap=0)
+
+    assert "".join(chunks) == text
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Тесты подсчета токенов материалов
+"""
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+from utils import tokenization
+from utils.tokenization import count_material_tokens
+
+
+class FakeEncoding:
+    """Токенизатор, считающий слова и число вызовов"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def encode(self, text, disallowed_special=()):
+        self.calls += 1
+        return text.split()
+
+    def encode_batch(self, texts, disallowed_special=()):
+        self.calls += 1
+        return [text.split() for text in texts]
+
+
+@pytest.fixture
+def encoding(monkeypatch):
+    fake = FakeEncoding()
+    monkeypatch.setattr(tokenization, "get_encoding", lambda model=None: fake)
+    monkeypatch.setattr(tokenization, "_token_counts", {})
+    return fake
+
+
+def test_materials_are_not_modified(encoding):
+    """Подсчет не дописывает служебные поля в материалы"""
+    materials = [{"text": "одна новость"}, {"text": "другая важная новость"}]
+
+    assert count_material_tokens(materials) == [2, 3]
+    assert materials == [{"text": "одна новость"}, {"text": "другая важная новость"}]
+
+
+def test_counts_are_reused(encoding):
+    """Повторный подсчет тех же текстов не вызывает токенизатор"""
+    count_material_tokens([{"text": "одна новость"}])
+    calls = encoding.calls
+
+    assert count_material_tokens([{"text": "одна новость"}, {"text": "одна новость"}]) == [2, 2]
+    assert encoding.calls == calls
+
+
+def test_cache_is_bounded(encoding, monkeypatch):
+    """Кэш подсчетов не растет больше TOKEN_COUNT_CACHE_SIZE"""
+    monkeypatch.setattr(tokenization, "TOKEN_COUNT_CACHE_SIZE", 3)
+
+    counts = count_material_tokens([{"text": "слово " * index} for index in range(1, 6)])
+
+    assert counts == [1, 2, 3, 4, 5]
+    assert len(tokenization._token_counts) == 3
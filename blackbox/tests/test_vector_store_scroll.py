@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Тесты постраничного обхода материалов в Qdrant
+"""
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from datetime import datetime
+from types import SimpleNamespace
+
+from vector_store import VectorStore
+
+
+class FakeQdrantClient:
+    """Клиент, отдающий точки страницами с next_page_offset, как Qdrant"""
+
+    def __init__(self, points):
+        self.points = points
+        self.calls = []
+
+    def scroll(self, collection_name, scroll_filter, with_payload, with_vectors, limit, offset):
+        self.calls.append({"offset": offset, "limit": limit, "with_payload": with_payload})
+        start = offset or 0
+        end = start + limit
+        return self.points[start:end], (end if end < len(self.points) else None)
+
+
+def make_store(points) -> VectorStore:
+    # Конструктор подключается к Qdrant и создает эмбеддер - для обхода они не нужны
+    store = VectorStore.__new__(VectorStore)
+    store.collection_name = "test"
+    store.client = FakeQdrantClient(points)
+    return store
+
+
+def point(index, **payload):
+    return SimpleNamespace(id=index, payload={"text": f"материал {index}", "url": f"https://example.com/{index}", **payload})
+
+
+def test_scroll_follows_next_page_offset():
+    """Все страницы обходятся до конца, а не обрезаются первой"""
+    store = make_store([point(index) for index in range(2500)])
+
+    materials = list(store._iter_materials(scroll_filter=None))
+
+    assert len(materials) == 2500
+    assert [call["offset"] for call in store.client.calls] == [None, 1000, 2000]
+
+
+def test_scroll_requests_only_needed_fields():
+    """Из Qdrant запрашиваются только нужные поля payload и служебные поля чанков"""
+    store = make_store([point(0)])
+
+    list(store.iter_by_category_and_date("AI", datetime(2026, 10, 17), payload_fields=["url"]))
+
+    assert store.client.calls[0]["with_payload"] == ["url", "material_id", "chunk_index", "material_text"]
+
+
+def test_chunks_collapse_into_materials():
+    """Материал из нескольких чанков отдается один раз и с полным текстом"""
+    store = make_store([
+        point(1, material_id="m1", chunk_index=0, text="начало", material_text="полный текст"),
+        point(2, material_id="m1", chunk_index=1, text="конец", material_text="полный текст"),
+        point(3),
+    ])
+
+    materials = list(store.iter_by_category_and_date_range("AI", datetime(2026, 10, 16), datetime(2026, 10, 17)))
+
+    assert [material["id"] for material in materials] == ["1", "3"]
+    assert materials[0]["text"] == "полный текст"
+
+
+def test_iteration_is_lazy():
+    """Следующая страница запрашивается только когда до нее дошел потребитель"""
+    store = make_store([point(index) for index in range(2500)])
+
+    materials = store.iter_by_category_and_date("AI", datetime(2026, 10, 17))
+    next(materials)
+
+    assert len(store.client.calls) == 1
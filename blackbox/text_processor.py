@@ -1,8 +1,15 @@
-from typing import List
+from typing import List, Tuple
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import random
+import threading
+import time
 import numpy as np
 from langchain_ollama import OllamaEmbeddings
 from langchain_openai import OpenAIEmbeddings
 from dotenv import load_dotenv
+from embedding_cache import EmbeddingCache, content_hash
+from utils.tokenization import get_encoding
 import os
 from logger_config import setup_logger
 
@@ -12,13 +19,79 @@ load_dotenv()
 # Настраиваем логгер
 logger = setup_logger("text_processor")
 
+# Параметры параллельной векторизации
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))  # Батчей одновременно в работе
+EMBEDDING_BATCH_MAX_TOKENS = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "100000"))  # Токенов в одном запросе
+EMBEDDING_BATCH_MAX_TEXTS = int(os.getenv("EMBEDDING_BATCH_MAX_TEXTS", "256"))  # Текстов в одном запросе
+EMBEDDING_TPM_LIMIT = int(os.getenv("EMBEDDING_TPM_LIMIT", "1000000"))  # Бюджет токенов в минуту
+EMBEDDING_RPM_LIMIT = int(os.getenv("EMBEDDING_RPM_LIMIT", "3000"))  # Бюджет запросов в минуту
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "5"))  # Повторов при 429
+EMBEDDING_CHUNK_MAX_TOKENS = int(os.getenv("EMBEDDING_CHUNK_MAX_TOKENS", "800"))  # Токенов в одном чанке материала
+EMBEDDING_CHUNK_OVERLAP_TOKENS = int(os.getenv("EMBEDDING_CHUNK_OVERLAP_TOKENS", "100"))  # Перекрытие соседних чанков
+
+
+class RateLimiter:
+    """Потокобезопасный ограничитель запросов и токенов в скользящем окне"""
+    
+    def __init__(self, tokens_per_minute: int, requests_per_minute: int, window: float = 60.0):
+        """
+        Инициализация ограничителя
+        
+        Args:
+            tokens_per_minute: Максимум токенов за окно
+            requests_per_minute: Максимум запросов за окно
+            window: Длина окна в секундах
+        """
+        self.tokens_per_minute = tokens_per_minute
+        self.requests_per_minute = requests_per_minute
+        self.window = window
+        self._events = deque()  # (время, токены)
+        self._tokens_in_window = 0
+        self._lock = threading.Lock()
+    
+    def acquire(self, tokens: int) -> None:
+        """
+        Блокирует поток, пока запрос на tokens токенов не уложится в бюджет
+        
+        Args:
+            tokens: Количество токенов в запросе
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._events and now - self._events[0][0] >= self.window:
+                    _, expired_tokens = self._events.popleft()
+                    self._tokens_in_window -= expired_tokens
+                
+                # Запрос больше всего бюджета пропускаем, когда окно пустое
+                fits_tokens = self._tokens_in_window + tokens <= self.tokens_per_minute or not self._events
+                fits_requests = len(self._events) < self.requests_per_minute
+                if fits_tokens and fits_requests:
+                    self._events.append((now, tokens))
+                    self._tokens_in_window += tokens
+                    return
+                
+                wait = self.window - (now - self._events[0][0])
+            time.sleep(max(wait, 0.05))
+
+
+def _is_rate_limit_error(error: Exception) -> bool:
+    """Проверяет, что ошибка - превышение лимита запросов (HTTP 429)"""
+    if error.__class__.__name__ == "RateLimitError":
+        return True
+    if getattr(error, "status_code", None) == 429:
+        return True
+    return "429" in str(error) or "rate limit" in str(error).lower()
+
+
 class TextProcessor:
     def __init__(
         self,
         embedding_type: str = "ollama",  # "ollama" или "openai"
         model_name: str = "llama3.2:latest",  # для ollama
         openai_model: str = "text-embedding-3-small",  # для openai
-        base_url: str = "http://localhost:11434"
+        base_url: str = "http://localhost:11434",
+        use_cache: bool = True
     ):
         """
         Инициализация процессора текста
@@ -28,11 +101,14 @@ class TextProcessor:
             model_name: Название модели для Ollama
             openai_model: Название модели для OpenAI (text-embedding-3-small, text-embedding-3-large, text-embedding-ada-002)
             base_url: URL для Ollama API
+            use_cache: Использовать постоянный кэш эмбеддингов
         """
         self.embedding_type = embedding_type
         self.model_name = model_name
         self.openai_model = openai_model
         self.base_url = base_url
+        self.cache = EmbeddingCache() if use_cache else None
+        self.rate_limiter = RateLimiter(EMBEDDING_TPM_LIMIT, EMBEDDING_RPM_LIMIT)
         
         # Инициализация модели эмбеддингов
         if embedding_type == "ollama":
@@ -113,89 +189,282 @@ class TextProcessor:
             int: Количество токенов
         """
         try:
-            if self.embedding_type == "openai":
-                # Для OpenAI используем tiktoken
-                import tiktoken
-                encoding = tiktoken.encoding_for_model("text-embedding-3-small")
-                return len(encoding.encode(text))
-            else:
-                # Для Ollama используем приблизительный подсчет (4 символа ~ 1 токен)
-                return len(text) // 4
+            # Для OpenAI - tiktoken настроенной модели (загружается один раз на процесс),
+            # для Ollama - приблизительный подсчет (4 символа ~ 1 токен)
+            encoding = self._get_tokenizer()
+            if encoding is not None:
+                return len(encoding.encode(text, disallowed_special=()))
+            return len(text) // 4
         except Exception as e:
             logger.warning(f"Ошибка при подсчете токенов: {str(e)}")
             # В случае ошибки возвращаем приблизительное значение
             return len(text) // 4
 
-    def create_embeddings(self, texts: List[str]) -> List[np.ndarray]:
+    def _get_tokenizer(self):
+        """Токенизатор tiktoken настроенной модели OpenAI; None - токены считаются приблизительно"""
+        if self.embedding_type != "openai":
+            return None
+        return get_encoding(self.model_name)
+
+    def chunk_text(
+        self,
+        text: str,
+        max_tokens: int = EMBEDDING_CHUNK_MAX_TOKENS,
+        overlap: int = EMBEDDING_CHUNK_OVERLAP_TOKENS
+    ) -> List[str]:
         """
-        Создает эмбеддинги для списка текстов с разбиением на батчи по токенам
+        Разбивает длинный текст на перекрывающиеся чанки, ограниченные по токенам
+        
+        Текст, который помещается в max_tokens, возвращается целиком. Без
+        токенизатора (Ollama) границы считаются по символам (4 символа ~ 1 токен)
+        и сдвигаются к ближайшему пробелу, чтобы не резать слова.
+        
+        Args:
+            text: Текст материала
+            max_tokens: Максимум токенов в чанке
+            overlap: Количество токенов, повторяющихся в соседних чанках
+            
+        Returns:
+            List[str]: Чанки в порядке следования в тексте
+        """
+        overlap = min(overlap, max_tokens // 2)
+        step = max_tokens - overlap
+        
+        encoding = self._get_tokenizer()
+        if encoding is not None:
+            tokens = encoding.encode(text, disallowed_special=())
+            if len(tokens) <= max_tokens:
+                return [text]
+            return self._chunk_tokens(encoding.decode_tokens_bytes(tokens), max_tokens, overlap)
+        
+        max_chars, step_chars = max_tokens * 4, step * 4
+        if len(text) <= max_chars:
+            return [text]
+        chunks = []
+        start = 0
+        while True:
+            end = start + max_chars
+            if end >= len(text):
+                chunks.append(text[start:].strip())
+                break
+            # Обрезаем чанк по последнему пробелу во второй половине окна
+            space = text.rfind(" ", start + max_chars // 2, end)
+            if space != -1:
+                end = space
+            chunks.append(text[start:end].strip())
+            next_start = max(end - (max_chars - step_chars), start + 1)
+            # Начало следующего чанка тоже сдвигаем к началу слова
+            space = text.find(" ", next_start, end)
+            start = space + 1 if space != -1 else next_start
+        return [chunk for chunk in chunks if chunk]
+
+    @staticmethod
+    def _chunk_tokens(token_bytes: List[bytes], max_tokens: int, overlap: int) -> List[str]:
+        """
+        Режет последовательность токенов на чанки по границам символов
+        
+        Символ UTF-8 может быть разбит на несколько токенов. Граница чанка
+        сдвигается назад до токена, с которого начинается целый символ, поэтому
+        каждый чанк декодируется без потерь.
+        
+        Args:
+            token_bytes: Байты каждого токена текста
+            max_tokens: Максимум токенов в чанке
+            overlap: Количество токенов, повторяющихся в соседних чанках
+            
+        Returns:
+            List[str]: Чанки в порядке следования в тексте
+        """
+        data = b"".join(token_bytes)
+        offsets = [0]
+        for token in token_bytes:
+            offsets.append(offsets[-1] + len(token))
+        count = len(token_bytes)
+        
+        def is_boundary(index: int) -> bool:
+            # Байт вида 10xxxxxx продолжает символ, начатый в предыдущем токене
+            return index == count or (data[offsets[index]] & 0xC0) != 0x80
+        
+        chunks = []
+        start = 0
+        while True:
+            end = min(start + max_tokens, count)
+            while end > start + 1 and not is_boundary(end):
+                end -= 1
+            chunks.append(data[offsets[start]:offsets[end]].decode("utf-8", errors="replace"))
+            if end >= count:
+                break
+            next_start = end - overlap
+            while next_start > start + 1 and not is_boundary(next_start):
+                next_start -= 1
+            start = next_start if next_start > start else end
+        return chunks
+
+    def _split_batches(self, texts: List[str]) -> List[Tuple[int, List[str], int]]:
+        """
+        Разбивает тексты на батчи, ограниченные по токенам и количеству текстов
         
         Args:
             texts: Список текстов
             
         Returns:
-            List[np.ndarray]: Список эмбеддингов
+            List[Tuple[int, List[str], int]]: Батчи (индекс первого текста, тексты, токены)
+        """
+        batches = []
+        current_batch = []
+        current_batch_tokens = 0
+        batch_start = 0
+        
+        for index, text in enumerate(texts):
+            # Подсчитываем токены для текущего текста
+            text_tokens = self._count_tokens(text)
+            
+            # Если добавление текста превысит лимиты, закрываем текущий батч
+            too_many_tokens = current_batch_tokens + text_tokens > EMBEDDING_BATCH_MAX_TOKENS
+            too_many_texts = len(current_batch) >= EMBEDDING_BATCH_MAX_TEXTS
+            if current_batch and (too_many_tokens or too_many_texts):
+                batches.append((batch_start, current_batch, current_batch_tokens))
+                current_batch = []
+                current_batch_tokens = 0
+                batch_start = index
+            
+            # Добавляем текст в текущий батч
+            current_batch.append(text)
+            current_batch_tokens += text_tokens
+        
+        if current_batch:
+            batches.append((batch_start, current_batch, current_batch_tokens))
+        
+        return batches
+
+    def _embed_batch(self, batch: List[str], batch_tokens: int) -> List[List[float]]:
+        """
+        Отправляет один батч в модель с учетом лимитов и повторами при 429
+        
+        Args:
+            batch: Тексты батча
+            batch_tokens: Количество токенов в батче
+            
+        Returns:
+            List[List[float]]: Эмбеддинги батча
+        """
+        for attempt in range(EMBEDDING_MAX_RETRIES + 1):
+            self.rate_limiter.acquire(batch_tokens)
+            try:
+                return self.model.embed_documents(batch)
+            except Exception as e:
+                if not _is_rate_limit_error(e) or attempt == EMBEDDING_MAX_RETRIES:
+                    raise
+                # Экспоненциальная задержка со случайным разбросом
+                delay = min(60.0, 2 ** attempt) + random.uniform(0, 1)
+                logger.warning(f"Превышен лимит запросов к модели эмбеддингов, повтор через {delay:.1f} с (попытка {attempt + 1}/{EMBEDDING_MAX_RETRIES})")
+                time.sleep(delay)
+
+    def _embed_batches(self, texts: List[str]) -> np.ndarray:
+        """
+        Отправляет тексты в модель эмбеддингов батчами, ограниченными по токенам
+        
+        Одновременно в работе держится до EMBEDDING_MAX_CONCURRENCY батчей в рамках
+        бюджетов токенов и запросов в минуту.
+        
+        Args:
+            texts: Список текстов
+            
+        Returns:
+            np.ndarray: Матрица эмбеддингов float32 (тексты x размерность) в порядке текстов
+        """
+        total_texts = len(texts)
+        batches = self._split_batches(texts)
+        batch_matrices = []
+        processed_texts = 0
+        
+        logger.info(f"Векторизация {total_texts} текстов в {len(batches)} батчах, параллельно до {EMBEDDING_MAX_CONCURRENCY}")
+        
+        with ThreadPoolExecutor(max_workers=max(1, EMBEDDING_MAX_CONCURRENCY)) as executor:
+            futures = [
+                (batch_start, batch, executor.submit(self._embed_batch, batch, batch_tokens))
+                for batch_start, batch, batch_tokens in batches
+            ]
+            
+            try:
+                # Батчи собираются в порядке отправки, каждый сразу сжимается до float32
+                for batch_number, (batch_start, batch, future) in enumerate(futures, 1):
+                    batch_matrices.append(np.asarray(future.result(), dtype=np.float32))
+                    processed_texts += len(batch)
+                    logger.info(f"Батч #{batch_number}: прогресс {processed_texts}/{total_texts} текстов")
+            except Exception:
+                # Не отправляем оставшиеся батчи, если один из них упал
+                for _, _, future in futures:
+                    future.cancel()
+                raise
+        
+        all_embeddings = np.concatenate(batch_matrices) if len(batch_matrices) > 1 else batch_matrices[0]
+        logger.info(f"Получено {len(all_embeddings)} эмбеддингов от модели в {len(batches)} батчах")
+        return all_embeddings
+
+    def create_embedding_matrix(self, texts: List[str]) -> np.ndarray:
+        """
+        Создает эмбеддинги для списка текстов одной непрерывной матрицей float32
+        
+        Эмбеддинги ищутся в кэше по (модель, хэш текста); в модель отправляются
+        только промахи кэша, причем одинаковые тексты - один раз.
+        
+        Args:
+            texts: Список текстов
+            
+        Returns:
+            np.ndarray: Матрица (тексты x размерность); пустая матрица при ошибке
         """
         try:
             if not texts:
-                return []
+                return np.empty((0, self.vector_size), dtype=np.float32)
             
             total_texts = len(texts)
             logger.info(f"Начало векторизации {total_texts} текстов")
             
-            # Максимальное количество токенов в одном запросе
-            MAX_TOKENS_PER_REQUEST = 300000
+            hashes = [content_hash(text) for text in texts]
+            cached = self.cache.get_many(self.model_name, hashes) if self.cache else {}
             
-            all_embeddings = []
-            current_batch = []
-            current_batch_tokens = 0
-            processed_texts = 0
-            batch_number = 1
+            # Уникальные тексты, которых нет в кэше
+            missing = {}
+            for text, key in zip(texts, hashes):
+                if key not in cached and key not in missing:
+                    missing[key] = text
+            cache_hits = sum(1 for key in hashes if key in cached)
+            logger.info(f"Найдено в кэше: {cache_hits}/{total_texts}, к векторизации: {len(missing)}")
             
-            for text in texts:
-                # Подсчитываем токены для текущего текста
-                text_tokens = self._count_tokens(text)
-                
-                # Если добавление текста превысит лимит токенов, обрабатываем текущий батч
-                if current_batch_tokens + text_tokens > MAX_TOKENS_PER_REQUEST:
-                    if current_batch:
-                        logger.info(f"Батч #{batch_number}: обработка {len(current_batch)} текстов ({current_batch_tokens} токенов)")
-                        batch_embeddings = self.model.embed_documents(current_batch)
-                        all_embeddings.extend(batch_embeddings)
-                        processed_texts += len(current_batch)
-                        remaining_texts = total_texts - processed_texts
-                        logger.info(f"Прогресс: {processed_texts}/{total_texts} текстов обработано, осталось {remaining_texts}")
-                        current_batch = []
-                        current_batch_tokens = 0
-                        batch_number += 1
-                
-                # Добавляем текст в текущий батч
-                current_batch.append(text)
-                current_batch_tokens += text_tokens
-            
-            # Обрабатываем оставшиеся тексты
-            if current_batch:
-                logger.info(f"Финальный батч #{batch_number}: обработка {len(current_batch)} текстов ({current_batch_tokens} токенов)")
-                batch_embeddings = self.model.embed_documents(current_batch)
-                all_embeddings.extend(batch_embeddings)
-                processed_texts += len(current_batch)
-                logger.info(f"Прогресс: {processed_texts}/{total_texts} текстов обработано")
-            
-            # Проверяем размерность первого эмбеддинга
-            if all_embeddings and len(all_embeddings) > 0:
-                first_embedding = all_embeddings[0]
-                embedding_size = len(first_embedding)
-                logger.info(f"Размерность эмбеддингов: {embedding_size}")
+            if missing:
+                new_embeddings = self._embed_batches(list(missing.values()))
+                computed = dict(zip(missing.keys(), new_embeddings))
+                if self.cache:
+                    self.cache.put_many(self.model_name, computed)
+                cached.update(computed)
             
-            # Преобразуем в список numpy массивов
-            embeddings = [np.array(embedding) for embedding in all_embeddings]
+            # Собираем эмбеддинги в исходном порядке текстов
+            embedding_size = len(cached[hashes[0]])
+            embeddings = np.empty((total_texts, embedding_size), dtype=np.float32)
+            for row, key in enumerate(hashes):
+                embeddings[row] = cached[key]
             
-            logger.info(f"Векторизация завершена: создано {len(embeddings)} эмбеддингов в {batch_number} батчах")
+            logger.info(f"Размерность эмбеддингов: {embedding_size}")
+            logger.info(f"Векторизация завершена: создано {total_texts} эмбеддингов")
             return embeddings
             
         except Exception as e:
             logger.error(f"Ошибка при создании эмбеддингов: {str(e)}")
-            return []
+            return np.empty((0, self.vector_size), dtype=np.float32)
+
+    def create_embeddings(self, texts: List[str]) -> List[np.ndarray]:
+        """
+        Создает эмбеддинги для списка текстов
+        
+        Args:
+            texts: Список текстов
+            
+        Returns:
+            List[np.ndarray]: Список эмбеддингов (строки общей матрицы float32)
+        """
+        return list(self.create_embedding_matrix(texts))
     
     def get_embeddings(self, texts: List[str]) -> List[np.ndarray]:
         """
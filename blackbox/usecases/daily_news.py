@@ -6,7 +6,10 @@ from llm_client import get_llm_client
 from vector_store import VectorStore
 from text_processor import TextProcessor
 from logger_config import setup_logger
-import tiktoken
+from database import get_digest_partials, save_digest_partial
+from utils.dedup import material_prompt_text
+from utils.map_reduce import analyze_chunks, collapse_summaries
+from utils.tokenization import count_tokens, count_material_tokens, pack_chunks
 from datetime import datetime, timedelta
 
 # Настраиваем логгер
@@ -16,25 +19,6 @@ logger = setup_logger("daily_news")
 ANALYSIS_DATE = "2025-06-03"  # Дата в формате YYYY-MM-DD
 ANALYSIS_CATEGORY = "Видеоигры"  # Категория для анализа
 
-def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
-    """
-    Подсчет количества токенов в тексте с учетом модели
-    
-    Args:
-        text: Текст для подсчета токенов
-        model: Модель для определения токенизатора
-        
-    Returns:
-        int: Количество токенов
-    """
-    try:
-        encoding = tiktoken.encoding_for_model(model)
-        return len(encoding.encode(text))
-    except Exception as e:
-        logger.error(f"Ошибка при подсчете токенов: {str(e)}")
-        # Если не удалось использовать tiktoken, используем приблизительный подсчет
-        return len(text.split()) * 1.3  # Примерный коэффициент для слов
-
 def calculate_chunk_size(materials: List[Dict[str, Any]], max_context_size: int) -> int:
     """
     Расчет оптимального размера чанка с учетом промптов и системных сообщений
@@ -50,7 +34,7 @@ def calculate_chunk_size(materials: List[Dict[str, Any]], max_context_size: int)
     available_tokens = int(max_context_size * 0.7)
     
     # Подсчитываем средний размер материала
-    total_tokens = sum(count_tokens(material['text']) for material in materials)
+    total_tokens = sum(count_material_tokens(materials))
     avg_tokens_per_material = total_tokens / len(materials)
     
     # Добавляем запас в 20% к среднему размеру для учета вариации
@@ -70,34 +54,15 @@ def _create_context_aware_chunks(materials: List[Dict[str, Any]], max_context_si
     Returns:
         List[List[Dict[str, Any]]]: Список чанков
     """
-    chunks = []
-    current_chunk = []
-    current_size = 0
+    # Токены каждого материала считаются один раз и переиспользуются
+    token_counts = count_material_tokens(materials)
     
     # Рассчитываем оптимальный размер чанка
     chunk_size = calculate_chunk_size(materials, max_context_size)
     logger.info(f"Оптимальный размер чанка: {chunk_size} материалов")
     
-    for material in materials:
-        material_tokens = count_tokens(material['text'])
-        
-        if current_size + material_tokens > max_context_size * 0.8:  # Оставляем 20% для промптов
-            if current_chunk:
-                chunks.append(current_chunk)
-            current_chunk = [material]
-            current_size = material_tokens
-        else:
-            current_chunk.append(material)
-            current_size += material_tokens
-            
-        # Если достигли оптимального размера чанка, создаем новый
-        if len(current_chunk) >= chunk_size:
-            chunks.append(current_chunk)
-            current_chunk = []
-            current_size = 0
-    
-    if current_chunk:
-        chunks.append(current_chunk)
+    # Оставляем 20% для промптов
+    chunks = pack_chunks(materials, token_counts, max_context_size * 0.8, chunk_size)
     
     return chunks
 
@@ -119,147 +84,65 @@ def test_embeddings():
         logger.error(f"Ошибка при тестировании эмбеддингов: {str(e)}")
         return None
 
-def analyze_trend(
-    category: str,
-    analysis_date: str = None,
-    embedding_type: str = "openai",
-    openai_model: str = "text-embedding-3-small"
-) -> Dict[str, Any]:
+def _fetch_recent_materials(vector_store: VectorStore, category: str, analysis_date: str = None) -> List[Dict[str, Any]]:
     """
-    Анализ трендов и формирование сводки новостей
+    Получение материалов категории за дату или за последние 24 часа
     
     Args:
+        vector_store: Векторное хранилище
         category: Категория для анализа
-        analysis_date: Дата для анализа в формате YYYY-MM-DD. Если None, берутся данные за последние 24 часа
-        embedding_type: Тип эмбеддингов ("ollama" или "openai")
-        openai_model: Название модели для OpenAI
+        analysis_date: Дата в формате YYYY-MM-DD. Если None, берутся данные за последние 24 часа
         
     Returns:
-        Dict[str, Any]: Результаты анализа
+        List[Dict[str, Any]]: Список материалов
     """
-    try:
-        # Инициализация компонентов
-        llm_client = get_llm_client()
-        vector_store = VectorStore(
-            embedding_type=embedding_type,
-            openai_model=openai_model
-        )
-        text_processor = TextProcessor(
-            embedding_type=embedding_type,
-            openai_model=openai_model
-        )
+    if analysis_date:
+        # Если дата указана, получаем материалы за конкретную дату
+        logger.info(f"Получаем материалы за {analysis_date} для категории: {category}")
         
-        # 1. Получаем материалы в зависимости от указанной даты
-        if analysis_date:
-            # Если дата указана, получаем материалы за конкретную дату
-            logger.info(f"Получаем материалы за {analysis_date} для категории: {category}")
+        try:
+            # Преобразуем строку даты в datetime
+            target_date = datetime.strptime(analysis_date, "%Y-%m-%d")
             
-            try:
-                # Преобразуем строку даты в datetime
-                target_date = datetime.strptime(analysis_date, "%Y-%m-%d")
-                
-                # Получаем материалы за указанную дату
-                recent_materials = vector_store.search_by_category_and_date(
-                    category=category,
-                    start_date=target_date
-                )
-                
-                if not recent_materials:
-                    logger.warning(f"Не найдено материалов за {analysis_date}")
-                    return {
-                        'status': 'error',
-                        'message': f'Не найдено материалов за {analysis_date}'
-                    }
-                    
-                logger.info(f"Найдено {len(recent_materials)} материалов за {analysis_date}")
-                
-            except Exception as e:
-                logger.error(f"Ошибка при получении материалов за {analysis_date}: {str(e)}")
-                raise
-        else:
-            # Если дата не указана, получаем материалы за последние 24 часа
-            logger.info(f"Получаем материалы за последние 24 часа для категории: {category}")
+            # Получаем материалы за указанную дату
+            return vector_store.search_by_category_and_date(
+                category=category,
+                start_date=target_date,
+                # Репосты одной новости попадают в дайджест один раз
+                collapse_duplicates=True
+            )
             
-            try:
-                # Вычисляем диапазон дат: от 24 часов назад до текущего момента
-                end_date = datetime.now()
-                start_date = end_date - timedelta(hours=24)
-                
-                # Получаем материалы за последние 24 часа
-                recent_materials = vector_store.search_by_category_and_date_range(
-                    category=category,
-                    start_date=start_date,
-                    end_date=end_date
-                )
-                
-                if not recent_materials:
-                    logger.warning(f"Не найдено материалов за последние 24 часа")
-                    return {
-                        'status': 'error',
-                        'message': f'Не найдено материалов за последние 24 часа'
-                    }
-                    
-                logger.info(f"Найдено {len(recent_materials)} материалов за последние 24 часа")
-                
-            except Exception as e:
-                logger.error(f"Ошибка при получении материалов за последние 24 часа: {str(e)}")
-                raise
-
-        # 2. Проверяем общее количество токенов и максимальный размер контекста
-        total_tokens = sum(count_tokens(material['text']) for material in recent_materials)
-        max_context_size = llm_client.get_max_context_size()
-        logger.info(f"Общее количество токенов: {total_tokens}")
-        logger.info(f"Максимальный размер контекста модели: {max_context_size}")
+        except Exception as e:
+            logger.error(f"Ошибка при получении материалов за {analysis_date}: {str(e)}")
+            raise
+    else:
+        # Если дата не указана, получаем материалы за последние 24 часа
+        logger.info(f"Получаем материалы за последние 24 часа для категории: {category}")
         
-        # 3. Разбиваем на чанки и анализируем
-        chunks = []  # Инициализируем переменную chunks
-        if total_tokens <= max_context_size * 0.8:
-            # Если общее количество токенов не превышает контекстное окно
-            logger.info("Количество токенов в пределах контекстного окна, анализируем все материалы")
+        try:
+            # Вычисляем диапазон дат: от 24 часов назад до текущего момента
+            end_date = datetime.now()
+            start_date = end_date - timedelta(hours=24)
             
-            # Первый этап - выделение главных новостей
-            main_news_prompt = f"""
-            Analyze the following materials from the last 24 hours in the category {category}:
-
-            {[material['text'] for material in recent_materials]}
-            {[material['url'] for material in recent_materials]}
-
-            Highlight all the most important news items that:
-            1. Have the greatest impact on the industry
-            2. Generated the most resonance in the community
-            3. May influence future trends
-
-            For each news item, specify:
-            - Title
-            - Brief description
-            - Impact on the industry
-            - Community reaction
-            - Source link
-
-            Return only the highlighted news in a structured format.
-            """
-
-            
-            main_news_analysis = llm_client.analyze_text(
-                prompt=main_news_prompt,
-                query="\n".join([material['text'] for material in recent_materials])
+            # Получаем материалы за последние 24 часа
+            return vector_store.search_by_category_and_date_range(
+                category=category,
+                start_date=start_date,
+                end_date=end_date,
+                # Репосты одной новости попадают в дайджест один раз
+                collapse_duplicates=True
             )
-            chunk_analyses = [main_news_analysis.get('analysis', '')]
             
-        else:
-            # Если превышает, делим материалы на чанки
-            logger.info(f"Количество токенов превышает контекстное окно, разбиваем на чанки")
-            chunks = _create_context_aware_chunks(recent_materials, max_context_size)
-            logger.info(f"Материалы разбиты на {len(chunks)} чанков")
-            
-            # Анализируем каждый чанк
-            chunk_analyses = []
-            for i, chunk in enumerate(chunks):
-                logger.info(f"Анализ чанка {i+1}/{len(chunks)}")
-                chunk_prompt = f"""
+        except Exception as e:
+            logger.error(f"Ошибка при получении материалов за последние 24 часа: {str(e)}")
+            raise
+
+def _build_chunk_prompt(category: str, chunk: List[Dict[str, Any]]) -> str:
+    """Промпт для выделения главных новостей из одного чанка материалов"""
+    return f"""
                 Analyze the following materials from the last 24 hours in the category {category}:
 
-                {[material['text'] for material in chunk]}
+                {[material_prompt_text(material) for material in chunk]}
                 {[material['url'] for material in chunk]}
 
                 Highlight the most important news items from this chunk that:
@@ -277,18 +160,12 @@ def analyze_trend(
                 Return only the highlighted news in a structured format.
                 """
 
-                
-                chunk_analysis = llm_client.analyze_text(
-                    prompt=chunk_prompt,
-                    query="\n".join([material['text'] for material in chunk])
-                )
-                chunk_analyses.append(chunk_analysis.get('analysis', ''))
-        
-        # 4. Генерируем финальную сводку новостей
-        display_date = analysis_date if analysis_date else datetime.now().strftime("%Y-%m-%d")
-        time_period = analysis_date if analysis_date else "последние 24 часа"
-        
-        final_prompt = f"""
+def _build_final_prompt(category: str, analysis_date: str, chunk_analyses: List[str]) -> str:
+    """Reduce-промпт, собирающий анализы чанков в итоговую сводку новостей"""
+    display_date = analysis_date if analysis_date else datetime.now().strftime("%Y-%m-%d")
+    time_period = analysis_date if analysis_date else "последние 24 часа"
+    
+    return f"""
         Based on the following analyses of individual material parts, create a unified daily news summary for {time_period} in the category {category}.
 
         Part analyses:
@@ -324,9 +201,115 @@ def analyze_trend(
         ⚠️ Write the entire final answer in Russian.
         """
 
+def _analyze_main_news(llm_client, category: str, materials: List[Dict[str, Any]]) -> str:
+    """Выделение главных новостей из всех материалов одним запросом (материалы помещаются в контекст)"""
+    main_news_prompt = f"""
+            Analyze the following materials from the last 24 hours in the category {category}:
+
+            {[material_prompt_text(material) for material in materials]}
+            {[material['url'] for material in materials]}
+
+            Highlight all the most important news items that:
+            1. Have the greatest impact on the industry
+            2. Generated the most resonance in the community
+            3. May influence future trends
+
+            For each news item, specify:
+            - Title
+            - Brief description
+            - Impact on the industry
+            - Community reaction
+            - Source link
+
+            Return only the highlighted news in a structured format.
+            """
+    
+    main_news_analysis = llm_client.analyze_text(
+        prompt=main_news_prompt,
+        query="\n".join([material['text'] for material in materials])
+    )
+    return main_news_analysis.get('analysis', '')
+
+def analyze_trend(
+    category: str,
+    analysis_date: str = None,
+    embedding_type: str = "openai",
+    openai_model: str = "text-embedding-3-small"
+) -> Dict[str, Any]:
+    """
+    Анализ трендов и формирование сводки новостей
+    
+    Args:
+        category: Категория для анализа
+        analysis_date: Дата для анализа в формате YYYY-MM-DD. Если None, берутся данные за последние 24 часа
+        embedding_type: Тип эмбеддингов ("ollama" или "openai")
+        openai_model: Название модели для OpenAI
+        
+    Returns:
+        Dict[str, Any]: Результаты анализа
+    """
+    try:
+        # Инициализация компонентов
+        llm_client = get_llm_client()
+        vector_store = VectorStore(
+            embedding_type=embedding_type,
+            openai_model=openai_model
+        )
         
+        # 1. Получаем материалы в зависимости от указанной даты
+        period = analysis_date if analysis_date else "последние 24 часа"
+        recent_materials = _fetch_recent_materials(vector_store, category, analysis_date)
+        if not recent_materials:
+            logger.warning(f"Не найдено материалов за {period}")
+            return {
+                'status': 'error',
+                'message': f'Не найдено материалов за {period}',
+                # Повтор не поможет: ошибкой это не является, материалов просто нет
+                'no_materials': True
+            }
+        logger.info(f"Найдено {len(recent_materials)} материалов за {period}")
+
+        # 2. Проверяем общее количество токенов и максимальный размер контекста
+        total_tokens = sum(count_material_tokens(recent_materials))
+        max_context_size = llm_client.get_max_context_size()
+        logger.info(f"Общее количество токенов: {total_tokens}")
+        logger.info(f"Максимальный размер контекста модели: {max_context_size}")
+        
+        # 3. Разбиваем на чанки и анализируем
+        chunks = []  # Инициализируем переменную chunks
+        if total_tokens <= max_context_size * 0.8:
+            # Если общее количество токенов не превышает контекстное окно
+            logger.info("Количество токенов в пределах контекстного окна, анализируем все материалы")
+            
+            # Первый этап - выделение главных новостей
+            chunk_analyses = [_analyze_main_news(llm_client, category, recent_materials)]
+            
+        else:
+            # Если превышает, делим материалы на чанки
+            logger.info(f"Количество токенов превышает контекстное окно, разбиваем на чанки")
+            chunks = _create_context_aware_chunks(recent_materials, max_context_size)
+            logger.info(f"Материалы разбиты на {len(chunks)} чанков")
+            
+            # Анализируем чанки параллельно, порядок анализов совпадает с порядком чанков
+            chunk_analyses = analyze_chunks(
+                llm_client,
+                chunks,
+                build_prompt=lambda chunk: _build_chunk_prompt(category, chunk),
+                build_query=lambda chunk: "\n".join([material['text'] for material in chunk])
+            )
+            
+            # Если анализов слишком много для одного промпта, сворачиваем их иерархически
+            chunk_analyses = collapse_summaries(
+                llm_client,
+                chunk_analyses,
+                max_context_size,
+                count_tokens,
+                topic=f"news from the last 24 hours in the category {category}"
+            )
+        
+        # 4. Генерируем финальную сводку новостей
         final_analysis = llm_client.analyze_text(
-            prompt=final_prompt,
+            prompt=_build_final_prompt(category, analysis_date, chunk_analyses),
             query="\n".join(chunk_analyses)
         )
         
@@ -344,6 +327,132 @@ def analyze_trend(
             'message': str(e)
         }
 
+def analyze_trend_incremental(
+    category: str,
+    digest_date: str,
+    analysis_date: str = None,
+    embedding_type: str = "openai",
+    openai_model: str = "text-embedding-3-small"
+) -> Dict[str, Any]:
+    """
+    Инкрементальное формирование сводки новостей
+    
+    Анализы чанков (map-этап) сохраняются вместе с ID покрытых материалов.
+    При повторном запуске анализируются только материалы, не покрытые
+    сохраненными анализами, после чего заново выполняется только reduce-этап.
+    Материалы, помещающиеся в один промпт, анализируются за один проход.
+    
+    Args:
+        category: Категория для анализа
+        digest_date: Дата дайджеста в формате YYYY-MM-DD, к которой привязываются частичные анализы
+        analysis_date: Дата для анализа в формате YYYY-MM-DD. Если None, берутся данные за последние 24 часа
+        embedding_type: Тип эмбеддингов ("ollama" или "openai")
+        openai_model: Название модели для OpenAI
+        
+    Returns:
+        Dict[str, Any]: Результаты анализа
+    """
+    try:
+        # Инициализация компонентов
+        llm_client = get_llm_client()
+        vector_store = VectorStore(
+            embedding_type=embedding_type,
+            openai_model=openai_model
+        )
+        
+        # 1. Получаем материалы в зависимости от указанной даты
+        period = analysis_date if analysis_date else "последние 24 часа"
+        recent_materials = _fetch_recent_materials(vector_store, category, analysis_date)
+        if not recent_materials:
+            logger.warning(f"Не найдено материалов за {period}")
+            return {
+                'status': 'error',
+                'message': f'Не найдено материалов за {period}',
+                # Повтор не поможет: ошибкой это не является, материалов просто нет
+                'no_materials': True
+            }
+        logger.info(f"Найдено {len(recent_materials)} материалов за {period}")
+        
+        # 2. Если все материалы помещаются в один промпт, анализируем их за один проход,
+        # как analyze_trend: частичные анализы нужны только при разбиении на чанки
+        total_tokens = sum(count_material_tokens(recent_materials))
+        max_context_size = llm_client.get_max_context_size()
+        if total_tokens <= max_context_size * 0.8:
+            logger.info("Количество токенов в пределах контекстного окна, анализируем все материалы")
+            chunk_analyses = [_analyze_main_news(llm_client, category, recent_materials)]
+            final_analysis = llm_client.analyze_text(
+                prompt=_build_final_prompt(category, analysis_date, chunk_analyses),
+                query="\n".join(chunk_analyses)
+            )
+            return {
+                'status': 'success',
+                'analysis': final_analysis.get('analysis', ''),
+                'materials_count': len(recent_materials),
+                'new_materials_count': len(recent_materials),
+                'chunks_count': 1
+            }
+        
+        # 3. Используем только те сохраненные анализы, все материалы которых еще в выборке
+        current_ids = {material['id'] for material in recent_materials}
+        partials = [
+            partial for partial in get_digest_partials(category, digest_date)
+            if set(partial['material_ids']) <= current_ids
+        ]
+        covered_ids = set()
+        for partial in partials:
+            covered_ids.update(partial['material_ids'])
+        
+        new_materials = [material for material in recent_materials if material['id'] not in covered_ids]
+        logger.info(f"Сохраненных анализов: {len(partials)}, новых материалов: {len(new_materials)}")
+        
+        # 4. Анализируем только новые материалы и сохраняем их анализы
+        chunks = []
+        new_analyses = []
+        if new_materials:
+            chunks = _create_context_aware_chunks(new_materials, max_context_size)
+            logger.info(f"Новые материалы разбиты на {len(chunks)} чанков")
+            
+            new_analyses = analyze_chunks(
+                llm_client,
+                chunks,
+                build_prompt=lambda chunk: _build_chunk_prompt(category, chunk),
+                build_query=lambda chunk: "\n".join([material['text'] for material in chunk])
+            )
+            for chunk, analysis in zip(chunks, new_analyses):
+                # Ошибки LLM не сохраняем, чтобы материалы чанка проанализировались при следующем запуске
+                if analysis and not analysis.startswith("Ошибка при анализе"):
+                    save_digest_partial(category, digest_date, [material['id'] for material in chunk], analysis)
+        
+        # 5. Reduce-этап по всем анализам: сохраненным и новым
+        chunk_analyses = [partial['analysis'] for partial in partials] + new_analyses
+        chunk_analyses = collapse_summaries(
+            llm_client,
+            chunk_analyses,
+            max_context_size,
+            count_tokens,
+            topic=f"news from the last 24 hours in the category {category}"
+        )
+        
+        final_analysis = llm_client.analyze_text(
+            prompt=_build_final_prompt(category, analysis_date, chunk_analyses),
+            query="\n".join(chunk_analyses)
+        )
+        
+        return {
+            'status': 'success',
+            'analysis': final_analysis.get('analysis', ''),
+            'materials_count': len(recent_materials),
+            'new_materials_count': len(new_materials),
+            'chunks_count': len(partials) + len(chunks)
+        }
+        
+    except Exception as e:
+        logger.error(f"Ошибка при инкрементальном анализе тренда: {str(e)}")
+        return {
+            'status': 'error',
+            'message': str(e)
+        }
+
 if __name__ == "__main__":
     # Сначала проверяем размерность эмбеддингов
     embedding_size = test_embeddings()
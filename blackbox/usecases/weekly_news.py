@@ -10,7 +10,9 @@ from llm_client import get_llm_client
 from vector_store import VectorStore
 from text_processor import TextProcessor
 from logger_config import setup_logger
-import tiktoken
+from utils.dedup import material_prompt_text
+from utils.map_reduce import analyze_chunks, collapse_summaries
+from utils.tokenization import count_tokens, count_material_tokens, pack_chunks
 from datetime import datetime, timedelta
 
 # Настраиваем логгер
@@ -20,25 +22,6 @@ logger = setup_logger("test_analysis")
 ANALYSIS_START_DATE = "2025-06-03"  # Начальная дата недели в формате YYYY-MM-DD
 ANALYSIS_CATEGORY = "Видеоигры"  # Категория для анализа
 
-def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
-    """
-    Подсчет количества токенов в тексте с учетом модели
-    
-    Args:
-        text: Текст для подсчета токенов
-        model: Модель для определения токенизатора
-        
-    Returns:
-        int: Количество токенов
-    """
-    try:
-        encoding = tiktoken.encoding_for_model(model)
-        return len(encoding.encode(text))
-    except Exception as e:
-        logger.error(f"Ошибка при подсчете токенов: {str(e)}")
-        # Если не удалось использовать tiktoken, используем приблизительный подсчет
-        return len(text.split()) * 1.3  # Примерный коэффициент для слов
-
 def calculate_chunk_size(materials: List[Dict[str, Any]], max_context_size: int) -> int:
     """
     Расчет оптимального размера чанка с учетом промптов и системных сообщений
@@ -54,7 +37,7 @@ def calculate_chunk_size(materials: List[Dict[str, Any]], max_context_size: int)
     available_tokens = int(max_context_size * 0.7)
     
     # Подсчитываем средний размер материала
-    total_tokens = sum(count_tokens(material['text']) for material in materials)
+    total_tokens = sum(count_material_tokens(materials))
     avg_tokens_per_material = total_tokens / len(materials)
     
     # Добавляем запас в 20% к среднему размеру для учета вариации
@@ -74,34 +57,15 @@ def _create_context_aware_chunks(materials: List[Dict[str, Any]], max_context_si
     Returns:
         List[List[Dict[str, Any]]]: Список чанков
     """
-    chunks = []
-    current_chunk = []
-    current_size = 0
+    # Токены каждого материала считаются один раз и переиспользуются
+    token_counts = count_material_tokens(materials)
     
     # Рассчитываем оптимальный размер чанка
     chunk_size = calculate_chunk_size(materials, max_context_size)
     logger.info(f"Оптимальный размер чанка: {chunk_size} материалов")
     
-    for material in materials:
-        material_tokens = count_tokens(material['text'])
-        
-        if current_size + material_tokens > max_context_size * 0.8:  # Оставляем 20% для промптов
-            if current_chunk:
-                chunks.append(current_chunk)
-            current_chunk = [material]
-            current_size = material_tokens
-        else:
-            current_chunk.append(material)
-            current_size += material_tokens
-            
-        # Если достигли оптимального размера чанка, создаем новый
-        if len(current_chunk) >= chunk_size:
-            chunks.append(current_chunk)
-            current_chunk = []
-            current_size = 0
-    
-    if current_chunk:
-        chunks.append(current_chunk)
+    # Оставляем 20% для промптов
+    chunks = pack_chunks(materials, token_counts, max_context_size * 0.8, chunk_size)
     
     return chunks
 
@@ -164,7 +128,9 @@ def analyze_trend(
             recent_materials = vector_store.search_by_category_and_date_range(
                 category=category,
                 start_date=start_date,
-                end_date=end_date
+                end_date=end_date,
+                # Репосты одной новости попадают в дайджест один раз
+                collapse_duplicates=True
             )
             
             if not recent_materials:
@@ -181,7 +147,7 @@ def analyze_trend(
             raise
 
         # 2. Проверяем общее количество токенов и максимальный размер контекста
-        total_tokens = sum(count_tokens(material['text']) for material in recent_materials)
+        total_tokens = sum(count_material_tokens(recent_materials))
         max_context_size = llm_client.get_max_context_size()
         logger.info(f"Общее количество токенов: {total_tokens}")
         logger.info(f"Максимальный размер контекста модели: {max_context_size}")
@@ -195,7 +161,7 @@ def analyze_trend(
             main_news_prompt = f"""
             Analyze the following materials from the last week in the category {category}:
 
-            {[material['text'] for material in recent_materials]}
+            {[material_prompt_text(material) for material in recent_materials]}
             {[material['url'] for material in recent_materials]}
 
             Highlight all the most important news items that:
@@ -225,14 +191,12 @@ def analyze_trend(
             chunks = _create_context_aware_chunks(recent_materials, max_context_size)
             logger.info(f"Материалы разбиты на {len(chunks)} чанков")
             
-            # Анализируем каждый чанк
-            chunk_analyses = []
-            for i, chunk in enumerate(chunks):
-                logger.info(f"Анализ чанка {i+1}/{len(chunks)}")
-                chunk_prompt = f"""
+            # Анализируем чанки параллельно, порядок анализов совпадает с порядком чанков
+            def build_chunk_prompt(chunk):
+                return f"""
                 Analyze the following materials from the last week in the category {category}:
 
-                {[material['text'] for material in chunk]}
+                {[material_prompt_text(material) for material in chunk]}
                 {[material['url'] for material in chunk]}
 
                 Highlight the most important news items from this chunk that:
@@ -249,13 +213,22 @@ def analyze_trend(
 
                 Return only the highlighted news in a structured format.
                 """
-
-                
-                chunk_analysis = llm_client.analyze_text(
-                    prompt=chunk_prompt,
-                    query="\n".join([material['text'] for material in chunk])
-                )
-                chunk_analyses.append(chunk_analysis.get('analysis', ''))
+            
+            chunk_analyses = analyze_chunks(
+                llm_client,
+                chunks,
+                build_prompt=build_chunk_prompt,
+                build_query=lambda chunk: "\n".join([material['text'] for material in chunk])
+            )
+            
+            # Если анализов слишком много для одного промпта, сворачиваем их иерархически
+            chunk_analyses = collapse_summaries(
+                llm_client,
+                chunk_analyses,
+                max_context_size,
+                count_tokens,
+                topic=f"news from the last week in the category {category}"
+            )
         
         # 4. Генерируем финальную сводку новостей
         final_prompt = f"""
@@ -0,0 +1,225 @@
+import os
+import re
+import zlib
+from typing import Any, Dict, List
+import numpy as np
+from logger_config import setup_logger
+
+# Настраиваем логгер
+logger = setup_logger("dedup")
+
+# Оценка сходства Жаккара (по MinHash), начиная с которой материалы считаются дубликатами
+DEDUP_SIMILARITY_THRESHOLD = float(os.getenv("DEDUP_SIMILARITY_THRESHOLD", "0.8"))
+# Количество хэш-функций MinHash; должно делиться на MINHASH_BANDS
+MINHASH_PERMUTATIONS = 128
+# Количество полос LSH: чем больше, тем чаще находятся пары с умеренным сходством
+MINHASH_BANDS = 32
+# Количество слов в шингле
+SHINGLE_SIZE = 3
+# Сколько шинглов хэшируется за один шаг (матрица MINHASH_PERMUTATIONS x шинглы в памяти)
+MINHASH_BATCH_SHINGLES = 20000
+# Пометка в промпте для материала, который опубликовали несколько источников
+SOURCE_COUNT_NOTE = "(Эту новость опубликовали несколько источников: {count})"
+
+# Простое число Мерсенна 2^31 - 1: произведения хэшей помещаются в uint64
+_MERSENNE_PRIME = np.uint64((1 << 31) - 1)
+_WORD_RE = re.compile(r"\w+")
+
+# Коэффициенты хэш-функций (a * x + b) mod p фиксированы, чтобы кластеры были воспроизводимы
+_rng = np.random.default_rng(20240101)
+_HASH_A = _rng.integers(1, (1 << 31) - 1, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+_HASH_B = _rng.integers(0, (1 << 31) - 1, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+
+def _shingle_hashes(text: str) -> np.ndarray:
+    """
+    Хэши шинглов текста (последовательностей из SHINGLE_SIZE слов)
+
+    Регистр и пунктуация не учитываются, поэтому репосты с другим
+    оформлением дают те же шинглы.
+
+    Args:
+        text: Текст материала
+
+    Returns:
+        np.ndarray: Уникальные хэши шинглов (uint64, меньше 2^31 - 1)
+    """
+    words = _WORD_RE.findall(text.lower())
+    if not words:
+        return np.empty(0, dtype=np.uint64)
+
+    word_hashes = np.fromiter((zlib.crc32(word.encode("utf-8")) for word in words), dtype=np.uint64, count=len(words))
+    size = min(SHINGLE_SIZE, len(word_hashes))
+
+    # Хэш шингла - полиномиальная свертка хэшей слов по модулю p
+    shingles = np.zeros(len(word_hashes) - size + 1, dtype=np.uint64)
+    for offset in range(size):
+        shingles = (shingles * np.uint64(1000003) + word_hashes[offset:len(word_hashes) - size + 1 + offset]) % _MERSENNE_PRIME
+    return np.unique(shingles)
+
+
+def minhash_signatures(texts: List[str]) -> np.ndarray:
+    """
+    MinHash-сигнатуры текстов
+
+    Доля совпадающих позиций в сигнатурах двух текстов оценивает сходство
+    Жаккара их множеств шинглов.
+
+    Args:
+        texts: Тексты
+
+    Returns:
+        np.ndarray: Матрица (тексты x MINHASH_PERMUTATIONS); у пустых текстов - максимальные значения
+    """
+    signatures = np.full((len(texts), MINHASH_PERMUTATIONS), np.iinfo(np.uint64).max, dtype=np.uint64)
+    shingle_sets = [_shingle_hashes(text or "") for text in texts]
+    lengths = np.array([len(shingles) for shingles in shingle_sets], dtype=np.int64)
+    rows = np.flatnonzero(lengths)
+    if not len(rows):
+        return signatures
+
+    # Шинглы нескольких текстов хэшируются одной матрицей (функции x шинглы),
+    # минимум по каждому тексту берется по его отрезку столбцов
+    cumulative = np.cumsum(lengths[rows])
+    start = 0
+    while start < len(rows):
+        done = cumulative[start - 1] if start else 0
+        end = max(start + 1, int(np.searchsorted(cumulative, done + MINHASH_BATCH_SHINGLES, side="right")))
+        batch = rows[start:end]
+        shingles = np.concatenate([shingle_sets[row] for row in batch])
+        hashed = (_HASH_A[:, None] * shingles[None, :] + _HASH_B[:, None]) % _MERSENNE_PRIME
+        offsets = np.concatenate(([0], np.cumsum(lengths[batch])[:-1]))
+        signatures[batch] = np.minimum.reduceat(hashed, offsets, axis=1).T
+        start = end
+    return signatures
+
+
+def cluster_near_duplicates(texts: List[str], threshold: float = DEDUP_SIMILARITY_THRESHOLD) -> List[int]:
+    """
+    Группирует почти одинаковые тексты
+
+    Кандидаты в дубликаты находятся через LSH по полосам сигнатур (без
+    сравнения всех пар), затем сходство кандидатов проверяется по полной
+    сигнатуре. Группы транзитивны: A~B и B~C объединяют A, B и C.
+
+    Args:
+        texts: Тексты
+        threshold: Минимальное сходство дубликатов
+
+    Returns:
+        List[int]: Номер группы для каждого текста (номер первого текста группы)
+    """
+    count = len(texts)
+    parent = list(range(count))
+
+    def find(index: int) -> int:
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+
+    if count < 2:
+        return parent
+
+    signatures = minhash_signatures(texts)
+    has_shingles = signatures[:, 0] != np.iinfo(np.uint64).max
+    rows_per_band = MINHASH_PERMUTATIONS // MINHASH_BANDS
+
+    # Тексты с одинаковой полосой сигнатуры - кандидаты в дубликаты
+    candidates = set()
+    for band in range(MINHASH_BANDS):
+        buckets: Dict[bytes, int] = {}
+        band_rows = signatures[:, band * rows_per_band:(band + 1) * rows_per_band]
+        for index in np.flatnonzero(has_shingles):
+            key = band_rows[index].tobytes()
+            first = buckets.setdefault(key, index)
+            if first != index:
+                candidates.add((first, index))
+
+    if not candidates:
+        return parent
+
+    pairs = np.array(sorted(candidates))
+    similarity = (signatures[pairs[:, 0]] == signatures[pairs[:, 1]]).mean(axis=1)
+    for first, second in pairs[similarity >= threshold]:
+        root_first, root_second = find(int(first)), find(int(second))
+        if root_first != root_second:
+            # Корень группы - текст, который встретился раньше
+            parent[max(root_first, root_second)] = min(root_first, root_second)
+
+    return [find(index) for index in range(count)]
+
+
+def _representative_key(material: Dict[str, Any]) -> tuple:
+    """Ключ выбора представителя группы: сначала материалы с датой, раньше - меньше"""
+    date = str(material.get("date") or "")
+    return (not date, date, str(material.get("id") or ""))
+
+
+def collapse_near_duplicates(
+    materials: List[Dict[str, Any]],
+    threshold: float = DEDUP_SIMILARITY_THRESHOLD,
+    text_key: str = "text"
+) -> List[Dict[str, Any]]:
+    """
+    Оставляет по одному материалу на группу почти одинаковых материалов
+    
+    Представителем группы становится самый ранний материал (по дате, затем
+    по ID), а не первый встреченный: порядок выдачи Qdrant между запусками
+    может меняться, а от представителя зависят ID материалов, по которым
+    переиспользуются сохраненные анализы чанков. Количество источников,
+    опубликовавших новость, сохраняется в поле source_count копии
+    представителя; текст материала не изменяется.
+    
+    Args:
+        materials: Материалы
+        threshold: Минимальное сходство дубликатов
+        text_key: Поле с текстом материала
+        
+    Returns:
+        List[Dict[str, Any]]: Материалы без дубликатов в исходном порядке
+    """
+    if not materials:
+        return materials
+    
+    try:
+        groups = cluster_near_duplicates([material.get(text_key) or "" for material in materials], threshold)
+    except Exception as e:
+        logger.error(f"Ошибка при поиске дубликатов: {str(e)}")
+        return materials
+    
+    representatives: Dict[int, Dict[str, Any]] = {}
+    source_counts: Dict[int, int] = {}
+    for material, group in zip(materials, groups):
+        current = representatives.get(group)
+        if current is None or _representative_key(material) < _representative_key(current):
+            representatives[group] = material
+        source_counts[group] = source_counts.get(group, 0) + 1
+    
+    collapsed = []
+    for group, material in representatives.items():
+        if source_counts[group] > 1:
+            material = {**material, "source_count": source_counts[group]}
+        collapsed.append(material)
+    
+    if len(collapsed) < len(materials):
+        logger.info(f"Схлопнуто дубликатов: {len(materials)} материалов -> {len(collapsed)}")
+    return collapsed
+
+
+def material_prompt_text(material: Dict[str, Any], text_key: str = "text") -> str:
+    """
+    Текст материала для промпта с пометкой о количестве источников
+    
+    Args:
+        material: Материал (после collapse_near_duplicates может содержать source_count)
+        text_key: Поле с текстом материала
+        
+    Returns:
+        str: Текст материала; если источников несколько, к нему добавляется пометка
+    """
+    text = material.get(text_key) or ""
+    source_count = material.get("source_count") or 1
+    if source_count > 1:
+        return f"{text}\n{SOURCE_COUNT_NOTE.format(count=source_count)}"
+    return text
@@ -0,0 +1,140 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, TypeVar
+from logger_config import setup_logger
+
+# Настраиваем логгер
+logger = setup_logger("map_reduce")
+
+# Максимальное количество одновременных запросов к LLM при анализе чанков
+MAP_REDUCE_MAX_WORKERS = int(os.getenv("MAP_REDUCE_MAX_WORKERS", "4"))
+
+# Доля контекстного окна, которую могут занимать промежуточные анализы в reduce-промпте
+REDUCE_CONTEXT_RATIO = 0.6
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def parallel_map(func: Callable[[T], R], items: List[T], max_workers: int = MAP_REDUCE_MAX_WORKERS) -> List[R]:
+    """
+    Выполняет func для каждого элемента в пуле потоков с сохранением порядка
+
+    Args:
+        func: Функция, применяемая к элементу
+        items: Элементы
+        max_workers: Максимальное количество одновременных вызовов
+
+    Returns:
+        List[R]: Результаты в порядке элементов
+    """
+    if len(items) <= 1 or max_workers <= 1:
+        return [func(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        return list(executor.map(func, items))
+
+
+def analyze_chunks(
+    llm_client: Any,
+    chunks: List[List[dict]],
+    build_prompt: Callable[[List[dict]], str],
+    build_query: Callable[[List[dict]], str],
+    max_workers: int = MAP_REDUCE_MAX_WORKERS
+) -> List[str]:
+    """
+    Map-этап: параллельный анализ чанков материалов
+
+    Args:
+        llm_client: Клиент LLM
+        chunks: Чанки материалов
+        build_prompt: Построение промпта для чанка
+        build_query: Построение query для чанка
+        max_workers: Максимальное количество одновременных запросов
+
+    Returns:
+        List[str]: Анализы чанков в порядке чанков
+    """
+    total = len(chunks)
+
+    def analyze(indexed_chunk):
+        index, chunk = indexed_chunk
+        logger.info(f"Анализ чанка {index + 1}/{total}")
+        result = llm_client.analyze_text(prompt=build_prompt(chunk), query=build_query(chunk))
+        return result.get('analysis', '')
+
+    logger.info(f"Параллельный анализ {total} чанков (до {max_workers} одновременно)")
+    return parallel_map(analyze, list(enumerate(chunks)), max_workers)
+
+
+def collapse_summaries(
+    llm_client: Any,
+    summaries: List[str],
+    max_context_size: int,
+    count_tokens: Callable[[str], int],
+    topic: str,
+    max_workers: int = MAP_REDUCE_MAX_WORKERS
+) -> List[str]:
+    """
+    Иерархическая свертка анализов чанков, пока они не поместятся в один reduce-промпт
+
+    Анализы группируются по размеру контекстного окна, каждая группа сворачивается
+    отдельным запросом к LLM (группы - параллельно), и так до тех пор, пока общий
+    объем не уложится в REDUCE_CONTEXT_RATIO от контекста.
+
+    Args:
+        llm_client: Клиент LLM
+        summaries: Анализы чанков
+        max_context_size: Максимальный размер контекста модели
+        count_tokens: Функция подсчета токенов
+        topic: Описание темы (категория, запрос), которое попадает в промпт свертки
+        max_workers: Максимальное количество одновременных запросов
+
+    Returns:
+        List[str]: Анализы, помещающиеся в один reduce-промпт
+    """
+    budget = int(max_context_size * REDUCE_CONTEXT_RATIO)
+    level = 1
+
+    while len(summaries) > 1:
+        sizes = [count_tokens(summary) for summary in summaries]
+        if sum(sizes) <= budget:
+            break
+
+        # Жадно набираем группы, каждая из которых помещается в бюджет
+        groups = []
+        current_group = []
+        current_size = 0
+        for summary, size in zip(summaries, sizes):
+            if current_group and current_size + size > budget:
+                groups.append(current_group)
+                current_group = []
+                current_size = 0
+            current_group.append(summary)
+            current_size += size
+        if current_group:
+            groups.append(current_group)
+
+        # Если каждый анализ уже занимает целую группу, дальнейшая свертка ничего не даст
+        if len(groups) == len(summaries):
+            logger.warning("Анализы чанков слишком велики для иерархической свертки")
+            break
+
+        logger.info(f"Уровень свертки {level}: {len(summaries)} анализов -> {len(groups)} групп")
+
+        def merge(group):
+            prompt = f"""
+            Merge the following partial analyses ({topic}) into one consolidated analysis.
+            Keep every distinct event or news item together with its source links, remove duplicates,
+            and do not add information that is not present in the analyses.
+
+            Partial analyses:
+            {group}
+            """
+            result = llm_client.analyze_text(prompt=prompt, query="\n".join(group))
+            return result.get('analysis', '')
+
+        summaries = parallel_map(merge, groups, max_workers)
+        level += 1
+
+    return summaries
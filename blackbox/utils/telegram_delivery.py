@@ -0,0 +1,222 @@
+import asyncio
+import hashlib
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest
+from logger_config import setup_logger
+
+# Настраиваем логгер
+logger = setup_logger("telegram_delivery")
+
+# Общий лимит бота (Telegram допускает около 30 сообщений в секунду)
+DELIVERY_GLOBAL_RATE = float(os.getenv("DELIVERY_GLOBAL_RATE", "25"))
+# Минимальный интервал между сообщениями в один чат: личные чаты ~1 в секунду, группы ~20 в минуту
+DELIVERY_PRIVATE_INTERVAL = float(os.getenv("DELIVERY_PRIVATE_INTERVAL", "1.0"))
+DELIVERY_GROUP_INTERVAL = float(os.getenv("DELIVERY_GROUP_INTERVAL", "3.0"))
+# Количество чатов, которым сообщения отправляются одновременно
+DELIVERY_MAX_CONCURRENCY = int(os.getenv("DELIVERY_MAX_CONCURRENCY", "20"))
+# Сколько раз повторять отправку после RetryAfter или сетевой ошибки
+DELIVERY_MAX_RETRIES = int(os.getenv("DELIVERY_MAX_RETRIES", "5"))
+
+
+class AsyncRateLimiter:
+    """Равномерный лимит запросов в секунду для одного event loop"""
+
+    def __init__(self, rate: float):
+        """
+        Args:
+            rate: Максимальное количество запросов в секунду
+        """
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Ожидает свободный слот для очередного запроса"""
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """Откладывает все следующие запросы (после RetryAfter от Telegram)"""
+        self._next_slot = max(self._next_slot, time.monotonic() + seconds)
+
+
+@dataclass
+class DeliveryItem:
+    """Сообщение из нескольких частей для одного чата (например, дайджест категории)"""
+    key: str
+    parts: List[str]
+    # Количество частей, уже доставленных в предыдущих запусках
+    parts_sent: int = 0
+
+    @property
+    def content_hash(self) -> str:
+        """Хэш частей сообщения: прогресс прошлого запуска применим, только если он совпадает"""
+        return hashlib.sha256("\x00".join(self.parts).encode("utf-8")).hexdigest()
+
+    def resume_from(self, parts_sent: int, content_hash: Optional[str]) -> None:
+        """
+        Продолжает доставку с прогресса прошлого запуска
+
+        Если сообщение изменилось (дайджест пересчитан или разбит иначе),
+        доставленные части не соответствуют новым, и отправка начинается заново.
+
+        Args:
+            parts_sent: Количество частей, доставленных в прошлом запуске
+            content_hash: Хэш частей, с которыми был сохранен прогресс
+        """
+        self.parts_sent = parts_sent if content_hash == self.content_hash else 0
+
+
+@dataclass
+class ChatDelivery:
+    """Все сообщения для одного чата; отправляются строго по порядку"""
+    chat_id: int
+    items: List[DeliveryItem] = field(default_factory=list)
+
+
+# Колбэк сохранения прогресса: (chat_id, item, parts_sent, status)
+ProgressCallback = Callable[[int, DeliveryItem, int, str], Awaitable[None]]
+
+
+class TelegramDelivery:
+    """
+    Конкурентная рассылка сообщений через один Bot с общим пулом соединений
+
+    Разные чаты обслуживаются параллельно (до max_concurrency), сообщения внутри
+    чата - последовательно. Соблюдаются общий лимит бота и лимит на чат,
+    RetryAfter от Telegram приостанавливает всю рассылку на указанное время.
+    """
+
+    def __init__(
+        self,
+        token: str,
+        on_progress: Optional[ProgressCallback] = None,
+        global_rate: float = DELIVERY_GLOBAL_RATE,
+        max_concurrency: int = DELIVERY_MAX_CONCURRENCY,
+        max_retries: int = DELIVERY_MAX_RETRIES
+    ):
+        """
+        Инициализация рассылки
+
+        Args:
+            token: Токен Telegram бота
+            on_progress: Колбэк, вызываемый после каждой доставленной части и при ошибке
+            global_rate: Общий лимит сообщений в секунду
+            max_concurrency: Количество чатов, обслуживаемых одновременно
+            max_retries: Количество повторов отправки одной части
+        """
+        self.token = token
+        self.on_progress = on_progress
+        self.global_rate = global_rate
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+
+    @staticmethod
+    def _chat_interval(chat_id: int) -> float:
+        """Минимальный интервал между сообщениями в чат (у групп отрицательные ID)"""
+        return DELIVERY_GROUP_INTERVAL if chat_id < 0 else DELIVERY_PRIVATE_INTERVAL
+
+    async def _report(self, chat_id: int, item: DeliveryItem, parts_sent: int, status: str) -> None:
+        """Передает прогресс в колбэк; ошибка сохранения не прерывает рассылку"""
+        if self.on_progress is None:
+            return
+        try:
+            await self.on_progress(chat_id, item, parts_sent, status)
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении прогресса рассылки для чата {chat_id}: {str(e)}")
+
+    async def _send_part(self, bot: Bot, limiter: AsyncRateLimiter, chat_id: int, text: str) -> None:
+        """Отправка одной части с повторами после RetryAfter и сетевых ошибок"""
+        for attempt in range(self.max_retries + 1):
+            await limiter.acquire()
+            try:
+                await bot.send_message(chat_id=chat_id, text=text)
+                return
+            except TelegramRetryAfter as e:
+                if attempt >= self.max_retries:
+                    raise
+                logger.warning(f"Telegram просит подождать {e.retry_after} сек (чат {chat_id})")
+                limiter.pause(e.retry_after)
+                await asyncio.sleep(e.retry_after)
+            except (TelegramForbiddenError, TelegramBadRequest):
+                # Бот заблокирован или чат недоступен - повтор не поможет
+                raise
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = 2 ** attempt
+                logger.warning(f"Ошибка отправки в чат {chat_id}, повтор через {delay} сек: {str(e)}")
+                await asyncio.sleep(delay)
+
+    async def _deliver_chat(
+        self,
+        bot: Bot,
+        limiter: AsyncRateLimiter,
+        semaphore: asyncio.Semaphore,
+        chat: ChatDelivery,
+        stats: Dict[str, int]
+    ) -> None:
+        """Последовательная отправка всех сообщений одному чату"""
+        interval = self._chat_interval(chat.chat_id)
+        async with semaphore:
+            last_sent = 0.0
+            for item in chat.items:
+                if item.parts_sent >= len(item.parts):
+                    stats['skipped'] += 1
+                    continue
+
+                try:
+                    for index in range(item.parts_sent, len(item.parts)):
+                        wait = last_sent + interval - time.monotonic()
+                        if wait > 0:
+                            await asyncio.sleep(wait)
+                        await self._send_part(bot, limiter, chat.chat_id, item.parts[index])
+                        last_sent = time.monotonic()
+                        item.parts_sent = index + 1
+                        status = 'delivered' if item.parts_sent == len(item.parts) else 'sending'
+                        await self._report(chat.chat_id, item, item.parts_sent, status)
+                    stats['delivered'] += 1
+                    logger.info(f"Сообщение {item.key} доставлено в чат {chat.chat_id} ({len(item.parts)} частей)")
+                except Exception as e:
+                    stats['failed'] += 1
+                    logger.error(f"Ошибка при отправке {item.key} в чат {chat.chat_id}: {str(e)}")
+                    await self._report(chat.chat_id, item, item.parts_sent, 'failed')
+                    if isinstance(e, TelegramForbiddenError):
+                        # Остальные сообщения в этот чат тоже не дойдут
+                        break
+
+    async def deliver(self, chats: List[ChatDelivery]) -> Dict[str, Any]:
+        """
+        Рассылка сообщений по чатам в одном event loop
+
+        Args:
+            chats: Сообщения, сгруппированные по чатам
+
+        Returns:
+            Dict[str, Any]: Количество доставленных, пропущенных (уже доставленных ранее)
+                и неудачных сообщений
+        """
+        stats = {'delivered': 0, 'skipped': 0, 'failed': 0}
+        if not chats:
+            return stats
+
+        bot = Bot(token=self.token)
+        limiter = AsyncRateLimiter(self.global_rate)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        try:
+            await asyncio.gather(*[
+                self._deliver_chat(bot, limiter, semaphore, chat, stats)
+                for chat in chats
+            ])
+        finally:
+            await bot.session.close()
+
+        return stats
@@ -0,0 +1,157 @@
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+import tiktoken
+from logger_config import setup_logger
+
+# Настраиваем логгер
+logger = setup_logger("tokenization")
+
+# Модель, под которую по умолчанию считаются токены
+DEFAULT_TOKENIZER_MODEL = "gpt-3.5-turbo"
+
+# Начиная с этого количества материалов токены считаются пакетно (encode_batch)
+BATCH_ENCODE_THRESHOLD = 64
+
+# Сколько подсчетов токенов (по модели и тексту) запоминается между вызовами
+TOKEN_COUNT_CACHE_SIZE = 10000
+
+# Подсчеты токенов хранятся отдельно от материалов, чтобы не дописывать в них служебные поля
+_token_counts: Dict[Tuple[str, str], int] = {}
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str = DEFAULT_TOKENIZER_MODEL) -> Optional[tiktoken.Encoding]:
+    """
+    Возвращает токенизатор для модели; загружается один раз на процесс
+
+    Если токенизатор загрузить не удалось, None тоже запоминается, чтобы не
+    повторять загрузку на каждый текст - используется приблизительный подсчет.
+
+    Args:
+        model: Модель для определения токенизатора
+
+    Returns:
+        Optional[tiktoken.Encoding]: Токенизатор или None
+    """
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            logger.warning(f"Токенизатор для модели {model} не найден, используем cl100k_base")
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.error(f"Не удалось загрузить токенизатор для модели {model}: {str(e)}")
+        return None
+
+
+def _approximate_tokens(text: str) -> int:
+    """Приблизительный подсчет токенов, если tiktoken недоступен"""
+    return int(len(text.split()) * 1.3)
+
+
+def count_tokens(text: str, model: str = DEFAULT_TOKENIZER_MODEL) -> int:
+    """
+    Подсчет количества токенов в тексте с учетом модели
+
+    Args:
+        text: Текст для подсчета токенов
+        model: Модель для определения токенизатора
+
+    Returns:
+        int: Количество токенов
+    """
+    encoding = get_encoding(model)
+    if encoding is None:
+        return _approximate_tokens(text)
+
+    try:
+        return len(encoding.encode(text, disallowed_special=()))
+    except Exception as e:
+        logger.error(f"Ошибка при подсчете токенов: {str(e)}")
+        return _approximate_tokens(text)
+
+
+def count_material_tokens(materials: List[Dict[str, Any]], model: str = DEFAULT_TOKENIZER_MODEL) -> List[int]:
+    """
+    Количество токенов в тексте каждого материала
+
+    Подсчеты запоминаются по тексту в кэше модуля (сами материалы не
+    изменяются), поэтому повторные вызовы для тех же материалов не
+    токенизируют текст заново. Большие списки кодируются пакетно.
+
+    Args:
+        materials: Список материалов с полем text
+        model: Модель для определения токенизатора
+
+    Returns:
+        List[int]: Количество токенов по материалам
+    """
+    texts = [material['text'] for material in materials]
+    known = {text: _token_counts[(model, text)] for text in texts if (model, text) in _token_counts}
+    pending = [text for text in dict.fromkeys(texts) if text not in known]
+
+    encoding = get_encoding(model)
+    if encoding is not None and len(pending) >= BATCH_ENCODE_THRESHOLD:
+        try:
+            encoded = encoding.encode_batch(pending, disallowed_special=())
+            for text, tokens in zip(pending, encoded):
+                known[text] = len(tokens)
+        except Exception as e:
+            logger.error(f"Ошибка при пакетном подсчете токенов: {str(e)}")
+
+    for text in pending:
+        if text not in known:
+            known[text] = count_tokens(text, model)
+        _token_counts[(model, text)] = known[text]
+
+    # Вытесняем самые старые подсчеты (словарь хранит порядок добавления)
+    while len(_token_counts) > TOKEN_COUNT_CACHE_SIZE:
+        del _token_counts[next(iter(_token_counts))]
+
+    return [known[text] for text in texts]
+
+
+def pack_chunks(
+    materials: List[Dict[str, Any]],
+    token_counts: List[int],
+    token_budget: float,
+    chunk_size: int
+) -> List[List[Dict[str, Any]]]:
+    """
+    Упаковка материалов в чанки за один проход по готовым счетчикам токенов
+
+    Новый чанк начинается, когда материал не помещается в бюджет токенов
+    или в чанке уже chunk_size материалов.
+
+    Args:
+        materials: Список материалов
+        token_counts: Количество токенов по материалам
+        token_budget: Максимум токенов материалов в одном чанке
+        chunk_size: Максимум материалов в одном чанке
+
+    Returns:
+        List[List[Dict[str, Any]]]: Список чанков
+    """
+    chunks = []
+    current_chunk = []
+    current_size = 0
+
+    for material, material_tokens in zip(materials, token_counts):
+        if current_size + material_tokens > token_budget:
+            if current_chunk:
+                chunks.append(current_chunk)
+            current_chunk = [material]
+            current_size = material_tokens
+        else:
+            current_chunk.append(material)
+            current_size += material_tokens
+
+        if len(current_chunk) >= chunk_size:
+            chunks.append(current_chunk)
+            current_chunk = []
+            current_size = 0
+
+    if current_chunk:
+        chunks.append(current_chunk)
+
+    return chunks
@@ -1,7 +1,8 @@
 import os
 import motor.motor_asyncio
-from typing import List, Dict, Any
-from bson import ObjectId
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, AsyncIterator, Optional
+from bson import ObjectId, Timestamp
 from dotenv import load_dotenv
 
 # Загружаем переменные окружения
@@ -15,35 +16,205 @@ DB_NAME = os.getenv("DB_NAME", "tg_auth_service")  # Изменено с "trendw
 client = motor.motor_asyncio.AsyncIOMotorClient(MONGODB_URL)
 db = client[DB_NAME]
 
-async def get_unvectorized_data_async():
-    """Асинхронная версия получения невекторизованных данных"""
+# Поля документа, которые нужны для векторизации
+VECTORIZATION_FIELDS = {
+    "url": 1, "title": 1, "description": 1, "content": 1,
+    "date": 1, "category": 1, "source_type": 1
+}
+
+# Срок аренды захваченных воркером документов (секунды); после него документы может взять другой воркер
+VECTORIZATION_LEASE_SECONDS = float(os.getenv("VECTORIZATION_LEASE_SECONDS", "600"))
+
+async def ensure_indexes_async():
+    """Создает индекс для выбора невекторизованных данных по _id"""
     try:
-        cursor = db.parsed_data.find({"vectorized": False})
-        documents = await cursor.to_list(length=None)
+        await db.parsed_data.create_index([("vectorized", 1), ("_id", 1)])
+    except Exception as e:
+        print(f"Ошибка при создании индексов: {e}")
+
+def _claimable_filter(now: datetime) -> Dict[str, Any]:
+    """Невекторизованные документы без владельца или с истекшей арендой"""
+    return {
+        "vectorized": False,
+        "$or": [{"vectorizing_by": None}, {"lease_until": {"$lt": now}}]
+    }
+
+async def _claim_documents(object_ids: List[ObjectId], worker_id: str, lease_seconds: float) -> List[Dict[str, Any]]:
+    """Захватывает свободные документы из списка и возвращает доставшиеся воркеру"""
+    now = datetime.utcnow()
+    await db.parsed_data.update_many(
+        {"_id": {"$in": object_ids}, **_claimable_filter(now)},
+        {"$set": {"vectorizing_by": worker_id, "lease_until": now + timedelta(seconds=lease_seconds)}}
+    )
+    
+    cursor = db.parsed_data.find(
+        {"_id": {"$in": object_ids}, "vectorized": False, "vectorizing_by": worker_id},
+        VECTORIZATION_FIELDS
+    ).sort("_id", 1)
+    documents = await cursor.to_list(length=None)
+    for doc in documents:
+        doc["_id"] = str(doc["_id"])
+    return documents
+
+async def claim_documents_async(ids: List[str], worker_id: str, lease_seconds: float = VECTORIZATION_LEASE_SECONDS) -> List[Dict[str, Any]]:
+    """
+    Атомарно захватывает документы для векторизации воркером
+    
+    Захватываются только свободные документы и документы с истекшей арендой,
+    поэтому при гонке каждый документ достается одному воркеру.
+    
+    Args:
+        ids: _id документов (строки)
+        worker_id: Идентификатор воркера
+        lease_seconds: Срок аренды
         
-        # Конвертируем ObjectId в строки для JSON сериализации
-        for doc in documents:
-            if "_id" in doc:
-                doc["_id"] = str(doc["_id"])
+    Returns:
+        List[Dict[str, Any]]: Захваченные документы (поля для векторизации) в порядке _id
+    """
+    if not ids:
+        return []
+    try:
+        return await _claim_documents([ObjectId(x) for x in ids], worker_id, lease_seconds)
+    except Exception as e:
+        print(f"Ошибка при захвате документов для векторизации: {e}")
+        return []
+
+async def claim_unvectorized_batch_async(worker_id: str, batch_size: int, lease_seconds: float = VECTORIZATION_LEASE_SECONDS) -> List[Dict[str, Any]]:
+    """
+    Захватывает следующую порцию свободных невекторизованных документов
+    
+    Args:
+        worker_id: Идентификатор воркера
+        batch_size: Размер порции
+        lease_seconds: Срок аренды
         
-        return documents
+    Returns:
+        List[Dict[str, Any]]: Захваченные документы; пустой список - свободных документов нет
+    """
+    try:
+        while True:
+            cursor = db.parsed_data.find(_claimable_filter(datetime.utcnow()), {"_id": 1}).sort("_id", 1).limit(batch_size)
+            candidates = [doc["_id"] for doc in await cursor.to_list(length=batch_size)]
+            if not candidates:
+                return []
+            
+            documents = await _claim_documents(candidates, worker_id, lease_seconds)
+            # Пусто, если все кандидаты только что захватили другие воркеры - берем следующие
+            if documents:
+                return documents
     except Exception as e:
-        print(f"Ошибка при получении невекторизованных данных: {e}")
+        print(f"Ошибка при получении порции для векторизации: {e}")
         return []
 
-async def update_vectorization_status_async(ids: List[ObjectId]):
-    """Асинхронная версия обновления статуса векторизации"""
+async def renew_claimed_documents_async(ids: List[str], worker_id: str, lease_seconds: float = VECTORIZATION_LEASE_SECONDS) -> Optional[List[str]]:
+    """
+    Продлевает аренду документов, которыми воркер все еще владеет
+    
+    Вызывается перед векторизацией страницы: пока страница ждет в очереди,
+    аренда могла истечь, а документы - достаться другому воркеру.
+    
+    Args:
+        ids: _id документов (строки)
+        worker_id: Идентификатор воркера
+        lease_seconds: Новый срок аренды (от текущего момента)
+        
+    Returns:
+        Optional[List[str]]: _id документов, которые остались за воркером, или None при ошибке
+    """
+    if not ids:
+        return []
+    try:
+        object_ids = [ObjectId(x) for x in ids]
+        owned = {"_id": {"$in": object_ids}, "vectorized": False, "vectorizing_by": worker_id}
+        await db.parsed_data.update_many(
+            owned,
+            {"$set": {"lease_until": datetime.utcnow() + timedelta(seconds=lease_seconds)}}
+        )
+        cursor = db.parsed_data.find(owned, {"_id": 1})
+        return [str(doc["_id"]) for doc in await cursor.to_list(length=None)]
+    except Exception as e:
+        print(f"Ошибка при продлении аренды документов: {e}")
+        return None
+
+async def complete_claimed_documents_async(ids: List[str], worker_id: str) -> int:
+    """
+    Отмечает захваченные воркером документы векторизованными и снимает аренду
+    
+    Обновляются только документы, которыми воркер все еще владеет, поэтому
+    повторный вызов и вызов после потери аренды ничего не меняют.
+    
+    Args:
+        ids: _id документов (строки)
+        worker_id: Идентификатор воркера
+        
+    Returns:
+        int: Количество обновленных документов
+    """
     try:
         result = await db.parsed_data.update_many(
-            {"_id": {"$in": ids}},
-            {"$set": {"vectorized": True}}
+            {"_id": {"$in": [ObjectId(x) for x in ids]}, "vectorizing_by": worker_id},
+            {"$set": {"vectorized": True}, "$unset": {"vectorizing_by": "", "lease_until": ""}}
         )
-        print(f"Обновлен статус векторизации для {result.modified_count} записей")
         return result.modified_count
     except Exception as e:
         print(f"Ошибка при обновлении статуса векторизации: {e}")
         return 0
 
+async def release_claimed_documents_async(ids: List[str], worker_id: str) -> int:
+    """
+    Снимает аренду воркера с документов, чтобы их сразу могли взять другие воркеры
+    
+    Args:
+        ids: _id документов (строки)
+        worker_id: Идентификатор воркера
+        
+    Returns:
+        int: Количество освобожденных документов
+    """
+    try:
+        result = await db.parsed_data.update_many(
+            {"_id": {"$in": [ObjectId(x) for x in ids]}, "vectorizing_by": worker_id},
+            {"$unset": {"vectorizing_by": "", "lease_until": ""}}
+        )
+        return result.modified_count
+    except Exception as e:
+        print(f"Ошибка при освобождении документов: {e}")
+        return 0
+
+async def get_operation_time_async() -> Optional[Timestamp]:
+    """
+    Текущее время операций кластера для запуска change stream с этого момента
+    
+    Returns:
+        Optional[Timestamp]: Время операций или None, если change stream недоступен
+            (standalone mongod не возвращает operationTime)
+    """
+    try:
+        response = await db.command("ping")
+        return response.get("operationTime")
+    except Exception as e:
+        print(f"Ошибка при получении времени операций MongoDB: {e}")
+        return None
+
+async def watch_unvectorized_inserts_async(start_at: Optional[Timestamp] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Отдает новые невекторизованные документы из change stream коллекции parsed_data
+    
+    Change stream доступен только на replica set / sharded cluster.
+    
+    Args:
+        start_at: Время операций, с которого читать вставки (None - с текущего момента)
+    """
+    pipeline = [
+        {"$match": {"operationType": "insert", "fullDocument.vectorized": False}},
+        {"$project": {"fullDocument._id": 1, **{"fullDocument." + field: 1 for field in VECTORIZATION_FIELDS}}}
+    ]
+    async with db.parsed_data.watch(pipeline, start_at_operation_time=start_at) as stream:
+        async for change in stream:
+            doc = change["fullDocument"]
+            doc["_id"] = str(doc["_id"])
+            yield doc
+
 async def get_vectorized_data_count_async():
     """Асинхронная версия получения количества векторизованных записей"""
     try:
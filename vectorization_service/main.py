@@ -3,12 +3,7 @@ from pydantic import BaseModel
 from typing import Optional
 import logging
 from vectorization_tasks import start_vectorization_task, get_vectorization_status
-from database import (
-    get_unvectorized_data_async, 
-    update_vectorization_status_async,
-    get_vectorized_data_count_async,
-    get_unvectorized_data_count_async
-)
+from database import get_vectorized_data_count_async, get_unvectorized_data_count_async
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
@@ -31,7 +26,12 @@ class VectorizationStatus(BaseModel):
 
 @app.post("/vectorization/start", response_model=VectorizationStatus)
 async def start_vectorization(request: VectorizationRequest):
-    """Запускает процесс векторизации невекторизованных данных"""
+    """
+    Запускает процесс векторизации невекторизованных данных
+    
+    Задача забирает документы страницами через захват с арендой (VectorizationClaims),
+    а не загружает весь набор в память.
+    """
     try:
         # Получаем количество невекторизованных записей
         unvectorized_count = await get_unvectorized_data_count_async()
@@ -0,0 +1,183 @@
+import os
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, List
+from vector_store import VectorStore
+from database import ensure_indexes_async, get_operation_time_async, watch_unvectorized_inserts_async
+from vectorization_pipeline import run_vectorization_pipeline, VectorizationClaims, VECTORIZATION_PAGE_SIZE
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Максимальный размер микро-батча новых документов
+VECTORIZATION_STREAM_BATCH_SIZE = int(os.getenv("VECTORIZATION_STREAM_BATCH_SIZE", "50"))
+# Максимальное время (секунды), которое новый документ ждет заполнения микро-батча
+VECTORIZATION_STREAM_MAX_LATENCY = float(os.getenv("VECTORIZATION_STREAM_MAX_LATENCY", "2.0"))
+# Интервал опроса MongoDB, если change stream недоступен (standalone mongod)
+VECTORIZATION_POLL_INTERVAL = float(os.getenv("VECTORIZATION_POLL_INTERVAL", "5.0"))
+# Пауза перед перезапуском потока после ошибки (секунды)
+VECTORIZATION_RESTART_DELAY = float(os.getenv("VECTORIZATION_RESTART_DELAY", "10.0"))
+
+# Маркер конца потока документов
+_END = object()
+
+async def micro_batches(
+    docs: AsyncIterator[Dict[str, Any]],
+    batch_size: int = VECTORIZATION_STREAM_BATCH_SIZE,
+    max_latency: float = VECTORIZATION_STREAM_MAX_LATENCY
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Собирает поток документов в микро-батчи
+
+    Батч отдается, как только набралось batch_size документов или первый
+    документ батча ждет дольше max_latency.
+
+    Args:
+        docs: Поток документов
+        batch_size: Максимальный размер батча
+        max_latency: Максимальное ожидание первого документа батча
+
+    Yields:
+        List[Dict[str, Any]]: Батч документов
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=batch_size * 2)
+
+    async def produce():
+        try:
+            async for doc in docs:
+                await queue.put(doc)
+        finally:
+            await queue.put(_END)
+
+    producer = asyncio.create_task(produce())
+    try:
+        batch = []
+        deadline = 0.0
+        while True:
+            timeout = max(deadline - loop.time(), 0) if batch else None
+            try:
+                doc = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                yield batch
+                batch = []
+                continue
+
+            if doc is _END:
+                break
+            if not batch:
+                deadline = loop.time() + max_latency
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+
+        if batch:
+            yield batch
+        # Ошибка чтения потока (например, обрыв change stream) передается дальше
+        await producer
+    finally:
+        producer.cancel()
+
+async def stream_claimed_pages(
+    claims: VectorizationClaims,
+    start_at,
+    batch_size: int = VECTORIZATION_STREAM_BATCH_SIZE,
+    max_latency: float = VECTORIZATION_STREAM_MAX_LATENCY
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Захваченные страницы: сначала накопившиеся документы, затем новые из change stream
+
+    Change stream читается с момента start_at, взятого до начала дочитывания,
+    поэтому документы, вставленные во время дочитывания, не теряются. Новые
+    документы собираются в микро-батчи и захватываются перед векторизацией,
+    так что с пакетными воркерами они не пересекаются.
+
+    Args:
+        claims: Аренда документов воркера
+        start_at: Время операций кластера, с которого читать change stream
+        batch_size: Максимальный размер микро-батча
+        max_latency: Максимальное ожидание документа в неполном микро-батче
+    """
+    async for page in claims.pages(VECTORIZATION_PAGE_SIZE):
+        yield page
+
+    logger.info("📡 Накопившиеся данные обработаны, слушаем новые документы")
+    batches = micro_batches(watch_unvectorized_inserts_async(start_at), batch_size, max_latency)
+    try:
+        async for batch in batches:
+            page = await claims.claim(batch)
+            if page:
+                yield page
+    finally:
+        await batches.aclose()
+
+async def poll_claimed_pages(
+    claims: VectorizationClaims,
+    poll_interval: float = VECTORIZATION_POLL_INTERVAL
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Захваченные страницы через периодический опрос (для standalone mongod)
+
+    Args:
+        claims: Аренда документов воркера
+        poll_interval: Пауза между опросами
+    """
+    while True:
+        async for page in claims.pages(VECTORIZATION_PAGE_SIZE):
+            yield page
+        await asyncio.sleep(poll_interval)
+
+async def run_realtime_vectorization(
+    vector_store: VectorStore,
+    batch_size: int = VECTORIZATION_STREAM_BATCH_SIZE,
+    max_latency: float = VECTORIZATION_STREAM_MAX_LATENCY,
+    restart_delay: float = VECTORIZATION_RESTART_DELAY
+):
+    """
+    Непрерывная векторизация новых документов parsed_data
+
+    Новые документы берутся из change stream (или опросом, если MongoDB
+    запущена без replica set), собираются в микро-батчи и проходят тот же
+    конвейер эмбеддингов и записи в Qdrant, что и пакетная векторизация.
+    После ошибки поток перезапускается с дочитыванием пропущенного.
+
+    Args:
+        vector_store: Векторное хранилище
+        batch_size: Максимальный размер микро-батча
+        max_latency: Максимальное ожидание документа в неполном микро-батче
+        restart_delay: Пауза перед перезапуском после ошибки
+    """
+    await ensure_indexes_async()
+
+    while True:
+        claims = VectorizationClaims()
+        start_at = await get_operation_time_async()
+        if start_at is not None:
+            logger.info(f"🚀 Векторизация в реальном времени через change stream (воркер {claims.worker_id})")
+            pages = stream_claimed_pages(claims, start_at, batch_size, max_latency)
+        else:
+            logger.info(f"🚀 Change stream недоступен, опрашиваем MongoDB каждые {VECTORIZATION_POLL_INTERVAL} сек")
+            pages = poll_claimed_pages(claims)
+
+        try:
+            result = await run_vectorization_pipeline(
+                vector_store, pages, on_page_committed=claims.commit, before_embed=claims.renew
+            )
+        finally:
+            await claims.release()
+
+        # Поток документов бесконечен: конвейер завершается только после ошибки
+        logger.error(
+            f"❌ Векторизация в реальном времени остановлена после {result['vectorized_count']} записей, "
+            f"перезапуск через {restart_delay} сек"
+        )
+        await asyncio.sleep(restart_delay)
+
+async def main():
+    """Запуск векторизации в реальном времени"""
+    await run_realtime_vectorization(VectorStore())
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Тесты сборки микро-батчей для векторизации в реальном времени
+"""
+
+import asyncio
+import sys
+import os
+import time
+
+import pytest
+
+# Добавляем текущую директорию в путь
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from realtime_vectorizer import micro_batches
+
+
+async def stream(delays, fail_after=None):
+    """Поток документов: перед каждым документом - пауза из delays"""
+    for index, delay in enumerate(delays):
+        await asyncio.sleep(delay)
+        if fail_after is not None and index == fail_after:
+            raise ConnectionError("change stream прерван")
+        yield {"_id": str(index)}
+
+
+async def collect(docs, batch_size, max_latency):
+    """Батчи и время, когда каждый из них был отдан"""
+    started = time.monotonic()
+    return [
+        ([doc["_id"] for doc in batch], time.monotonic() - started)
+        async for batch in micro_batches(docs, batch_size, max_latency)
+    ]
+
+
+def test_full_batches_are_emitted_without_waiting():
+    """Батч отдается сразу, как только набрано batch_size документов"""
+    batches = asyncio.run(collect(stream([0] * 7), batch_size=3, max_latency=10))
+
+    assert [ids for ids, _ in batches] == [["0", "1", "2"], ["3", "4", "5"], ["6"]]
+    assert batches[-1][1] < 1
+
+
+def test_partial_batch_is_flushed_after_max_latency():
+    """Неполный батч отдается, когда первый документ ждет дольше max_latency"""
+    batches = asyncio.run(collect(stream([0, 0, 0.3, 0]), batch_size=10, max_latency=0.1))
+
+    assert [ids for ids, _ in batches] == [["0", "1"], ["2", "3"]]
+    assert 0.08 <= batches[0][1] < 0.25
+
+
+def test_stream_error_is_propagated_after_pending_batch():
+    """Ошибка потока передается дальше после отдачи накопленных документов"""
+    received = []
+
+    async def run():
+        async for batch in micro_batches(stream([0, 0, 0], fail_after=2), batch_size=10, max_latency=10):
+            received.append([doc["_id"] for doc in batch])
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(run())
+    assert received == [["0", "1"]]
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Тесты поиска материалов в Qdrant: схлопывание чанков и постраничный обход
+"""
+
+import sys
+import os
+from datetime import datetime
+from types import SimpleNamespace
+
+# Добавляем текущую директорию в путь
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from vector_store import VectorStore
+
+
+class FakeQdrantClient:
+    """Клиент с заранее заданными точками: scroll отдает страницы с next_page_offset, как Qdrant"""
+
+    def __init__(self, points, hits=None):
+        self.points = points
+        self.hits = hits or []
+        self.scroll_offsets = []
+
+    def scroll(self, collection_name, scroll_filter, with_payload, with_vectors, limit, offset):
+        self.scroll_offsets.append(offset)
+        start = offset or 0
+        end = start + limit
+        return self.points[start:end], (end if end < len(self.points) else None)
+
+    def search(self, collection_name, query_vector, query_filter, score_threshold, limit):
+        return self.hits
+
+    def retrieve(self, collection_name, ids, with_payload, with_vectors):
+        return [point for point in self.points if point.id in ids]
+
+
+def make_store(points, hits=None) -> VectorStore:
+    # Конструктор подключается к Qdrant и создает эмбеддер - для поиска они не нужны
+    store = VectorStore.__new__(VectorStore)
+    store.collection_name = "test"
+    store.client = FakeQdrantClient(points, hits)
+    return store
+
+
+def point(index, score=0.0, **payload):
+    return SimpleNamespace(
+        id=index, score=score,
+        payload={"text": f"материал {index}", "url": f"https://example.com/{index}", **payload}
+    )
+
+
+def test_search_collapses_chunks_of_one_material():
+    """Несколько найденных чанков материала возвращаются одним материалом с полным текстом"""
+    first_chunk = point("m1", chunk_index=0, material_id="m1", text="начало", material_text="полный текст")
+    hits = [
+        point("c2", score=0.9, material_id="m1", chunk_index=1, text="конец"),
+        point("m1", score=0.8, material_id="m1", chunk_index=0, text="начало", material_text="полный текст"),
+        point("m2", score=0.7),
+    ]
+    store = make_store([first_chunk], hits)
+
+    materials = store.search_vectors([0.0], score_threshold=0.5)
+
+    assert [material["id"] for material in materials] == ["m1", "m2"]
+    assert materials[0]["text"] == "полный текст"
+    assert materials[0]["score"] == 0.9
+
+
+def test_category_search_reads_all_pages():
+    """Поиск по категории обходит все страницы scroll, пропуская неосновные чанки"""
+    points = [point(index) for index in range(2500)]
+    points.append(point(2500, material_id="0", chunk_index=1))
+    store = make_store(points)
+
+    materials = store.search_by_category_and_date_range("AI", datetime(2026, 10, 16), datetime(2026, 10, 17))
+
+    assert len(materials) == 2500
+    assert store.client.scroll_offsets == [None, 1000, 2000]
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Тесты захвата документов воркерами векторизации и конвейера эмбеддингов
+"""
+
+import asyncio
+import sys
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+from bson import ObjectId
+
+# Добавляем текущую директорию в путь
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import database
+from vectorization_pipeline import VectorizationClaims, run_vectorization_pipeline
+
+
+def _matches(doc, query):
+    """Подмножество языка запросов MongoDB, которое используют функции захвата"""
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(_matches(doc, option) for option in condition):
+                return False
+            continue
+        value = doc.get(key)
+        if isinstance(condition, dict):
+            if "$in" in condition and value not in condition["$in"]:
+                return False
+            if "$lt" in condition and (value is None or not value < condition["$lt"]):
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, field, direction):
+        self.docs.sort(key=lambda doc: doc[field], reverse=direction < 0)
+        return self
+
+    def limit(self, count):
+        self.docs = self.docs[:count]
+        return self
+
+    async def to_list(self, length=None):
+        # Между запросами воркеров event loop переключается, как при сетевом вызове
+        await asyncio.sleep(0)
+        return self.docs[:length] if length else self.docs
+
+
+class FakeParsedData:
+    """Коллекция parsed_data в памяти; update_many атомарен, как одна операция сервера"""
+
+    def __init__(self, count):
+        self.docs = [{"_id": ObjectId(), "url": f"https://example.com/{i}", "vectorized": False} for i in range(count)]
+
+    def find(self, query, projection=None):
+        return FakeCursor([dict(doc) for doc in self.docs if _matches(doc, query)])
+
+    async def update_many(self, query, update):
+        await asyncio.sleep(0)
+        matched = [doc for doc in self.docs if _matches(doc, query)]
+        for doc in matched:
+            doc.update(update.get("$set", {}))
+            for field in update.get("$unset", {}):
+                doc.pop(field, None)
+        return SimpleNamespace(matched_count=len(matched), modified_count=len(matched))
+
+
+class FakeVectorStore:
+    """Векторное хранилище, запоминающее векторизованные документы"""
+
+    def __init__(self):
+        self.embedded = []
+
+    def embed_materials(self, page):
+        self.embedded.extend(doc["url"] for doc in page)
+        return [], [doc["url"] for doc in page], [{} for _ in page]
+
+    def store_vectors(self, vectors, texts, metadata):
+        return True
+
+
+@pytest.fixture
+def parsed_data(monkeypatch):
+    collection = FakeParsedData(50)
+    monkeypatch.setattr(database, "db", SimpleNamespace(parsed_data=collection))
+    return collection
+
+
+def test_concurrent_workers_claim_each_document_once(parsed_data):
+    """При гонке за бэклог каждый документ достается ровно одному воркеру"""
+    claimed = {}
+
+    async def worker(name):
+        claims = VectorizationClaims(worker_id=name)
+        async for page in claims.pages(batch_size=7):
+            for doc in page:
+                claimed.setdefault(doc["_id"], []).append(name)
+            await claims.commit(page)
+
+    async def run():
+        await asyncio.gather(*[worker(f"worker-{i}") for i in range(4)])
+
+    asyncio.run(run())
+
+    assert len(claimed) == 50
+    assert all(len(owners) == 1 for owners in claimed.values())
+    assert all(doc["vectorized"] for doc in parsed_data.docs)
+
+
+def test_expired_lease_goes_to_another_worker(parsed_data):
+    """После истечения аренды документы забирает другой воркер, а первый их не отмечает"""
+    async def run():
+        slow = VectorizationClaims(worker_id="slow", lease_seconds=0.05)
+        page = await slow.claim_next(batch_size=10)
+        time.sleep(0.1)
+
+        fast = VectorizationClaims(worker_id="fast")
+        stolen = await fast.claim_next(batch_size=10)
+
+        return page, stolen, await slow.renew(page), await slow.commit(page), await fast.commit(stolen)
+
+    page, stolen, renewed, slow_committed, fast_committed = asyncio.run(run())
+
+    assert [doc["_id"] for doc in stolen] == [doc["_id"] for doc in page]
+    assert renewed == []
+    assert slow_committed == 0
+    assert fast_committed == 10
+
+
+def test_renewed_lease_is_not_claimed(parsed_data):
+    """Продленную аренду другой воркер не перехватывает"""
+    async def run():
+        first = VectorizationClaims(worker_id="first", lease_seconds=0.05)
+        page = await first.claim_next(batch_size=10)
+        time.sleep(0.03)
+        first.lease_seconds = 60
+        renewed = await first.renew(page)
+        time.sleep(0.05)
+        second = VectorizationClaims(worker_id="second")
+        return page, renewed, await second.claim_next(batch_size=10)
+
+    page, renewed, second_page = asyncio.run(run())
+
+    assert renewed == page
+    assert [doc["_id"] for doc in second_page] == [str(doc["_id"]) for doc in parsed_data.docs[10:20]]
+
+
+def test_pipeline_skips_page_with_lost_lease(parsed_data):
+    """Страница, аренду которой забрал другой воркер, не векторизуется повторно"""
+    vector_store = FakeVectorStore()
+
+    async def run():
+        claims = VectorizationClaims(worker_id="slow", lease_seconds=0.05)
+        page = await claims.claim_next(batch_size=10)
+
+        async def pages():
+            yield page
+            # Пока страница ждала векторизации, аренда истекла и документы забрал другой воркер
+            time.sleep(0.1)
+            await VectorizationClaims(worker_id="fast").claim(page)
+
+        async def delayed_renew(queued_page):
+            await asyncio.sleep(0.2)
+            return await claims.renew(queued_page)
+
+        return await run_vectorization_pipeline(
+            vector_store, pages(), on_page_committed=claims.commit, before_embed=delayed_renew
+        )
+
+    result = asyncio.run(run())
+
+    assert result["success"] is True
+    assert result["vectorized_count"] == 0
+    assert vector_store.embedded == []
@@ -1,7 +1,10 @@
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Union, Iterator, Tuple
 from datetime import datetime
 import uuid
+import hashlib
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import numpy as np
 from qdrant_client import QdrantClient
 from qdrant_client.http import models
 from qdrant_client.http.models import Distance, VectorParams, Filter, FieldCondition, Range, Payload
@@ -11,6 +14,133 @@ from text_processor import TextProcessor
 # Настраиваем логгер
 logger = setup_logger("vector_store")
 
+# Payload-индексы коллекции: keyword для точных совпадений, float для диапазонов
+PAYLOAD_INDEXES = {
+    "category": models.PayloadSchemaType.KEYWORD,
+    "source_type": models.PayloadSchemaType.KEYWORD,
+    "date_timestamp": models.PayloadSchemaType.FLOAT,
+}
+
+# Максимальное количество категорий, возвращаемых facet-запросом
+MAX_CATEGORIES = 10000
+
+# Размер страницы при постраничном обходе коллекции (scroll)
+SCROLL_PAGE_SIZE = 1000
+
+# Поля payload, из которых собирается материал при выборке по категории и дате
+MATERIAL_PAYLOAD_FIELDS = ['text', 'url', 'title', 'category', 'date', 'source_type']
+
+# Служебные поля payload, по которым чанки собираются обратно в материалы
+CHUNK_PAYLOAD_FIELDS = ['material_id', 'chunk_index', 'material_text']
+
+# Пространство имен для детерминированных ID точек (uuid5)
+POINT_ID_NAMESPACE = uuid.UUID("6f1c3a52-9d1e-4b7a-8c2f-3e5d7a9b1c40")
+
+# Параметры ссылок, которые не влияют на содержимое материала
+TRACKING_QUERY_PREFIXES = ("utm_", "fbclid", "gclid", "yclid")
+
+
+def normalize_url(url: str) -> str:
+    """
+    Приводит ссылку на материал к каноничному виду
+    
+    Схема и хост приводятся к нижнему регистру, отбрасываются фрагмент,
+    трекинговые параметры и завершающий слэш.
+    
+    Args:
+        url: Исходная ссылка
+        
+    Returns:
+        str: Нормализованная ссылка
+    """
+    url = (url or "").strip()
+    if not url:
+        return ""
+    
+    parts = urlsplit(url)
+    query = urlencode(sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith(TRACKING_QUERY_PREFIXES)
+    ))
+    path = parts.path.rstrip("/")
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, query, ""))
+
+
+def make_point_id(url: str, chunk_index: int = 0, text: str = "") -> str:
+    """
+    Детерминированный ID точки по нормализованной ссылке и номеру чанка
+    
+    Повторная загрузка того же материала дает тот же ID, поэтому upsert
+    перезаписывает точку вместо создания дубликата. Для материалов без
+    ссылки ID строится по хэшу текста.
+    
+    Args:
+        url: Ссылка на материал
+        chunk_index: Номер чанка внутри материала
+        text: Текст точки (используется, если ссылки нет)
+        
+    Returns:
+        str: UUID точки
+    """
+    key = normalize_url(url)
+    if not key:
+        key = "text:" + hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{key}#{chunk_index}"))
+
+
+
+def day_timestamp(value: Union[datetime, str]) -> Optional[float]:
+    """
+    Timestamp начала дня - значение поля date_timestamp в payload
+    
+    Args:
+        value: Дата (datetime или строка '%Y-%m-%d')
+        
+    Returns:
+        Optional[float]: Timestamp или None, если дату не удалось разобрать
+    """
+    try:
+        if isinstance(value, datetime):
+            value = value.strftime('%Y-%m-%d')
+        return datetime.strptime(value, '%Y-%m-%d').timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def date_range_condition(start_date: datetime, end_date: datetime) -> FieldCondition:
+    """
+    Фильтр по диапазону дат (включительно по дням) через индексированное поле date_timestamp
+    
+    Args:
+        start_date: Начальная дата
+        end_date: Конечная дата
+        
+    Returns:
+        FieldCondition: Условие для фильтра Qdrant
+    """
+    return FieldCondition(
+        key="date_timestamp",
+        range=Range(gte=day_timestamp(start_date), lte=day_timestamp(end_date))
+    )
+
+def make_chunk_id(material_id: str, chunk_index: int) -> str:
+    """
+    ID точки чанка материала
+    
+    Первый чанк хранится под ID самого материала, поэтому материалы из одного
+    чанка сохраняют прежние ID, а наличие материала проверяется по одной точке.
+    
+    Args:
+        material_id: ID материала (make_point_id с номером чанка 0)
+        chunk_index: Номер чанка внутри материала
+        
+    Returns:
+        str: UUID точки
+    """
+    if not chunk_index:
+        return material_id
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{material_id}#{chunk_index}"))
+
 class VectorStore:
     def __init__(
         self,
@@ -77,11 +207,27 @@ class VectorStore:
                 logger.info(f"Коллекция {self.collection_name} создана успешно")
             else:
                 logger.info(f"Коллекция {self.collection_name} уже существует")
+            
+            # Индексы создаются и для уже существующих коллекций
+            self._create_payload_indexes()
                 
         except Exception as e:
             logger.error(f"Ошибка при создании коллекции: {str(e)}")
             raise
 
+    def _create_payload_indexes(self):
+        """Создает payload-индексы для полей, по которым идет фильтрация"""
+        for field_name, field_schema in PAYLOAD_INDEXES.items():
+            try:
+                self.client.create_payload_index(
+                    collection_name=self.collection_name,
+                    field_name=field_name,
+                    field_schema=field_schema
+                )
+            except Exception as e:
+                # Повторное создание существующего индекса не должно ломать инициализацию
+                logger.warning(f"Не удалось создать индекс для поля {field_name}: {str(e)}")
+
     def _parse_date(self, date_str: str) -> str:
         """
         Преобразует дату из различных форматов в стандартный формат '%Y-%m-%d'
@@ -138,15 +284,18 @@ class VectorStore:
 
     def store_vectors(
         self,
-        vectors: List[List[float]],
+        vectors: Union[np.ndarray, List[List[float]]],
         texts: List[str],
         metadata: List[Dict[str, Any]]
     ) -> bool:
         """
         Сохраняет векторы в коллекцию с разбиением на батчи
         
+        Векторы загружаются срезами одной матрицы float32 в колоночном виде
+        (ids, vectors, payload), без сборки PointStruct на каждую точку.
+        
         Args:
-            vectors: Список векторов
+            vectors: Матрица векторов (или список векторов)
             texts: Список текстов
             metadata: Список метаданных
             
@@ -154,10 +303,12 @@ class VectorStore:
             bool: True если сохранение прошло успешно, False в противном случае
         """
         try:
-            if not vectors or not texts or not metadata:
+            if len(vectors) == 0 or not texts or not metadata:
                 logger.warning("Пустые данные для сохранения")
                 return False
             
+            vectors = np.asarray(vectors, dtype=np.float32)
+            
             # Максимальный размер батча (примерно 25MB для безопасности)
             MAX_BATCH_SIZE = 100
             total_points = len(vectors)
@@ -173,43 +324,50 @@ class VectorStore:
                 
                 logger.info(f"Обработка батча #{batch_number}: {current_batch_size} векторов")
                 
-                # Формируем точки для текущего батча
-                points = []
+                # Формируем ID и payload для текущего батча
+                point_ids = []
+                payloads = []
                 for i in range(processed_points, end_index):
-                    vector = vectors[i]
                     text = texts[i]
                     meta = metadata[i]
                     
-                    # Создаем UUID для точки
-                    point_id = str(uuid.uuid4())
+                    # ID зависит только от ссылки и номера чанка, поэтому повторная загрузка идемпотентна
+                    material_id = meta.get("material_id") or make_point_id(meta.get("url", ""), 0, text)
+                    point_id = make_chunk_id(material_id, meta.get("chunk_index", 0))
                     
                     # Преобразуем дату в нужный формат
                     date_str = meta.get("date", "")
                     formatted_date = self._parse_date(date_str)
                     
-                    point = models.PointStruct(
-                        id=point_id,
-                        vector=vector,
-                        payload={
-                            "text": text,
-                            "url": meta.get("url", ""),
-                            "title": meta.get("title", ""),
-                            "category": meta.get("category", ""),
-                            "date": formatted_date,
-                            "date_timestamp": datetime.strptime(formatted_date, "%Y-%m-%d").timestamp() if formatted_date else None,
-                            "source_type": meta.get("source_type", ""),
-                            "chunk_index": i,
-                            "total_chunks": total_points,
-                            "created_at": datetime.now().isoformat()
-                        }
-                    )
-                    points.append(point)
+                    payload = {
+                        "text": text,
+                        "url": meta.get("url", ""),
+                        "title": meta.get("title", ""),
+                        "category": meta.get("category", ""),
+                        "date": formatted_date,
+                        "date_timestamp": day_timestamp(formatted_date),
+                        "source_type": meta.get("source_type", ""),
+                        "material_id": material_id,
+                        "chunk_index": meta.get("chunk_index", 0),
+                        "total_chunks": meta.get("total_chunks", 1),
+                        "created_at": datetime.now().isoformat()
+                    }
+                    # Полный текст длинного материала хранится в его первом чанке
+                    if meta.get("material_text"):
+                        payload["material_text"] = meta["material_text"]
+                    
+                    point_ids.append(point_id)
+                    payloads.append(payload)
                 
                 # Сохраняем текущий батч
                 try:
-                    self.client.upsert(
+                    self.client.upload_collection(
                         collection_name=self.collection_name,
-                        points=points
+                        vectors=vectors[processed_points:end_index],
+                        payload=payloads,
+                        ids=point_ids,
+                        batch_size=current_batch_size,
+                        wait=True
                     )
                     
                     # Принудительно запускаем индексацию для батча
@@ -279,15 +437,7 @@ class VectorStore:
                     )
                 )
             if start_date and end_date:
-                filters.append(
-                    FieldCondition(
-                        key="date",
-                        range={
-                            "gte": start_date.isoformat(),
-                            "lte": end_date.isoformat()
-                        }
-                    )
-                )
+                filters.append(date_range_condition(start_date, end_date))
             
             # Поиск в Qdrant с учетом порога релевантности
             search_result = self.client.search(
@@ -298,23 +448,66 @@ class VectorStore:
                 limit=limit if limit is not None else 1000000  # Если limit не указан, используем максимальное значение
             )
             
-            # Преобразование результатов в нужный формат
-            return [
-                {
-                    "id": hit.id,
-                    "text": hit.payload.get("text", ""),
-                    "title": hit.payload.get("title", ""),
-                    "date": hit.payload.get("date"),
-                    "category": hit.payload.get("category"),
-                    "score": hit.score,  # Для отладки
-                    "url": hit.payload.get("url", "")  # Добавлено поле url
-                }
-                for hit in search_result
-            ]
+            # Несколько найденных чанков одного материала схлопываются в один материал
+            return self._collapse_chunk_hits(search_result)
         except Exception as e:
             logger.error(f"Ошибка при поиске векторов: {str(e)}")
             return []
 
+    def _collapse_chunk_hits(self, hits: List[models.ScoredPoint]) -> List[dict]:
+        """
+        Собирает найденные чанки обратно в материалы
+        
+        Материал получает score лучшего чанка и полный текст, который хранится
+        в первом чанке (при необходимости он дочитывается одним запросом).
+        Точки без material_id (сохраненные до разбиения на чанки) остаются как есть.
+        
+        Args:
+            hits: Результаты поиска, отсортированные по убыванию score
+            
+        Returns:
+            List[dict]: Материалы в порядке лучшего score
+        """
+        materials = {}
+        missing_text = []
+        for hit in hits:
+            payload = hit.payload or {}
+            material_id = payload.get("material_id") or str(hit.id)
+            if material_id in materials:
+                continue
+            
+            # Полный текст длинного материала есть только в первом чанке
+            if payload.get("chunk_index") and payload.get("material_id"):
+                missing_text.append(material_id)
+            materials[material_id] = {
+                "id": material_id,
+                "text": payload.get("material_text") or payload.get("text", ""),
+                "title": payload.get("title", ""),
+                "date": payload.get("date"),
+                "category": payload.get("category"),
+                "score": hit.score,  # Для отладки
+                "url": payload.get("url", "")  # Добавлено поле url
+            }
+        
+        if missing_text:
+            try:
+                first_chunks = self.client.retrieve(
+                    collection_name=self.collection_name,
+                    ids=missing_text,
+                    with_payload=["text", "material_text"],
+                    with_vectors=False
+                )
+                for point in first_chunks:
+                    payload = point.payload or {}
+                    text = payload.get("material_text") or payload.get("text")
+                    if text:
+                        materials[str(point.id)]["text"] = text
+            except Exception as e:
+                # Остается текст найденного чанка
+                logger.warning(f"Не удалось получить полный текст материалов: {str(e)}")
+        
+        return list(materials.values())
+
     def delete_vectors(self, filter_conditions: Dict[str, Any]) -> bool:
         """
         Удаляет векторы по условиям фильтра
@@ -353,22 +546,43 @@ class VectorStore:
         """
         Получение списка уникальных категорий из коллекции
         
+        Категории считаются facet-запросом по keyword-индексу поля category,
+        без выгрузки payload самих точек.
+        
         Returns:
             List[str]: Список категорий
         """
         try:
-            # Получаем все точки из коллекции
-            points = self.client.scroll(
-                collection_name=self.collection_name,
-                limit=10000  # Максимальное количество точек
-            )[0]
-            
-            # Извлекаем уникальные категории
             categories = set()
-            for point in points:
-                category = point.payload.get("category", "")
-                if category:
-                    categories.add(category)
+            try:
+                facet_result = self.client.facet(
+                    collection_name=self.collection_name,
+                    key="category",
+                    limit=MAX_CATEGORIES,
+                    exact=True
+                )
+                for hit in facet_result.hits:
+                    if hit.value:
+                        categories.add(hit.value)
+            except Exception as e:
+                # Старые версии Qdrant не поддерживают facet - обходим коллекцию только по полю category
+                logger.warning(f"Facet-запрос недоступен, используем постраничный обход: {str(e)}")
+                offset = None
+                while True:
+                    points, offset = self.client.scroll(
+                        collection_name=self.collection_name,
+                        with_payload=["category"],
+                        with_vectors=False,
+                        limit=1000,
+                        offset=offset
+                    )
+                    for point in points:
+                        category = point.payload.get("category", "")
+                        if category:
+                            categories.add(category)
+                    
+                    if offset is None:
+                        break
             
             logger.info(f"Найдено {len(categories)} уникальных категорий")
             return sorted(list(categories))
@@ -377,44 +591,142 @@ class VectorStore:
             logger.error(f"Ошибка при получении категорий: {str(e)}")
             return []
 
-    def add_materials(self, materials: List[Dict[str, Any]]) -> bool:
+    def _skip_stored_materials(self, materials: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """
-        Добавляет материалы в векторное хранилище
+        Отбрасывает материалы, точки которых уже сохранены в коллекции
         
         Args:
-            materials: Список материалов для добавления
+            materials: Список материалов
             
         Returns:
-            bool: True если добавление прошло успешно, False в противном случае
+            List[Dict[str, Any]]: Материалы, которых еще нет в хранилище
+        """
+        point_ids = [
+            make_point_id(
+                material.get('url', ''),
+                0,
+                f"{material.get('title', '')} {material.get('description', '')} {material.get('content', '')}"
+            )
+            for material in materials
+        ]
+        
+        try:
+            stored = self.client.retrieve(
+                collection_name=self.collection_name,
+                ids=list(set(point_ids)),
+                with_payload=False,
+                with_vectors=False
+            )
+        except Exception as e:
+            # Если проверить не удалось, просто перезаписываем точки через upsert
+            logger.warning(f"Не удалось проверить наличие точек в коллекции: {str(e)}")
+            return materials
+        
+        stored_ids = {str(point.id) for point in stored}
+        new_materials = []
+        seen_ids = set()
+        for material, point_id in zip(materials, point_ids):
+            # Пропускаем уже сохраненные материалы и повторы внутри одного батча
+            if point_id in stored_ids or point_id in seen_ids:
+                continue
+            seen_ids.add(point_id)
+            new_materials.append(material)
+        
+        skipped = len(materials) - len(new_materials)
+        if skipped:
+            logger.info(f"Пропущено {skipped} материалов, которые уже есть в хранилище")
+        return new_materials
+
+    def embed_materials(self, materials: List[Dict[str, Any]]) -> Optional[Tuple[np.ndarray, List[str], List[Dict[str, Any]]]]:
+        """
+        Подготавливает материалы к сохранению: отбрасывает уже сохраненные и получает эмбеддинги
+        
+        Отделено от записи в Qdrant, чтобы векторизация следующей порции могла
+        идти параллельно с записью предыдущей.
+        
+        Args:
+            materials: Список материалов
+            
+        Returns:
+            Optional[Tuple[np.ndarray, List[str], List[Dict[str, Any]]]]: Векторы, тексты и метаданные
+                чанков новых материалов (пустые, если все уже сохранены) или None при ошибке
         """
         try:
+            materials = self._skip_stored_materials(materials)
             if not materials:
-                logger.warning("Пустой список материалов для добавления")
-                return False
+                return np.empty((0, self.vector_size), dtype=np.float32), [], []
             
-            vectors = []
             texts = []
             metadata = []
             
             for material in materials:
                 # Формируем текст для векторизации
                 text = f"{material.get('title', '')} {material.get('description', '')} {material.get('content', '')}"
-                texts.append(text)
+                material_id = make_point_id(material.get('url', ''), 0, text)
+                
+                # Длинные материалы разбиваются на перекрывающиеся чанки, короткие остаются целыми
+                chunks = self.text_processor.chunk_text(text)
                 
-                # Формируем метаданные
-                meta = {
-                    'url': material.get('url', ''),
-                    'title': material.get('title', ''),
-                    'description': material.get('description', ''),
-                    'content': material.get('content', ''),
-                    'date': material.get('date', ''),
-                    'category': material.get('category', ''),
-                    'source_type': material.get('source_type', '')
-                }
-                metadata.append(meta)
-            
-            # Получаем векторы для текстов
-            vectors = self.text_processor.get_embeddings(texts)
+                # Первый чанк (ID материала) сохраняется последним: если он есть в
+                # хранилище, остальные чанки материала уже записаны
+                for chunk_index in list(range(1, len(chunks))) + [0]:
+                    texts.append(chunks[chunk_index])
+                    
+                    # Формируем метаданные
+                    meta = {
+                        'url': material.get('url', ''),
+                        'title': material.get('title', ''),
+                        'description': material.get('description', ''),
+                        'content': material.get('content', ''),
+                        'date': material.get('date', ''),
+                        'category': material.get('category', ''),
+                        'source_type': material.get('source_type', ''),
+                        'material_id': material_id,
+                        'chunk_index': chunk_index,
+                        'total_chunks': len(chunks)
+                    }
+                    if chunk_index == 0 and len(chunks) > 1:
+                        meta['material_text'] = text
+                    metadata.append(meta)
+            
+            if len(texts) > len(materials):
+                logger.info(f"{len(materials)} материалов разбито на {len(texts)} чанков")
+            
+            # Получаем векторы для текстов одной матрицей float32
+            vectors = self.text_processor.create_embedding_matrix(texts)
+            if len(vectors) != len(texts):
+                logger.error(f"Получено {len(vectors)} эмбеддингов для {len(texts)} текстов")
+                return None
+            
+            return vectors, texts, metadata
+            
+        except Exception as e:
+            logger.error(f"Ошибка при векторизации материалов: {str(e)}")
+            return None
+
+    def add_materials(self, materials: List[Dict[str, Any]]) -> bool:
+        """
+        Добавляет материалы в векторное хранилище
+        
+        Args:
+            materials: Список материалов для добавления
+            
+        Returns:
+            bool: True если добавление прошло успешно, False в противном случае
+        """
+        try:
+            if not materials:
+                logger.warning("Пустой список материалов для добавления")
+                return False
+            
+            prepared = self.embed_materials(materials)
+            if prepared is None:
+                return False
+            
+            vectors, texts, metadata = prepared
+            if not texts:
+                logger.info("Все материалы уже есть в хранилище, векторизация не требуется")
+                return True
             
             # Сохраняем векторы
             return self.store_vectors(vectors, texts, metadata)
@@ -477,6 +789,124 @@ class VectorStore:
             logger.error(f"Ошибка при пересоздании коллекции: {str(e)}")
             return False
 
+    def _scroll_points(
+        self,
+        scroll_filter: Optional[Filter],
+        payload_fields: Optional[List[str]] = None,
+        page_size: int = SCROLL_PAGE_SIZE
+    ) -> Iterator[models.Record]:
+        """
+        Постранично обходит точки коллекции по фильтру, следуя next_page_offset
+        
+        Args:
+            scroll_filter: Фильтр Qdrant (None - вся коллекция)
+            payload_fields: Поля payload, которые нужно получить (None - весь payload)
+            page_size: Количество точек в одной странице
+            
+        Yields:
+            models.Record: Точки коллекции по одной
+        """
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=self.collection_name,
+                scroll_filter=scroll_filter,
+                with_payload=payload_fields if payload_fields is not None else True,
+                with_vectors=False,
+                limit=page_size,
+                offset=offset
+            )
+            yield from points
+            
+            # Qdrant возвращает None, когда страниц больше нет
+            if offset is None:
+                break
+
+    def _iter_materials(
+        self,
+        scroll_filter: Filter,
+        payload_fields: List[str] = MATERIAL_PAYLOAD_FIELDS
+    ) -> Iterator[dict]:
+        """
+        Лениво отдает материалы, найденные по фильтру (по одному на материал, а не на чанк)
+        
+        Args:
+            scroll_filter: Фильтр Qdrant
+            payload_fields: Поля payload, которые попадут в материал
+            
+        Yields:
+            dict: Материал с ID точки и запрошенными полями
+        """
+        for point in self._scroll_points(scroll_filter, payload_fields + CHUNK_PAYLOAD_FIELDS):
+            payload = point.payload or {}
+            # Материал представлен первым чанком, остальные чанки пропускаем
+            if payload.get('material_id') and payload.get('chunk_index'):
+                continue
+            
+            material = {field: payload.get(field, '') for field in payload_fields}
+            if 'text' in material and payload.get('material_text'):
+                material['text'] = payload['material_text']
+            material['id'] = str(point.id)
+            yield material
+
+    def iter_by_category_and_date(
+        self,
+        category: str,
+        start_date: datetime,
+        payload_fields: List[str] = MATERIAL_PAYLOAD_FIELDS
+    ) -> Iterator[dict]:
+        """
+        Потоковый поиск материалов по категории и дате без ограничения на количество
+        
+        Args:
+            category: Категория для поиска
+            start_date: Дата для поиска
+            payload_fields: Поля payload, которые нужно получить
+            
+        Yields:
+            dict: Найденные материалы
+        """
+        filter_conditions = Filter(
+            must=[
+                FieldCondition(
+                    key="category",
+                    match=models.MatchValue(value=category)
+                ),
+                date_range_condition(start_date, start_date)
+            ]
+        )
+        yield from self._iter_materials(filter_conditions, payload_fields)
+
+    def iter_by_category_and_date_range(
+        self,
+        category: str,
+        start_date: datetime,
+        end_date: datetime,
+        payload_fields: List[str] = MATERIAL_PAYLOAD_FIELDS
+    ) -> Iterator[dict]:
+        """
+        Потоковый поиск материалов по категории и диапазону дат без ограничения на количество
+        
+        Args:
+            category: Категория для поиска
+            start_date: Начальная дата диапазона
+            end_date: Конечная дата диапазона
+            payload_fields: Поля payload, которые нужно получить
+            
+        Yields:
+            dict: Найденные материалы
+        """
+        filter_conditions = Filter(
+            must=[
+                FieldCondition(
+                    key="category",
+                    match=models.MatchValue(value=category)
+                ),
+                date_range_condition(start_date, end_date)
+            ]
+        )
+        yield from self._iter_materials(filter_conditions, payload_fields)
+
     def search_by_category_and_date(
         self,
         category: str,
@@ -493,43 +923,8 @@ class VectorStore:
             List[dict]: Список найденных материалов
         """
         try:
-            # Форматируем дату в строку YYYY-MM-DD
             date_str = start_date.strftime('%Y-%m-%d')
-            
-            # Создаем фильтр для поиска
-            filter_conditions = Filter(
-                must=[
-                    FieldCondition(
-                        key="category",
-                        match=models.MatchValue(value=category)
-                    ),
-                    FieldCondition(
-                        key="date",
-                        match=models.MatchValue(value=date_str)
-                    )
-                ]
-            )
-            
-            # Выполняем поиск
-            search_result = self.client.scroll(
-                collection_name=self.collection_name,
-                scroll_filter=filter_conditions,
-                with_payload=True,
-                with_vectors=False,
-                limit=1000000  # Устанавливаем большой лимит, чтобы получить все результаты
-            )
-            
-            # Преобразуем результаты в нужный формат
-            results = []
-            for point in search_result[0]:
-                results.append({
-                    'text': point.payload.get('text', ''),
-                    'url': point.payload.get('url', ''),
-                    'title': point.payload.get('title', ''),
-                    'category': point.payload.get('category', ''),
-                    'date': point.payload.get('date', ''),
-                    'source_type': point.payload.get('source_type', '')
-                })
+            results = list(self.iter_by_category_and_date(category, start_date))
             
             logger.info(f"Найдено {len(results)} материалов для категории {category} за {date_str}")
             return results
@@ -556,47 +951,9 @@ class VectorStore:
             List[dict]: Список найденных материалов
         """
         try:
-            # Форматируем даты в строки YYYY-MM-DD
             start_date_str = start_date.strftime('%Y-%m-%d')
             end_date_str = end_date.strftime('%Y-%m-%d')
-            
-            # Создаем фильтр для поиска
-            filter_conditions = Filter(
-                must=[
-                    FieldCondition(
-                        key="category",
-                        match=models.MatchValue(value=category)
-                    ),
-                    FieldCondition(
-                        key="date",
-                        range={
-                            "gte": start_date_str,
-                            "lte": end_date_str
-                        }
-                    )
-                ]
-            )
-            
-            # Выполняем поиск
-            search_result = self.client.scroll(
-                collection_name=self.collection_name,
-                scroll_filter=filter_conditions,
-                with_payload=True,
-                with_vectors=False,
-                limit=1000000  # Устанавливаем большой лимит, чтобы получить все результаты
-            )
-            
-            # Преобразуем результаты в нужный формат
-            results = []
-            for point in search_result[0]:
-                results.append({
-                    'text': point.payload.get('text', ''),
-                    'url': point.payload.get('url', ''),
-                    'title': point.payload.get('title', ''),
-                    'category': point.payload.get('category', ''),
-                    'date': point.payload.get('date', ''),
-                    'source_type': point.payload.get('source_type', '')
-                })
+            results = list(self.iter_by_category_and_date_range(category, start_date, end_date))
             
             logger.info(f"Найдено {len(results)} материалов для категории {category} за период {start_date_str} - {end_date_str}")
             return results
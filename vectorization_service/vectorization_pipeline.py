@@ -0,0 +1,208 @@
+import os
+import socket
+import uuid
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+from vector_store import VectorStore
+from database import (
+    VECTORIZATION_LEASE_SECONDS,
+    claim_documents_async,
+    claim_unvectorized_batch_async,
+    complete_claimed_documents_async,
+    release_claimed_documents_async,
+    renew_claimed_documents_async
+)
+
+logger = logging.getLogger(__name__)
+
+# Количество документов, читаемых из MongoDB и векторизуемых за один раз
+VECTORIZATION_PAGE_SIZE = int(os.getenv("VECTORIZATION_PAGE_SIZE", "200"))
+# Сколько готовых страниц может ждать следующего этапа (ограничивает память)
+VECTORIZATION_QUEUE_SIZE = int(os.getenv("VECTORIZATION_QUEUE_SIZE", "2"))
+
+# Маркер конца потока страниц в очередях
+_DONE = object()
+
+def make_worker_id() -> str:
+    """Уникальный идентификатор воркера векторизации: хост, процесс и случайный суффикс"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+class VectorizationClaims:
+    """
+    Аренда документов воркером векторизации
+
+    Документы захватываются атомарно, поэтому несколько воркеров могут
+    разбирать один и тот же бэклог без повторной векторизации. Документы,
+    захваченные, но не завершенные (например, после ошибки), можно сразу
+    освободить через release; иначе их заберут после истечения аренды.
+    """
+
+    def __init__(self, worker_id: Optional[str] = None, lease_seconds: float = VECTORIZATION_LEASE_SECONDS):
+        """
+        Args:
+            worker_id: Идентификатор воркера (по умолчанию генерируется)
+            lease_seconds: Срок аренды захваченных документов
+        """
+        self.worker_id = worker_id or make_worker_id()
+        self.lease_seconds = lease_seconds
+        # Захваченные и еще не завершенные документы
+        self.pending = set()
+
+    async def claim_next(self, batch_size: int = VECTORIZATION_PAGE_SIZE) -> List[Dict[str, Any]]:
+        """Захватывает следующую порцию свободных документов"""
+        page = await claim_unvectorized_batch_async(self.worker_id, batch_size, self.lease_seconds)
+        self.pending.update(doc["_id"] for doc in page)
+        return page
+
+    async def claim(self, docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Захватывает указанные документы; возвращает те, что достались этому воркеру"""
+        page = await claim_documents_async([doc["_id"] for doc in docs], self.worker_id, self.lease_seconds)
+        self.pending.update(doc["_id"] for doc in page)
+        return page
+
+    async def pages(self, batch_size: int = VECTORIZATION_PAGE_SIZE) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Захватывает порции, пока есть свободные невекторизованные документы"""
+        while True:
+            page = await self.claim_next(batch_size)
+            if not page:
+                return
+            yield page
+
+    async def renew(self, page: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Продлевает аренду страницы перед векторизацией; возвращает документы, оставшиеся за воркером"""
+        ids = [doc["_id"] for doc in page]
+        renewed = await renew_claimed_documents_async(ids, self.worker_id, self.lease_seconds)
+        if renewed is None:
+            raise RuntimeError("не удалось продлить аренду документов")
+        owned = set(renewed)
+        if len(owned) < len(page):
+            # Аренда истекла, и документы взял другой воркер - он их и векторизует
+            logger.warning(f"⚠️ Аренда {len(page) - len(owned)} из {len(page)} документов потеряна до векторизации")
+            self.pending.difference_update(set(ids) - owned)
+        return [doc for doc in page if doc["_id"] in owned]
+
+    async def commit(self, page: List[Dict[str, Any]]) -> int:
+        """Отмечает документы страницы векторизованными (идемпотентно)"""
+        ids = [doc["_id"] for doc in page]
+        updated = await complete_claimed_documents_async(ids, self.worker_id)
+        if updated < len(ids):
+            # Аренда части документов истекла во время векторизации: их векторизует и отметит другой воркер
+            logger.warning(f"⚠️ Отмечено векторизованными {updated} из {len(ids)} документов страницы")
+        self.pending.difference_update(ids)
+        return updated
+
+    async def release(self) -> int:
+        """Освобождает захваченные, но не завершенные документы"""
+        if not self.pending:
+            return 0
+        released = await release_claimed_documents_async(list(self.pending), self.worker_id)
+        self.pending.clear()
+        return released
+
+async def run_vectorization_pipeline(
+    vector_store: VectorStore,
+    pages: AsyncIterator[List[Dict[str, Any]]],
+    on_page_committed: Optional[Callable[[List[Dict[str, Any]]], Awaitable[Any]]] = None,
+    queue_size: int = VECTORIZATION_QUEUE_SIZE,
+    before_embed: Optional[Callable[[List[Dict[str, Any]]], Awaitable[List[Dict[str, Any]]]]] = None
+) -> Dict[str, Any]:
+    """
+    Потоковая векторизация: чтение, эмбеддинги и запись в Qdrant идут параллельно
+
+    Пока следующая страница читается из MongoDB, предыдущая векторизуется, а
+    еще более ранняя записывается в Qdrant. Очереди между этапами ограничены,
+    поэтому в памяти находится не больше нескольких страниц. Страница
+    отмечается векторизованной (on_page_committed) только после записи в
+    Qdrant; при ошибке конвейер останавливается.
+
+    Args:
+        vector_store: Векторное хранилище
+        pages: Асинхронный поток страниц документов
+        on_page_committed: Корутина, вызываемая после записи страницы в Qdrant
+        queue_size: Размер очередей между этапами
+        before_embed: Корутина, вызываемая перед векторизацией страницы (продление
+            аренды); возвращает документы страницы, которые нужно векторизовать
+
+    Returns:
+        Dict[str, Any]: success, количество векторизованных документов и страниц
+    """
+    embed_queue = asyncio.Queue(maxsize=queue_size)
+    store_queue = asyncio.Queue(maxsize=queue_size)
+    stats = {"success": True, "vectorized_count": 0, "pages": 0}
+    failed = asyncio.Event()
+
+    async def read_pages():
+        async for page in pages:
+            await embed_queue.put(page)
+
+    async def fetch():
+        # Поток страниц может быть бесконечным (change stream), поэтому после
+        # ошибки следующего этапа чтение прерывается, а не дочитывается
+        reader = asyncio.create_task(read_pages())
+        stopper = asyncio.create_task(failed.wait())
+        try:
+            await asyncio.wait({reader, stopper}, return_when=asyncio.FIRST_COMPLETED)
+            if not reader.done():
+                reader.cancel()
+                await asyncio.gather(reader, return_exceptions=True)
+            elif reader.exception() is not None:
+                logger.error(f"❌ Ошибка при чтении данных для векторизации: {reader.exception()}")
+                failed.set()
+        finally:
+            stopper.cancel()
+            if hasattr(pages, "aclose"):
+                await pages.aclose()
+            await embed_queue.put(_DONE)
+
+    async def embed():
+        # После ошибки очередь дочитывается до конца, чтобы не блокировать чтение
+        while True:
+            page = await embed_queue.get()
+            if page is _DONE:
+                break
+            if failed.is_set():
+                continue
+            if before_embed is not None:
+                try:
+                    page = await before_embed(page)
+                except Exception as e:
+                    logger.error(f"❌ Ошибка при подготовке страницы к векторизации: {e}")
+                    failed.set()
+                    continue
+                if not page:
+                    continue
+            prepared = await asyncio.to_thread(vector_store.embed_materials, page)
+            if prepared is None:
+                logger.error(f"❌ Ошибка при векторизации страницы из {len(page)} записей")
+                failed.set()
+                continue
+            await store_queue.put((page, prepared))
+        await store_queue.put(_DONE)
+
+    async def store():
+        while True:
+            item = await store_queue.get()
+            if item is _DONE:
+                break
+            if failed.is_set():
+                continue
+            page, (vectors, texts, metadata) = item
+            try:
+                if texts and not await asyncio.to_thread(vector_store.store_vectors, vectors, texts, metadata):
+                    logger.error(f"❌ Ошибка при записи страницы из {len(page)} записей в Qdrant")
+                    failed.set()
+                    continue
+                if on_page_committed is not None:
+                    await on_page_committed(page)
+            except Exception as e:
+                logger.error(f"❌ Ошибка при сохранении страницы из {len(page)} записей: {e}")
+                failed.set()
+                continue
+            stats["vectorized_count"] += len(page)
+            stats["pages"] += 1
+            logger.info(f"✅ Страница {stats['pages']} векторизована ({len(page)} записей, всего {stats['vectorized_count']})")
+
+    await asyncio.gather(fetch(), embed(), store())
+    stats["success"] = not failed.is_set()
+    return stats
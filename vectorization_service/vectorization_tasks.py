@@ -2,7 +2,8 @@ import os
 import logging
 from celery import Celery
 from vector_store import VectorStore
-from database import get_unvectorized_data_async, update_vectorization_status_async
+from database import ensure_indexes_async, get_unvectorized_data_count_async
+from vectorization_pipeline import run_vectorization_pipeline, VectorizationClaims, VECTORIZATION_PAGE_SIZE
 from telegram_notifications import send_admin_notification
 
 # Настройка логирования
@@ -44,16 +45,46 @@ def run_async(coro):
         # Если нет активного loop, создаем новый
         return asyncio.run(coro)
 
+async def vectorize_unvectorized_data(vector_store: VectorStore) -> dict:
+    """
+    Потоковая векторизация свободных невекторизованных данных
+    
+    Документы захватываются порциями с арендой, поэтому несколько воркеров
+    могут работать одновременно и не векторизуют одни и те же документы.
+    
+    Args:
+        vector_store: Векторное хранилище
+        
+    Returns:
+        dict: Результат конвейера (success, vectorized_count, pages)
+    """
+    await ensure_indexes_async()
+    claims = VectorizationClaims()
+    logger.info(f"🔒 Воркер векторизации {claims.worker_id}")
+    
+    try:
+        return await run_vectorization_pipeline(
+            vector_store,
+            claims.pages(VECTORIZATION_PAGE_SIZE),
+            on_page_committed=claims.commit,
+            before_embed=claims.renew
+        )
+    finally:
+        # После ошибки незавершенные документы сразу доступны другим воркерам
+        released = await claims.release()
+        if released:
+            logger.info(f"🔓 Освобождено {released} незавершенных документов")
+
 @celery_app.task(bind=True, name="vectorization_service.start_vectorization_task")
 def start_vectorization_task(self, chat_id=None, force=False):
     """Задача векторизации невекторизованных данных"""
     try:
         logger.info("🚀 Начинаем процесс векторизации")
         
-        # Получаем невекторизованные данные асинхронно
-        unvectorized_data = run_async(get_unvectorized_data_async())
+        # Считаем записи вместо загрузки их в память: данные читаются постранично
+        total_unvectorized = run_async(get_unvectorized_data_count_async())
         
-        if not unvectorized_data and not force:
+        if not total_unvectorized and not force:
             message = "⚠️ Нет невекторизованных данных для обработки"
             logger.warning(message)
             send_admin_notification(message, chat_id)
@@ -64,53 +95,16 @@ def start_vectorization_task(self, chat_id=None, force=False):
                 "total_unvectorized": 0
             }
         
-        logger.info(f"📊 Найдено {len(unvectorized_data)} записей для векторизации")
+        logger.info(f"📊 Найдено {total_unvectorized} записей для векторизации")
         
         # Инициализируем векторное хранилище
         vector_store = VectorStore()
         
-        # Проверяем размер данных и разбиваем на чанки если нужно
-        total_records = len(unvectorized_data)
-        max_records_per_batch = 50  # Максимальное количество записей за один запрос к OpenAI
-        
-        if total_records > max_records_per_batch:
-            logger.info(f"📦 Разбиваем {total_records} записей на чанки по {max_records_per_batch}")
-            chunks = [unvectorized_data[i:i + max_records_per_batch] 
-                     for i in range(0, total_records, max_records_per_batch)]
-        else:
-            chunks = [unvectorized_data]
-        
-        total_vectorized = 0
-        success = True
-        
-        # Обрабатываем каждый чанк
-        for i, chunk in enumerate(chunks):
-            logger.info(f"🔄 Обрабатываем чанк {i+1}/{len(chunks)} ({len(chunk)} записей)")
-            
-            try:
-                # Векторизуем чанк
-                chunk_success = vector_store.add_materials(chunk)
-                
-                if chunk_success:
-                    # Обновляем статус векторизации в БД для этого чанка
-                    from bson import ObjectId
-                    ids_to_update = [ObjectId(x["_id"]) for x in chunk]
-                    run_async(update_vectorization_status_async(ids_to_update))
-                    
-                    total_vectorized += len(chunk)
-                    logger.info(f"✅ Чанк {i+1} успешно векторизован ({len(chunk)} записей)")
-                else:
-                    logger.error(f"❌ Ошибка при векторизации чанка {i+1}")
-                    success = False
-                    break
-                    
-            except Exception as e:
-                logger.error(f"❌ Ошибка при обработке чанка {i+1}: {e}")
-                success = False
-                break
+        result = run_async(vectorize_unvectorized_data(vector_store))
+        total_vectorized = result["vectorized_count"]
         
-        if success and total_vectorized > 0:
-            message = f"✅ Векторизация завершена успешно!\n\n• Векторизовано записей: {total_vectorized}\n• Обработано чанков: {len(chunks)}"
+        if result["success"] and total_vectorized > 0:
+            message = f"✅ Векторизация завершена успешно!\n\n• Векторизовано записей: {total_vectorized}\n• Обработано страниц: {result['pages']}"
             logger.info(f"✅ Векторизовано {total_vectorized} записей")
             send_admin_notification(message, chat_id)
             
@@ -118,18 +112,20 @@ def start_vectorization_task(self, chat_id=None, force=False):
                 "status": "completed",
                 "message": message,
                 "vectorized_count": total_vectorized,
-                "total_unvectorized": len(unvectorized_data)
+                "total_unvectorized": total_unvectorized
             }
-        elif not success:
+        elif not result["success"]:
             error_message = "❌ Ошибка при векторизации данных"
+            if total_vectorized:
+                error_message += f"\n\n• Векторизовано до ошибки: {total_vectorized}"
             logger.error(error_message)
             send_admin_notification(error_message, chat_id)
             
             return {
                 "status": "error",
                 "message": error_message,
-                "vectorized_count": 0,
-                "total_unvectorized": len(unvectorized_data)
+                "vectorized_count": total_vectorized,
+                "total_unvectorized": total_unvectorized
             }
         else:
             message = "⚠️ Нет данных для векторизации"